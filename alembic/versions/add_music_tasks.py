@@ -0,0 +1,40 @@
+"""add_music_tasks
+
+Revision ID: add_music_tasks
+Revises: add_songtexts
+Create Date: 2025-07-08 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_music_tasks'
+down_revision = 'add_songtexts'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Suno muziektaken, bijgewerkt via /suno-callback
+    op.create_table(
+        'music_tasks',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('task_id', sa.String(), nullable=False, unique=True),
+        sa.Column('order_id', sa.Integer(), sa.ForeignKey('orders.order_id', ondelete='SET NULL'), nullable=True),
+        sa.Column('status', sa.String(), nullable=False, server_default='PENDING'),
+        sa.Column('tracks', postgresql.JSONB(), nullable=True),
+        sa.Column('status_history', postgresql.JSONB(), nullable=False, server_default=sa.text("'[]'::jsonb")),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('completed_at', sa.DateTime(), nullable=True)
+    )
+    op.create_index('idx_music_tasks_order_created', 'music_tasks', ['order_id', sa.text('created_at DESC')])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_music_tasks_order_created', table_name='music_tasks')
+    op.drop_table('music_tasks')
@@ -0,0 +1,29 @@
+"""add_order_derived_fields
+
+Revision ID: add_order_derived_fields
+Revises: add_orders_keyset_index
+Create Date: 2025-07-04 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_derived_fields'
+down_revision = 'add_orders_keyset_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Gematerialiseerde afgeleide weergavevelden (berekend bij het schrijven van een order)
+    op.add_column('orders', sa.Column('derived', JSONB(), nullable=True))
+    # Versie van de afleidingslogica; NULL of verouderd betekent: opnieuw afleiden
+    op.add_column('orders', sa.Column('derived_version', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('orders', 'derived_version')
+    op.drop_column('orders', 'derived')
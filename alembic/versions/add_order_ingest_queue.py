@@ -0,0 +1,43 @@
+"""add_order_ingest_queue
+
+Revision ID: add_order_ingest_queue
+Revises: add_sync_state
+Create Date: 2025-07-02 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_ingest_queue'
+down_revision = 'add_sync_state'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Durable queue voor orders die via de webhook binnenkomen
+    op.create_table(
+        'order_ingest_queue',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('order_id', sa.Integer(), nullable=False, unique=True),
+        sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+        sa.Column('source', sa.String(), nullable=True),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('available_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('processed_at', sa.DateTime(), nullable=True)
+    )
+    
+    # Index voor het oppakken van openstaande jobs
+    op.create_index('idx_order_ingest_queue_status_available', 'order_ingest_queue', ['status', 'available_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_order_ingest_queue_status_available', table_name='order_ingest_queue')
+    op.drop_table('order_ingest_queue')
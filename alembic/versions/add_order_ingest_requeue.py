@@ -0,0 +1,28 @@
+"""add_order_ingest_requeue
+
+Revision ID: add_order_ingest_requeue
+Revises: add_prompt_cache
+Create Date: 2025-07-10 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_ingest_requeue'
+down_revision = 'add_prompt_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Markering voor een webhook die binnenkwam terwijl de job verwerkt werd
+    op.add_column(
+        'order_ingest_queue',
+        sa.Column('requeue', sa.Boolean(), nullable=False, server_default=sa.false())
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('order_ingest_queue', 'requeue')
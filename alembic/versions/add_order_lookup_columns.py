@@ -0,0 +1,61 @@
+"""add_order_lookup_columns
+
+Revision ID: add_order_lookup_columns
+Revises: add_order_derived_fields
+Create Date: 2025-07-05 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_lookup_columns'
+down_revision = 'add_order_derived_fields'
+branch_labels = None
+depends_on = None
+
+# Vult de zoekkolommen voor bestaande orders (zelfde regels als app/services/order_extraction.py)
+BACKFILL_SQL = """
+    UPDATE orders SET
+        klant_email_norm = NULLIF(lower(btrim(klant_email)), 'onbekend@example.com'),
+        is_upsell = COALESCE((
+            SELECT bool_or(p->'pivot'->>'type' = 'upsell')
+            FROM jsonb_array_elements(
+                CASE WHEN jsonb_typeof(raw_data->'products') = 'array' THEN raw_data->'products' ELSE '[]'::jsonb END
+            ) AS p
+        ), false),
+        primary_product_id = (
+            SELECT (p->>'id')::integer
+            FROM jsonb_array_elements(
+                CASE WHEN jsonb_typeof(raw_data->'products') = 'array' THEN raw_data->'products' ELSE '[]'::jsonb END
+            ) WITH ORDINALITY AS t(p, n)
+            WHERE p->>'id' ~ '^[0-9]+$'
+            AND COALESCE(p->'pivot'->>'type', '') <> 'upsell'
+            ORDER BY (p->>'id' IN ('274588', '289456')) DESC, n
+            LIMIT 1
+        )
+"""
+
+
+def upgrade() -> None:
+    # Genormaliseerde kolommen voor het zoeken van UpSell-originelen
+    op.add_column('orders', sa.Column('klant_email_norm', sa.String(), nullable=True))
+    op.add_column('orders', sa.Column('primary_product_id', sa.Integer(), nullable=True))
+    op.add_column('orders', sa.Column('is_upsell', sa.Boolean(), nullable=False, server_default=sa.false()))
+    
+    op.execute(BACKFILL_SQL)
+    
+    op.create_index('idx_orders_klant_email_norm_bestel_datum', 'orders', ['klant_email_norm', 'bestel_datum'])
+    op.create_index(
+        'idx_orders_upsell_bestel_datum', 'orders', ['bestel_datum'],
+        postgresql_where=sa.text('is_upsell')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_orders_upsell_bestel_datum', table_name='orders')
+    op.drop_index('idx_orders_klant_email_norm_bestel_datum', table_name='orders')
+    op.drop_column('orders', 'is_upsell')
+    op.drop_column('orders', 'primary_product_id')
+    op.drop_column('orders', 'klant_email_norm')
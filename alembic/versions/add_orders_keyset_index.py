@@ -0,0 +1,29 @@
+"""add_orders_keyset_index
+
+Revision ID: add_orders_keyset_index
+Revises: add_order_ingest_queue
+Create Date: 2025-07-03 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_orders_keyset_index'
+down_revision = 'add_order_ingest_queue'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Index voor keyset-paginatie van de orderlijst (nieuwste eerst, id als tie-breaker)
+    op.create_index(
+        'idx_orders_bestel_datum_id',
+        'orders',
+        [sa.text('bestel_datum DESC NULLS LAST'), sa.text('id DESC')]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_orders_bestel_datum_id', table_name='orders')
@@ -0,0 +1,36 @@
+"""add_prompt_cache
+
+Revision ID: add_prompt_cache
+Revises: add_music_tasks
+Create Date: 2025-07-09 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_prompt_cache'
+down_revision = 'add_music_tasks'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Persistente laag van de prompt-resultaat cache (FEATURE_PROMPT_CACHING + PROMPT_CACHE_DB)
+    op.create_table(
+        'prompt_cache',
+        sa.Column('key', sa.String(64), primary_key=True),
+        sa.Column('provider', sa.String(), nullable=False),
+        sa.Column('model', sa.String(), nullable=True),
+        sa.Column('result', postgresql.JSONB(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('expires_at', sa.DateTime(), nullable=False)
+    )
+    op.create_index('idx_prompt_cache_expires_at', 'prompt_cache', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_prompt_cache_expires_at', table_name='prompt_cache')
+    op.drop_table('prompt_cache')
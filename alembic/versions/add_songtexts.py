@@ -0,0 +1,44 @@
+"""add_songtexts
+
+Revision ID: add_songtexts
+Revises: add_upsell_link_candidates
+Create Date: 2025-07-07 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_songtexts'
+down_revision = 'add_upsell_link_candidates'
+branch_labels = None
+depends_on = None
+
+# Bestaande songteksten uit raw_data worden versie 1
+BACKFILL_SQL = """
+    INSERT INTO songtexts (order_id, version, songtekst, author, created_at)
+    SELECT order_id, 1, raw_data->>'songtekst', 'migratie', now()
+    FROM orders
+    WHERE btrim(COALESCE(raw_data->>'songtekst', '')) <> ''
+"""
+
+
+def upgrade() -> None:
+    # Songteksten met versiegeschiedenis, los van raw_data
+    op.create_table(
+        'songtexts',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('order_id', sa.Integer(), sa.ForeignKey('orders.order_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('songtekst', sa.Text(), nullable=False),
+        sa.Column('author', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.UniqueConstraint('order_id', 'version', name='uix_songtexts_order_version')
+    )
+    
+    op.execute(BACKFILL_SQL)
+
+
+def downgrade() -> None:
+    op.drop_table('songtexts')
@@ -0,0 +1,31 @@
+"""add_sync_state_table
+
+Revision ID: add_sync_state
+Revises: add_prof_prompts
+Create Date: 2025-07-01 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_sync_state'
+down_revision = 'add_prof_prompts'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Key/value tabel voor cursors van incrementele sync-jobs
+    op.create_table(
+        'sync_state',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('value', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now())
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sync_state')
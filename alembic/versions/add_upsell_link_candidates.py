@@ -0,0 +1,50 @@
+"""add_upsell_link_candidates
+
+Revision ID: add_upsell_link_candidates
+Revises: add_order_lookup_columns
+Create Date: 2025-07-06 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_upsell_link_candidates'
+down_revision = 'add_order_lookup_columns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Vooraf berekende UpSell-koppelingskandidaten met hun confidence
+    op.create_table(
+        'upsell_link_candidates',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('upsell_order_id', sa.Integer(), sa.ForeignKey('orders.order_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('candidate_order_id', sa.Integer(), sa.ForeignKey('orders.order_id', ondelete='CASCADE'), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('components', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.UniqueConstraint('upsell_order_id', 'candidate_order_id', name='uix_upsell_link_candidate')
+    )
+    
+    # Matches van één UpSell, en reviewen van matches over alle UpSells op score
+    op.create_index(
+        'idx_upsell_link_candidates_upsell_score', 'upsell_link_candidates',
+        ['upsell_order_id', sa.text('score DESC')]
+    )
+    op.create_index(
+        'idx_upsell_link_candidates_score_id', 'upsell_link_candidates',
+        [sa.text('score DESC'), sa.text('id DESC')]
+    )
+    # Invalidatie als een kandidaat-order wijzigt
+    op.create_index('idx_upsell_link_candidates_candidate', 'upsell_link_candidates', ['candidate_order_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_upsell_link_candidates_candidate', table_name='upsell_link_candidates')
+    op.drop_index('idx_upsell_link_candidates_score_id', table_name='upsell_link_candidates')
+    op.drop_index('idx_upsell_link_candidates_upsell_score', table_name='upsell_link_candidates')
+    op.drop_table('upsell_link_candidates')
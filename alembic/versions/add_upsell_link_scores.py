@@ -0,0 +1,30 @@
+"""add_upsell_link_scores
+
+Revision ID: add_upsell_link_scores
+Revises: add_order_ingest_requeue
+Create Date: 2025-07-10 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_upsell_link_scores'
+down_revision = 'add_order_ingest_requeue'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Markering dat de linker een UpSell heeft gescoord, ook zonder kandidaten
+    op.create_table(
+        'upsell_link_scores',
+        sa.Column('upsell_order_id', sa.Integer(), sa.ForeignKey('orders.order_id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('candidate_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('scored_at', sa.DateTime(), nullable=False, server_default=sa.func.now())
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('upsell_link_scores')
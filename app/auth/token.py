@@ -6,8 +6,11 @@ Momenteel wordt een eenvoudige API-key authenticatie gebruikt, maar de structuur
 is voorbereid voor toekomstige uitbreiding naar JWT of OAuth2.
 """
 
+import hashlib
+import hmac
 import os
-from fastapi import Depends, HTTPException, Security, status
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, Security, status
 from fastapi.security import APIKeyHeader
 from dotenv import load_dotenv
 
@@ -21,6 +24,12 @@ api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 # In productie: gebruik altijd environment variables en nooit hardcoded tokens
 API_KEY = os.getenv("API_KEY", "jouwsong2025")
 
+# Geheim token in de callBackUrl die we aan Suno meegeven; zonder eigen waarde wordt
+# het afgeleid van API_KEY, zodat de API key zelf nooit in een URL bij Suno terechtkomt
+SUNO_CALLBACK_TOKEN = os.getenv("SUNO_CALLBACK_TOKEN") or hmac.new(
+    API_KEY.encode(), b"suno-callback", hashlib.sha256
+).hexdigest()
+
 async def get_api_key(api_key: str = Security(api_key_header)):
     """
     Valideert de API key die is meegestuurd in de request header.
@@ -50,6 +59,24 @@ async def get_api_key(api_key: str = Security(api_key_header)):
     
     return api_key
 
+async def verify_suno_callback_token(token: Optional[str] = Query(None, description="Callback token uit de callBackUrl")):
+    """
+    Valideert het token in de query string van /suno-callback.
+    
+    Suno kan geen headers meesturen; het token zit daarom in de callBackUrl die
+    SunoClient bij het indienen van een taak opbouwt.
+    
+    Raises:
+        HTTPException: Als het token ontbreekt of ongeldig is
+    """
+    if not token or not hmac.compare_digest(token, SUNO_CALLBACK_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Ongeldige callback token",
+        )
+    
+    return token
+
 # Alternatieve implementatie met Bearer token
 # Kan gebruikt worden als alternatief voor de API key
 bearer_scheme = APIKeyHeader(name="Authorization", auto_error=False)
@@ -4,19 +4,195 @@ CRUD operations voor Order model.
 Deze module bevat database operaties voor het Order model.
 """
 
-from sqlalchemy.orm import Session
+import logging
+import os
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import String, case, func, literal, literal_column
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, undefer
 from app.models.order import Order
+from app.models.upsell_link_candidate import UpsellLinkCandidate
+from app.services.order_derivation import apply_derived
+from app.services.upsell_linking import invalidate_candidates_for_new_orders
+
+logger = logging.getLogger(__name__)
+
+# Aantal orders per INSERT ... ON CONFLICT statement
+ORDER_UPSERT_BATCH_SIZE = int(os.getenv("ORDER_UPSERT_BATCH_SIZE", "200"))
 
+# Sleutels in raw_data die door de applicatie zelf worden beheerd en bij een
+# nieuwe sync van Plug&Pay niet overschreven mogen worden
+PRESERVED_RAW_DATA_KEYS = ("songtekst",)
 
-def get_order(db: Session, order_id: int):
+
+def get_order(db: Session, order_id: int, with_songtext: bool = False):
     """
     Haalt een specifieke bestelling op uit de database op basis van het Plug&Pay order_id.
     
     Args:
         db (Session): SQLAlchemy database sessie
         order_id (int): Plug&Pay order_id van de bestelling
+        with_songtext (bool): De huidige songtekst direct meeladen (voor OrderRead)
         
     Returns:
         Order: De opgevraagde bestelling of None als deze niet bestaat
     """
-    return db.query(Order).filter(Order.order_id == order_id).first()
+    query = db.query(Order)
+    if with_songtext:
+        query = query.options(undefer(Order.songtekst))
+    return query.filter(Order.order_id == order_id).first()
+
+
+def _order_row(order: Order) -> Dict[str, Any]:
+    """Zet een transient Order object om naar een dict met kolomwaarden voor een Core INSERT."""
+    return {
+        column.name: getattr(order, column.key)
+        for column in Order.__table__.columns
+        if column.name != "id"
+    }
+
+
+def _upsert_batch(db: Session, payloads: List[Dict[str, Any]]) -> Dict[int, str]:
+    """
+    Voert één INSERT ... ON CONFLICT (order_id) DO UPDATE uit voor een batch orders.
+    
+    Bij een conflict worden alleen raw_data (met behoud van PRESERVED_RAW_DATA_KEYS) en
+    de daaruit afgeleide zoekkolommen primary_product_id en is_upsell bijgewerkt (net als
+    het oude per-order pad), en alleen als de payload daadwerkelijk gewijzigd is. Orders
+    die niet in de RETURNING-clause terugkomen zijn dus ongewijzigd.
+    Bijgewerkte orders worden als verouderd gemarkeerd (derived_version = NULL) en
+    daarna in dezelfde transactie opnieuw afgeleid. Opgeslagen UpSell kandidaten die door
+    nieuwe of gewijzigde orders kunnen veranderen, worden verwijderd.
+    """
+    # Dubbele order IDs binnen één statement zijn niet toegestaan bij ON CONFLICT; laatste wint
+    by_id: Dict[int, Dict[str, Any]] = {}
+    for payload in payloads:
+        by_id[int(payload["id"])] = payload
+    
+    # Eén query om te bepalen welke orders al bestaan; voor die orders zijn de dure
+    # lookups (thema_id, upsell-koppeling) niet nodig omdat alleen raw_data wordt bijgewerkt
+    existing_ids = {
+        row[0] for row in db.query(Order.order_id).filter(Order.order_id.in_(list(by_id))).all()
+    }
+    
+    thema_id_cache: Dict[str, Any] = {}
+    rows = []
+    statuses: Dict[int, str] = {}
+    for order_id, payload in by_id.items():
+        try:
+            order = Order.build_from_plugpay_data(
+                db, payload,
+                resolve_relations=order_id not in existing_ids,
+                thema_id_cache=thema_id_cache
+            )
+        except Exception as e:
+            logger.error(f"Fout bij voorbereiden van bestelling {order_id}: {str(e)}")
+            statuses[order_id] = "error"
+            continue
+        # Core INSERT slaat de mapper events over; leid de weergavevelden hier af
+        apply_derived(order)
+        rows.append(_order_row(order))
+    
+    if not rows:
+        return statuses
+    
+    table = Order.__table__
+    stmt = pg_insert(table).values(rows)
+    
+    # Nieuwe raw_data met behoud van door de applicatie beheerde sleutels
+    merged_raw_data = stmt.excluded.raw_data
+    stripped_existing = table.c.raw_data
+    stripped_new = stmt.excluded.raw_data
+    for key in PRESERVED_RAW_DATA_KEYS:
+        merged_raw_data = case(
+            (table.c.raw_data.has_key(key),
+             merged_raw_data.op("||", return_type=JSONB)(func.jsonb_build_object(key, table.c.raw_data[key]))),
+            else_=merged_raw_data
+        )
+        stripped_existing = stripped_existing.op("-", return_type=JSONB)(literal(key, String))
+        stripped_new = stripped_new.op("-", return_type=JSONB)(literal(key, String))
+    
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.order_id],
+        set_={
+            "raw_data": merged_raw_data,
+            "primary_product_id": stmt.excluded.primary_product_id,
+            "is_upsell": stmt.excluded.is_upsell,
+            "derived_version": None
+        },
+        where=stripped_existing.is_distinct_from(stripped_new)
+    ).returning(table.c.order_id, literal_column("(xmax = 0)").label("inserted"))
+    
+    result = db.execute(stmt).fetchall()
+    
+    returned = {row.order_id: ("created" if row.inserted else "updated") for row in result}
+    
+    # Afgeleide velden van bijgewerkte orders opnieuw berekenen op basis van de nieuwe raw_data
+    updated_ids = [order_id for order_id, status in returned.items() if status == "updated"]
+    if updated_ids:
+        for order in (
+            db.query(Order).filter(Order.order_id.in_(updated_ids)).populate_existing().all()
+        ):
+            apply_derived(order)
+    
+    # Nieuwe en gewijzigde orders maken opgeslagen UpSell kandidaten mogelijk onjuist
+    if returned:
+        connection = db.connection()
+        UpsellLinkCandidate.invalidate(connection, updated_ids)
+        invalidate_candidates_for_new_orders(connection, list(returned))
+    for row in rows:
+        statuses[row["order_id"]] = returned.get(row["order_id"], "skipped")
+    return statuses
+
+
+def bulk_upsert_orders(
+    db: Session, payloads: Iterable[Dict[str, Any]], batch_size: int = None
+) -> Dict[int, str]:
+    """
+    Slaat een lijst genormaliseerde (JSON-safe) Plug&Pay order payloads in batches op.
+    
+    Per batch wordt één INSERT ... ON CONFLICT (order_id) DO UPDATE uitgevoerd en één
+    keer gecommit, in plaats van een query en commit per order. Een mislukte batch wordt
+    teruggedraaid en de orders daarin krijgen status "error"; volgende batches gaan door.
+    
+    Args:
+        db (Session): SQLAlchemy database sessie
+        payloads: De order payloads (met minimaal een "id")
+        batch_size (int): Aantal orders per statement (default: ORDER_UPSERT_BATCH_SIZE)
+        
+    Returns:
+        dict: order_id -> "created", "updated", "skipped" (ongewijzigd) of "error"
+    """
+    batch_size = batch_size or ORDER_UPSERT_BATCH_SIZE
+    statuses: Dict[int, str] = {}
+    
+    batch: List[Dict[str, Any]] = []
+    for payload in payloads:
+        if not payload.get("id"):
+            logger.warning("Bestelling zonder ID overgeslagen bij bulk upsert")
+            continue
+        batch.append(payload)
+        if len(batch) >= batch_size:
+            statuses.update(_flush_batch(db, batch))
+            batch = []
+    if batch:
+        statuses.update(_flush_batch(db, batch))
+    
+    return statuses
+
+
+def _flush_batch(db: Session, batch: List[Dict[str, Any]]) -> Dict[int, str]:
+    """Upsert en commit één batch; bij een fout wordt de batch teruggedraaid."""
+    try:
+        statuses = _upsert_batch(db, batch)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Fout bij bulk upsert van {len(batch)} bestellingen: {str(e)}")
+        return {int(payload["id"]): "error" for payload in batch}
+    
+    counts = {status: list(statuses.values()).count(status) for status in set(statuses.values())}
+    logger.info(f"Bulk upsert van {len(batch)} bestellingen: {counts}")
+    return statuses
@@ -8,6 +8,7 @@ from sqlalchemy import func, and_, desc
 from datetime import datetime, timedelta
 
 from app.models.thema import Thema, ThemaElement, ThemaRhymeSet
+from app.services.thema_service import invalidate_thema_bundles, invalidate_thema_index
 from app.schemas.thema import (
     ThemaCreate, ThemaUpdate, ThemaElementCreate, ThemaElementUpdate,
     ThemaRhymeSetCreate, ThemaRhymeSetUpdate, ThemaStats
@@ -76,6 +77,7 @@ class ThemaCRUD:
         db_thema = Thema(**thema.dict())
         self.db.add(db_thema)
         self.db.commit()
+        invalidate_thema_index()
         self.db.refresh(db_thema)
         return db_thema
     
@@ -98,6 +100,8 @@ class ThemaCRUD:
         
         db_thema.updated_at = func.now()
         self.db.commit()
+        invalidate_thema_index()
+        invalidate_thema_bundles(thema_id)
         self.db.refresh(db_thema)
         return db_thema
     
@@ -109,6 +113,8 @@ class ThemaCRUD:
         
         self.db.delete(db_thema)
         self.db.commit()
+        invalidate_thema_index()
+        invalidate_thema_bundles(thema_id)
         return True
     
     # Element CRUD
@@ -134,6 +140,7 @@ class ThemaCRUD:
         db_element = ThemaElement(**element.dict())
         self.db.add(db_element)
         self.db.commit()
+        invalidate_thema_bundles(element.thema_id)
         self.db.refresh(db_element)
         return db_element
     
@@ -142,13 +149,16 @@ class ThemaCRUD:
         db_element = self.get_element(element_id)
         if not db_element:
             return None
+        old_thema_id = db_element.thema_id
         
         update_data = element_update.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_element, field, value)
         
         self.db.commit()
+        invalidate_thema_bundles(old_thema_id)
         self.db.refresh(db_element)
+        invalidate_thema_bundles(db_element.thema_id)
         return db_element
     
     def delete_element(self, element_id: int) -> bool:
@@ -156,9 +166,11 @@ class ThemaCRUD:
         db_element = self.get_element(element_id)
         if not db_element:
             return False
+        thema_id = db_element.thema_id
         
         self.db.delete(db_element)
         self.db.commit()
+        invalidate_thema_bundles(thema_id)
         return True
     
     # Rhyme Set CRUD
@@ -179,6 +191,7 @@ class ThemaCRUD:
         db_rhyme_set = ThemaRhymeSet(**rhyme_set.dict())
         self.db.add(db_rhyme_set)
         self.db.commit()
+        invalidate_thema_bundles(rhyme_set.thema_id)
         self.db.refresh(db_rhyme_set)
         return db_rhyme_set
     
@@ -193,6 +206,7 @@ class ThemaCRUD:
             setattr(db_rhyme_set, field, value)
         
         self.db.commit()
+        invalidate_thema_bundles(db_rhyme_set.thema_id)
         self.db.refresh(db_rhyme_set)
         return db_rhyme_set
     
@@ -202,8 +216,10 @@ class ThemaCRUD:
         if not db_rhyme_set:
             return False
         
+        thema_id = db_rhyme_set.thema_id
         self.db.delete(db_rhyme_set)
         self.db.commit()
+        invalidate_thema_bundles(thema_id)
         return True
     
     # Statistics
@@ -234,6 +250,8 @@ class ThemaCRUD:
             synchronize_session=False
         )
         self.db.commit()
+        invalidate_thema_index()
+        invalidate_thema_bundles()
         return updated
     
     def search_themas(self, search_term: str, skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
@@ -1,4 +1,10 @@
 from .order import Order
 from .thema import Thema, ThemaElement, ThemaRhymeSet
+from .sync_state import SyncState
+from .order_ingest import OrderIngestJob
+from .upsell_link_candidate import UpsellLinkCandidate, UpsellLinkScore
+from .songtext import Songtext
+from .music_task import MusicTask
+from .prompt_cache import PromptCacheEntry
 
-__all__ = ["Order", "Thema", "ThemaElement", "ThemaRhymeSet"]
+__all__ = ["Order", "Thema", "ThemaElement", "ThemaRhymeSet", "SyncState", "OrderIngestJob", "UpsellLinkCandidate", "UpsellLinkScore", "Songtext", "MusicTask", "PromptCacheEntry"]
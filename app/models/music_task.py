@@ -0,0 +1,40 @@
+"""
+SQLAlchemy model voor Suno muziekgeneratie-taken.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.session import Base
+
+
+class MusicTask(Base):
+    """
+    Een bij Suno ingediende muziekgeneratie-taak en de laatst bekende status.
+
+    De rij wordt aangemaakt bij het indienen en bijgewerkt door /suno-callback (of,
+    als de callbacks uitblijven, door een poll bij Suno; zie app/services/music_tasks.py).
+    Status-requests lezen alleen deze rij.
+    """
+    __tablename__ = "music_tasks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String, unique=True, nullable=False)  # Suno taskId
+    order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="SET NULL"), nullable=True)
+    status = Column(String, nullable=False, default="PENDING")  # Suno status, bijv. FIRST_SUCCESS of SUCCESS
+    tracks = Column(JSONB, nullable=True)  # Per track: id, title, audio_url, stream_url, image_url, duration, ...
+    status_history = Column(JSONB, nullable=False, default=list)  # [{"status", "source", "at"}, ...]
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Muziektaken van een order, nieuwste eerst
+        Index("idx_music_tasks_order_created", "order_id", created_at.desc()),
+    )
+
+    def __repr__(self):
+        return f"<MusicTask(task_id='{self.task_id}', order_id={self.order_id}, status='{self.status}')>"
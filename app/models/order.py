@@ -4,12 +4,15 @@ SQLAlchemy model voor Plug&Pay bestellingen.
 
 import logging
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint, Text, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, UniqueConstraint, Text, ForeignKey, Index, event, false, inspect, select
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 
 from app.db.session import Base
+from app.models.songtext import Songtext
+from app.services.order_derivation import DERIVATION_INPUTS, DERIVER_VERSION, apply_derived
+from app.services.order_extraction import extract_order_fields, is_upsell_order, normalize_email, primary_product_id
 
 # Configureer logging
 logger = logging.getLogger(__name__)
@@ -43,18 +46,139 @@ class Order(Base):
     typeOrder = Column(String)  # New field for order type
     origin_song_id = Column(Integer, nullable=True)  # For upsell orders, references the original order
     
+    # Genormaliseerde kolommen voor het zoeken van UpSell-originelen (gevuld bij ingest)
+    klant_email_norm = Column(String, nullable=True)  # lower(trim(klant_email)), NULL voor de placeholder
+    primary_product_id = Column(Integer, nullable=True)  # Eerste hoofdproduct dat geen upsell is
+    is_upsell = Column(Boolean, nullable=False, default=False, server_default=false())
+    
+    # Bij opslaan afgeleide weergavevelden (zie app/services/order_derivation.py)
+    derived = Column(JSONB, nullable=True)
+    derived_version = Column(Integer, nullable=True)
+    
+    # Huidige songtekst: de hoogste versie in songtexts (None als er nog geen is;
+    # OrderRead valt dan terug op een oude songtekst in raw_data). Deferred: alleen
+    # queries die OrderRead bouwen laden hem mee via undefer(Order.songtekst)
+    songtekst = column_property(
+        select(Songtext.songtekst)
+        .where(Songtext.order_id == order_id)
+        .order_by(Songtext.version.desc())
+        .limit(1)
+        .correlate_except(Songtext)
+        .scalar_subquery(),
+        deferred=True
+    )
+    
     # Relationships
     thema_obj = relationship("Thema", foreign_keys=[thema_id], lazy="select")
     
     # Voeg een unieke constraint toe op order_id
     __table_args__ = (
         UniqueConstraint('order_id', name='uix_order_id'),
+        # Keyset-paginatie van de orderlijst (nieuwste eerst)
+        Index('idx_orders_bestel_datum_id', bestel_datum.desc().nulls_last(), id.desc()),
+        # Kandidaten voor UpSell-koppeling: orders van één klant binnen een tijdvenster
+        Index('idx_orders_klant_email_norm_bestel_datum', klant_email_norm, bestel_datum),
+        # UpSell orders op datum (voor het koppelen in bulk)
+        Index('idx_orders_upsell_bestel_datum', bestel_datum, postgresql_where=is_upsell),
     )
     
     def __repr__(self):
         """String representatie van het Order object."""
         return f"<Order(id={self.id}, order_id='{self.order_id}', klant='{self.klant_naam}')>"
     
+    @classmethod
+    def build_from_plugpay_data(cls, db_session, order_data, resolve_relations=True, thema_id_cache=None):
+        """
+        Bouwt een (nog niet opgeslagen) Order object op basis van Plug&Pay order data.
+        
+        Args:
+            db_session: SQLAlchemy database sessie
+            order_data (dict): Order data van de Plug&Pay API
+            resolve_relations (bool): Zoek thema_id op en link UpSell orders aan hun originele order.
+                Kan uit als alleen de kolomwaarden nodig zijn (bijv. voor een bestaande order).
+            thema_id_cache (dict): Optionele cache van thema-string naar thema_id, gedeeld binnen een batch
+            
+        Returns:
+            Order: Het nieuwe, transient Order object
+            
+        Raises:
+            ValueError: Als verplichte velden ontbreken in de order_data
+        """
+        # Haal de benodigde velden op uit de order_data
+        customer = order_data.get("customer", {})
+        products = order_data.get("products", [])
+        
+        # Controleer of alle verplichte velden aanwezig zijn
+        if not order_data.get("id"):
+            raise ValueError("Bestelling heeft geen order_id")
+        
+        # Verwijderd: validatie op klantnaam (nu nullable)
+        # if not customer.get("name"):
+        #     raise ValueError("Bestelling heeft geen klantnaam")
+        
+        # Klantnaam, voornaam en custom fields via de gedeelde extractie
+        fields = extract_order_fields(order_data)
+        
+        # Detecteer of dit een UpSell order is
+        is_upsell = is_upsell_order(order_data)
+        
+        # Extract thema string first
+        thema_string = fields["thema"]
+        
+        # Try to find corresponding thema_id for the thema string
+        thema_id = None
+        if thema_string and resolve_relations:
+            if thema_id_cache is not None and thema_string in thema_id_cache:
+                thema_id = thema_id_cache[thema_string]
+            else:
+                try:
+                    from app.services.thema_service import get_thema_service
+                    thema_service = get_thema_service(db_session)
+                    thema_id = thema_service.find_thema_id_for_string(thema_string)
+                    if thema_id:
+                        logger.info(f"Found thema_id {thema_id} for thema string '{thema_string}'")
+                except Exception as e:
+                    logger.warning(f"Could not find thema_id for '{thema_string}': {str(e)}")
+                if thema_id_cache is not None:
+                    thema_id_cache[thema_string] = thema_id
+        
+        # Maak een nieuw Order object aan
+        klant_email = customer.get("email", "onbekend@example.com")
+        new_order = cls(
+            order_id=order_data.get("id"),
+            klant_naam=fields["klant_naam"],
+            voornaam=fields["voornaam"],
+            klant_email=klant_email,
+            klant_email_norm=normalize_email(klant_email),
+            primary_product_id=primary_product_id(order_data),
+            is_upsell=is_upsell,
+            product_naam=products[0].get("name", "Onbekend product") if products else "Onbekend product",
+            bestel_datum=datetime.fromisoformat(order_data.get("created_at").replace("Z", "+00:00")) 
+                        if order_data.get("created_at") else datetime.utcnow(),
+            raw_data=order_data,  # Sla de volledige Plug&Pay payload op
+            thema=thema_string,  # Legacy string field
+            thema_id=thema_id,  # New FK field
+            toon=fields["toon"],
+            structuur=fields["structuur"],
+            beschrijving=fields["beschrijving"],
+            deadline=products[0].get("title", "").replace("Songtekst - ", "") if products else None,
+            typeOrder=fields["type_order"]
+        )
+        
+        # Voor UpSell orders: probeer te linken aan originele order en neem thema over
+        if is_upsell and resolve_relations:
+            from app.services.upsell_linking import find_original_order_for_upsell, inherit_theme_from_original
+            
+            original_order_id = find_original_order_for_upsell(db_session, order_data)
+            if original_order_id:
+                new_order.origin_song_id = original_order_id
+                
+                # Als de UpSell order geen eigen thema heeft, neem het over van de originele order
+                if not new_order.thema or new_order.thema == '-':
+                    inherit_theme_from_original(db_session, new_order, original_order_id)
+        
+        return new_order
+    
     @classmethod
     def create_from_plugpay_data(cls, db_session, order_data):
         """
@@ -81,191 +205,7 @@ class Order(Base):
                 logger.info(f"Bestelling {order_data.get('id')} bestaat al in de database")
                 return existing_order, False
             
-            # Haal de benodigde velden op uit de order_data
-            customer = order_data.get("customer", {})
-            products = order_data.get("products", [])
-            
-            # Controleer of alle verplichte velden aanwezig zijn
-            if not order_data.get("id"):
-                raise ValueError("Bestelling heeft geen order_id")
-            
-            # Verwijderd: validatie op klantnaam (nu nullable)
-            # if not customer.get("name"):
-            #     raise ValueError("Bestelling heeft geen klantnaam")
-            
-            # Haal custom fields op als die aanwezig zijn
-            custom = {}
-            custom_field_inputs = order_data.get("custom_field_inputs", [])
-            for field in custom_field_inputs:
-                name = field.get("name") or field.get("label")
-                value = field.get("value") or field.get("input")
-                if name and value:
-                    custom[name] = value
-            
-            # Helper functie om waarden uit custom fields te halen
-            def pick(*keys):
-                for k in keys:
-                    if k in custom:
-                        return custom[k]
-                return None
-            
-            # Verbeterde klantnaam extractie - 6-staps systeem (gesynchroniseerd met schemas/order.py)
-            def get_klant_naam():
-                # Stap 1: address.full_name (hoogste prioriteit)
-                address = order_data.get("address", {})
-                if address.get("full_name") and address.get("full_name").strip():
-                    return address.get("full_name").strip()
-                
-                # Stap 2: address.firstname + lastname
-                if address.get("firstname") and address.get("firstname").strip():
-                    firstname = address.get("firstname").strip()
-                    lastname = address.get("lastname", "").strip()
-                    if lastname:
-                        return f"{firstname} {lastname}"
-                    return firstname
-                
-                # Stap 3: customer.name
-                if customer.get("name") and customer.get("name").strip():
-                    return customer.get("name").strip()
-                
-                # Stap 4: custom fields (uitgebreide lijst)
-                name_fields = [
-                    "Voornaam", "Voor wie is dit lied?", "Voor wie", "Naam", 
-                    "Voor wie is het lied?", "Wie is de ontvanger?", "Naam ontvanger", 
-                    "Klant naam", "Achternaam", "Van"
-                ]
-                
-                # Probeer voornaam + achternaam combinatie
-                voornaam = None
-                achternaam = None
-                for field_name in name_fields:
-                    field_value = pick(field_name)
-                    if field_value and field_value.strip():
-                        if field_name in ["Voornaam", "Voor wie is dit lied?", "Voor wie", "Naam", "Voor wie is het lied?", "Wie is de ontvanger?", "Naam ontvanger"]:
-                            if not voornaam:
-                                voornaam = field_value.strip()
-                        elif field_name in ["Achternaam", "Van"]:
-                            if not achternaam:
-                                achternaam = field_value.strip()
-                
-                if voornaam:
-                    if achternaam:
-                        return f"{voornaam} {achternaam}"
-                    return voornaam
-                
-                # Stap 5: description parsing (eenvoudige versie voor performance)
-                beschrijving = pick("Beschrijf")
-                if beschrijving and len(beschrijving) > 10:
-                    # Zoek naar patronen zoals "voor [naam]", "aan [naam]", etc.
-                    import re
-                    patterns = [
-                        r'\bvoor\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)?)\b',
-                        r'\baan\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)?)\b',
-                        r'\b([A-Z][a-zA-Z]+)\s+heet\b',
-                        r'\bheet\s+([A-Z][a-zA-Z]+)\b'
-                    ]
-                    for pattern in patterns:
-                        match = re.search(pattern, beschrijving, re.IGNORECASE)
-                        if match:
-                            name = match.group(1).strip()
-                            if len(name) > 1 and not name.lower() in ['het', 'de', 'een', 'mijn', 'zijn', 'haar']:
-                                return name
-                
-                # Stap 6: product title analysis (laatste redmiddel)
-                if products:
-                    product_title = products[0].get("title", "")
-                    if "voor" in product_title.lower():
-                        # Simpele extractie uit product titel
-                        parts = product_title.lower().split("voor")
-                        if len(parts) > 1 and len(parts[1].strip()) > 2:
-                            potential_name = parts[1].strip().title()
-                            if len(potential_name) < 30:  # Redelijke naam lengte
-                                return potential_name
-                
-                return None
-            
-            # Verbeterde voornaam extractie - 4-staps systeem (gesynchroniseerd met schemas/order.py)
-            def get_voornaam():
-                # Stap 1: address.firstname
-                address = order_data.get("address", {})
-                if address.get("firstname") and address.get("firstname").strip():
-                    return address.get("firstname").strip()
-                
-                # Stap 2: custom fields voor voornaam (uitgebreide lijst)
-                voornaam_fields = [
-                    "Voornaam", "Voor wie is dit lied?", "Voor wie", "Naam",
-                    "Voor wie is het lied?", "Wie is de ontvanger?", "Naam ontvanger"
-                ]
-                for field_name in voornaam_fields:
-                    field_value = pick(field_name)
-                    if field_value and field_value.strip():
-                        # Voor voornaam nemen we alleen het eerste woord
-                        return field_value.strip().split()[0]
-                
-                # Stap 3: customer name (first word)
-                if customer.get("name") and customer.get("name").strip():
-                    return customer.get("name").strip().split()[0]
-                
-                # Stap 4: address full_name (first word)
-                if address.get("full_name") and address.get("full_name").strip():
-                    return address.get("full_name").strip().split()[0]
-                
-                return None
-            
-            # Detecteer of dit een UpSell order is
-            is_upsell = False
-            if products:
-                for product in products:
-                    pivot_type = product.get("pivot", {}).get("type")
-                    if pivot_type == "upsell":
-                        is_upsell = True
-                        break
-            
-            # Extract thema string first
-            thema_string = pick("Vertel over de gelegenheid", "Gewenste stijl", "Thema")
-            
-            # Try to find corresponding thema_id for the thema string
-            thema_id = None
-            if thema_string:
-                try:
-                    from app.services.thema_service import get_thema_service
-                    thema_service = get_thema_service(db_session)
-                    thema_id = thema_service.find_thema_id_for_string(thema_string)
-                    if thema_id:
-                        logger.info(f"Found thema_id {thema_id} for thema string '{thema_string}'")
-                except Exception as e:
-                    logger.warning(f"Could not find thema_id for '{thema_string}': {str(e)}")
-            
-            # Maak een nieuw Order object aan
-            new_order = cls(
-                order_id=order_data.get("id"),
-                klant_naam=get_klant_naam(),  # Gebruik verbeterde functie
-                voornaam=get_voornaam(),  # Nieuw voornaam veld
-                klant_email=customer.get("email", "onbekend@example.com"),
-                product_naam=products[0].get("name", "Onbekend product") if products else "Onbekend product",
-                bestel_datum=datetime.fromisoformat(order_data.get("created_at").replace("Z", "+00:00")) 
-                            if order_data.get("created_at") else datetime.utcnow(),
-                raw_data=order_data,  # Sla de volledige Plug&Pay payload op
-                thema=thema_string,  # Legacy string field
-                thema_id=thema_id,  # New FK field
-                toon=pick("Toon", "Sfeer"),
-                structuur=pick("Structuur", "Song structuur"),
-                beschrijving=pick("Beschrijf"),
-                deadline=products[0].get("title", "").replace("Songtekst - ", "") if products else None,
-                typeOrder=pick("Type order")
-            )
-            
-            # Voor UpSell orders: probeer te linken aan originele order en neem thema over
-            if is_upsell:
-                from app.services.upsell_linking import find_original_order_for_upsell, inherit_theme_from_original
-                
-                original_order_id = find_original_order_for_upsell(db_session, order_data)
-                if original_order_id:
-                    new_order.origin_song_id = original_order_id
-                    
-                    # Als de UpSell order geen eigen thema heeft, neem het over van de originele order
-                    if not new_order.thema or new_order.thema == '-':
-                        inherit_theme_from_original(db_session, new_order, original_order_id)
+            new_order = cls.build_from_plugpay_data(db_session, order_data)
             
             # Voeg het nieuwe object toe aan de database
             db_session.add(new_order)
@@ -287,3 +227,55 @@ class Order(Base):
             db_session.rollback()
             logger.error(f"Fout bij aanmaken bestelling: {str(e)}")
             raise
+
+
+def _set_lookup_columns(target):
+    """Vult de genormaliseerde zoekkolommen op basis van klant_email en raw_data."""
+    target.klant_email_norm = normalize_email(target.klant_email)
+    target.primary_product_id = primary_product_id(target.raw_data)
+    target.is_upsell = is_upsell_order(target.raw_data)
+
+
+@event.listens_for(Order, "before_insert")
+def _derive_on_insert(mapper, connection, target):
+    """Leidt de weergavevelden en zoekkolommen af voor een nieuwe order."""
+    _set_lookup_columns(target)
+    apply_derived(target)
+
+
+@event.listens_for(Order, "before_update")
+def _derive_on_update(mapper, connection, target):
+    """Leidt de weergavevelden opnieuw af als raw_data of een van de bronkolommen is gewijzigd."""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ("klant_email", "raw_data")):
+        _set_lookup_columns(target)
+    if target.derived_version != DERIVER_VERSION or any(
+        state.attrs[name].history.has_changes() for name in DERIVATION_INPUTS
+    ):
+        apply_derived(target)
+
+
+# Kolommen die meetellen in de UpSell confidence score (zie app/services/upsell_linking.py)
+UPSELL_SCORING_INPUTS = ("klant_email", "klant_naam", "voornaam", "bestel_datum", "raw_data")
+
+
+@event.listens_for(Order, "after_insert")
+def _invalidate_upsell_candidates_on_insert(mapper, connection, target):
+    """Een nieuwe order kan een extra kandidaat zijn voor latere UpSells van dezelfde klant."""
+    # Lazy import om een circulaire import te voorkomen
+    from app.services.upsell_linking import invalidate_candidates_for_new_orders
+
+    invalidate_candidates_for_new_orders(connection, [target.order_id])
+
+
+@event.listens_for(Order, "after_update")
+def _invalidate_upsell_candidates_on_update(mapper, connection, target):
+    """Verwijdert de opgeslagen UpSell kandidaten als een scoringsbron van de order is gewijzigd."""
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in UPSELL_SCORING_INPUTS):
+        return
+    from app.models.upsell_link_candidate import UpsellLinkCandidate
+    from app.services.upsell_linking import invalidate_candidates_for_new_orders
+
+    UpsellLinkCandidate.invalidate(connection, [target.order_id])
+    invalidate_candidates_for_new_orders(connection, [target.order_id])
@@ -0,0 +1,48 @@
+"""
+SQLAlchemy model voor de ingest-queue van Plug&Pay bestellingen.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, Index, false
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.session import Base
+
+
+class OrderIngestJob(Base):
+    """
+    Een bestelling die (opnieuw) opgehaald en opgeslagen moet worden.
+    
+    Jobs worden aangemaakt door de Plug&Pay webhook en verwerkt door de
+    achtergrond-worker (zie app/services/order_ingest.py). Per order_id bestaat
+    maximaal één job; een nieuwe webhook voor een al verwerkte order zet de job
+    terug op "pending". Komt de webhook binnen terwijl de job verwerkt wordt, dan
+    wordt requeue gezet en zet de worker de job na afloop terug op "pending".
+    """
+    __tablename__ = "order_ingest_queue"
+    
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(Integer, unique=True, nullable=False)
+    status = Column(String, nullable=False, default=STATUS_PENDING)
+    source = Column(String, nullable=True)  # Bijv. "webhook" of "admin"
+    payload = Column(JSONB, nullable=True)  # Ontvangen webhook payload (zonder secret)
+    attempts = Column(Integer, nullable=False, default=0)
+    requeue = Column(Boolean, nullable=False, default=False, server_default=false())  # Nieuwe webhook tijdens verwerking
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # Niet eerder oppakken (backoff)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("idx_order_ingest_queue_status_available", "status", "available_at"),
+    )
+    
+    def __repr__(self):
+        return f"<OrderIngestJob(order_id={self.order_id}, status='{self.status}', attempts={self.attempts})>"
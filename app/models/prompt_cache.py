@@ -0,0 +1,36 @@
+"""
+SQLAlchemy model voor de persistente laag van de prompt-resultaat cache.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.session import Base
+
+
+class PromptCacheEntry(Base):
+    """
+    Een gecachet AI-resultaat, op inhoud geadresseerd.
+
+    De sleutel is een sha256 over (provider, model, genormaliseerde prompt,
+    temperature, max_tokens); zie app/services/prompt_cache.py. Rijen na
+    expires_at worden genegeerd en periodiek opgeruimd.
+    """
+    __tablename__ = "prompt_cache"
+
+    key = Column(String(64), primary_key=True)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=True)
+    result = Column(JSONB, nullable=False)  # Het resultaat van AIClient.generate_songtext
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # Opruimen van verlopen resultaten
+        Index("idx_prompt_cache_expires_at", "expires_at"),
+    )
+
+    def __repr__(self):
+        return f"<PromptCacheEntry(key='{self.key[:12]}', provider='{self.provider}', expires_at={self.expires_at})>"
@@ -0,0 +1,36 @@
+"""
+SQLAlchemy model voor de songteksten van bestellingen, met versiegeschiedenis.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, UniqueConstraint
+
+from app.db.session import Base
+
+
+class Songtext(Base):
+    """
+    Eén versie van de songtekst van een order.
+
+    Elke save voegt een nieuwe rij toe met het volgende versienummer; bestaande
+    versies worden nooit gewijzigd. De huidige songtekst is de rij met het hoogste
+    versienummer (zie Order.songtekst). raw_data blijft zo een ongewijzigde kopie
+    van de Plug&Pay payload.
+    """
+    __tablename__ = "songtexts"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)
+    songtekst = Column(Text, nullable=False)
+    author = Column(String, nullable=True)  # Bijv. een gebruikersnaam, "migratie" of "upsell-sync"
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Ook de index voor de huidige versie en de geschiedenis van een order (achterwaarts gescand)
+        UniqueConstraint("order_id", "version", name="uix_songtexts_order_version"),
+    )
+
+    def __repr__(self):
+        return f"<Songtext(order_id={self.order_id}, version={self.version}, author='{self.author}')>"
@@ -0,0 +1,75 @@
+"""
+SQLAlchemy model voor de voortgang van synchronisatie-jobs.
+"""
+
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from app.db.session import Base
+
+
+class SyncState(Base):
+    """
+    Key/value opslag voor cursors van langlopende of incrementele jobs,
+    zoals de high-water mark van de Plug&Pay order-sync.
+    """
+    __tablename__ = "sync_state"
+    
+    key = Column(String, primary_key=True)
+    value = Column(JSONB, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<SyncState(key='{self.key}', value={self.value})>"
+    
+    @classmethod
+    def get_value(cls, db: Session, key: str, default: Any = None) -> Any:
+        """
+        Haalt de opgeslagen waarde voor een sleutel op.
+        
+        Args:
+            db: SQLAlchemy database sessie
+            key: De sleutel van de job
+            default: Waarde als er nog niets is opgeslagen
+            
+        Returns:
+            De opgeslagen waarde of de default
+        """
+        state = db.query(cls).filter(cls.key == key).first()
+        if state is None or state.value is None:
+            return default
+        return state.value
+    
+    @classmethod
+    def set_value(cls, db: Session, key: str, value: Any, commit: bool = True) -> "SyncState":
+        """
+        Slaat de waarde voor een sleutel op (insert of update).
+        
+        Args:
+            db: SQLAlchemy database sessie
+            key: De sleutel van de job
+            value: JSON-serialiseerbare waarde
+            commit: Of de sessie direct gecommit moet worden
+            
+        Returns:
+            SyncState: Het opgeslagen record
+        """
+        state = db.query(cls).filter(cls.key == key).first()
+        if state is None:
+            state = cls(key=key)
+            db.add(state)
+        state.value = value
+        state.updated_at = datetime.utcnow()
+        if commit:
+            db.commit()
+        return state
+    
+    @classmethod
+    def clear(cls, db: Session, key: str) -> None:
+        """Verwijdert de opgeslagen waarde voor een sleutel."""
+        db.query(cls).filter(cls.key == key).delete(synchronize_session=False)
+        db.commit()
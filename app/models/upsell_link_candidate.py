@@ -0,0 +1,93 @@
+"""
+SQLAlchemy modellen voor vooraf berekende UpSell-koppelingskandidaten.
+"""
+
+from datetime import datetime
+from typing import Iterable, Union
+
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, Index, Select, UniqueConstraint, delete, or_, select
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.session import Base
+
+
+class UpsellLinkScore(Base):
+    """
+    Markering dat de linker een UpSell heeft gescoord, ook als er geen kandidaten waren.
+
+    Zonder deze rij zou een UpSell zonder kandidaten bij elke opvraging opnieuw
+    gescoord worden. De rij wordt samen met de kandidaten verwijderd (zie
+    UpsellLinkCandidate.invalidate).
+    """
+    __tablename__ = "upsell_link_scores"
+
+    upsell_order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), primary_key=True)
+    candidate_count = Column(Integer, nullable=False, default=0)
+    scored_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UpsellLinkScore(upsell={self.upsell_order_id}, candidates={self.candidate_count})>"
+
+
+class UpsellLinkCandidate(Base):
+    """
+    Een mogelijke originele order voor een UpSell order, met de berekende confidence.
+
+    De rijen worden gevuld door de UpSell linker (zie app/services/upsell_linking.py)
+    en verwijderd zodra de UpSell of de kandidaat wijzigt; de volgende keer dat de
+    matches worden opgevraagd, worden ze opnieuw berekend.
+    """
+    __tablename__ = "upsell_link_candidates"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    upsell_order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False)
+    candidate_order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False)
+    components = Column(JSONB, nullable=False)  # Onderdeel -> bijdrage (email, naam, tijd, product, herhaalklant)
+    computed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("upsell_order_id", "candidate_order_id", name="uix_upsell_link_candidate"),
+        # Matches van één UpSell, beste eerst
+        Index("idx_upsell_link_candidates_upsell_score", "upsell_order_id", score.desc()),
+        # Reviewen van (dubieuze) matches over alle UpSells, gepagineerd op score
+        Index("idx_upsell_link_candidates_score_id", score.desc(), id.desc()),
+        # Invalidatie als een kandidaat-order wijzigt
+        Index("idx_upsell_link_candidates_candidate", "candidate_order_id"),
+    )
+
+    def __repr__(self):
+        return (
+            f"<UpsellLinkCandidate(upsell={self.upsell_order_id}, "
+            f"candidate={self.candidate_order_id}, score={self.score})>"
+        )
+
+    @classmethod
+    def invalidate(cls, connection, order_ids: Union[Iterable[int], Select]) -> None:
+        """
+        Verwijdert alle kandidaten waarin een van de orders als UpSell of als kandidaat voorkomt,
+        en de score-markering van de UpSells die daardoor kandidaten kwijtraken.
+
+        Args:
+            connection: SQLAlchemy Connection of Session
+            order_ids: Plug&Pay order_ids van gewijzigde orders (of een SELECT die ze oplevert)
+        """
+        if not isinstance(order_ids, Select):
+            order_ids = list(order_ids)
+            if not order_ids:
+                return
+        scores = UpsellLinkScore.__table__
+        connection.execute(
+            delete(scores).where(or_(
+                scores.c.upsell_order_id.in_(order_ids),
+                scores.c.upsell_order_id.in_(
+                    select(cls.__table__.c.upsell_order_id).where(cls.__table__.c.candidate_order_id.in_(order_ids))
+                )
+            ))
+        )
+        connection.execute(
+            delete(cls.__table__).where(or_(
+                cls.__table__.c.upsell_order_id.in_(order_ids),
+                cls.__table__.c.candidate_order_id.in_(order_ids)
+            ))
+        )
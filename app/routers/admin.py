@@ -543,4 +543,46 @@ async def cleanup_old_orders(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Fout bij cleanup: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/plugpay/stats")
+async def get_plugpay_stats():
+    """Haal statistieken op van de gedeelde Plug&Pay HTTP-sessie (requests, retries, hergebruikte verbindingen)"""
+    from app.services.plugpay_client import plugpay_session
+    
+    return plugpay_session.get_stats()
+
+@router.get("/http/stats")
+async def get_http_stats():
+    """Haal statistieken op van de gedeelde aiohttp-sessies voor de AI providers en Suno (requests, hergebruikte verbindingen, DNS-cache)"""
+    from app.services.ai_client import ai_client
+    from app.services.suno_client import suno_http
+    
+    return {
+        "ai": ai_client.http.get_stats(),
+        "suno": suno_http.get_stats()
+    }
+
+@router.get("/prompt-cache/stats")
+async def get_prompt_cache_stats():
+    """Haal statistieken op van de prompt-resultaat cache (hits, misses, hit rate, evictions)"""
+    from app.config.feature_flags import should_cache_prompts
+    from app.services.prompt_cache import prompt_cache
+    
+    return {"enabled": should_cache_prompts(), **prompt_cache.get_stats()}
+
+@router.get("/ingest-queue/stats")
+async def get_ingest_queue_stats(db: Session = Depends(get_db)):
+    """Haal het aantal webhook-orders per status in de ingest-queue op"""
+    from app.services.order_ingest import get_queue_stats, order_ingest_worker
+    
+    try:
+        return {
+            "jobs": get_queue_stats(db),
+            "worker_running": order_ingest_worker.running
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Fout bij ophalen ingest-queue statistieken: {str(e)}"
+        )
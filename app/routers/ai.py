@@ -10,7 +10,7 @@ from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from app.auth.token import get_api_key
+from app.auth.token import get_api_key, verify_suno_callback_token
 from app.db.session import get_db
 from app.config.feature_flags import is_database_prompts_enabled, is_suno_optimization_enabled
 
@@ -48,6 +48,10 @@ except ImportError as e:
 
 from app.crud.order import get_order
 from app.templates.prompt_templates import generate_prompt, generate_enhanced_prompt, generate_professional_prompt
+from app.services.music_tasks import (
+    apply_suno_callback, create_music_task, get_music_task, is_stale, is_terminal, music_task_response,
+    record_polled_status
+)
 
 router = APIRouter(
     prefix="/api/ai",
@@ -219,7 +223,8 @@ async def generate_from_order_endpoint(
             prompt=prompt,
             provider=None, # Use default provider (Gemini)
             max_tokens=request.max_tokens,
-            temperature=request.temperature
+            temperature=request.temperature,
+            order_id=request.order_id  # Dubbele klikken voor dezelfde order delen één AI-call
         )
         
         if result["success"]:
@@ -447,7 +452,8 @@ async def ai_health_check():
 @router.post("/generate-music", response_model=dict)
 async def generate_music_endpoint(
     request: dict,
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(get_api_key),
+    db: Session = Depends(get_db)
 ):
     """
     Genereer volledige muziek via Suno API met Custom Mode ondersteuning
@@ -544,6 +550,7 @@ async def generate_music_endpoint(
         
         if result["success"]:
             # New API returns task_id instead of direct results
+            create_music_task(db, result["task_id"])
             return {
                 "success": True,
                 "task_id": result["task_id"],
@@ -651,17 +658,16 @@ async def generate_music_from_order_endpoint(
         )
         
         if result["success"]:
+            # De muziek wordt op de achtergrond gegenereerd; volg de taak via /suno-status/{task_id}
+            create_music_task(db, result["task_id"], order.order_id)
             return {
                 "success": True,
                 "order_id": order.order_id,
-                "song_id": result["song_id"],
-                "title": result["title"],
-                "audio_url": result["audio_url"],
-                "video_url": result["video_url"],
-                "image_url": result["image_url"],
-                "style": result["style"],
-                "model": result["model"],
-                "created_at": result["created_at"],
+                "task_id": result["task_id"],
+                "title": title,
+                "style": style,
+                "message": result["message"],
+                "status": result["status"],
                 "generated_at": result["generated_at"]
             }
         else:
@@ -682,19 +688,33 @@ async def generate_music_from_order_endpoint(
 @router.get("/suno-status/{task_id}")
 async def get_suno_task_status(
     task_id: str,
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(get_api_key),
+    db: Session = Depends(get_db)
 ):
     """
     Controleer status van een Suno muziek generatie taak
+    
+    De status komt uit music_tasks (bijgewerkt via /suno-callback). Alleen als de
+    taak onbekend is of een lopende taak al een tijd geen update heeft gehad, wordt
+    de status bij Suno opgevraagd en opgeslagen.
     """
     try:
         from app.services.suno_client import SunoClient
         
+        task = get_music_task(db, task_id)
+        if task is not None and not is_stale(task):
+            return music_task_response(task)
+        
         client = SunoClient()
         result = await client.get_task_status(task_id)
         
         if result.get("success"):
-            return result
+            polled_task = record_polled_status(db, task_id, result)
+            return music_task_response(polled_task) if polled_task is not None else result
+        elif task is not None:
+            # Suno niet bereikbaar: geef de laatst bekende status
+            logger.warning(f"Suno status voor {task_id} niet opgehaald, laatst bekende status gebruikt: {result.get('error')}")
+            return music_task_response(task)
         else:
             raise HTTPException(
                 status_code=500,
@@ -736,7 +756,11 @@ async def suno_health_check(api_key: str = Depends(get_api_key)):
         }
 
 @router.post("/suno-callback")
-async def suno_callback_endpoint(request: dict):
+async def suno_callback_endpoint(
+    request: dict,
+    db: Session = Depends(get_db),
+    token: str = Depends(verify_suno_callback_token)
+):
     """
     Callback endpoint voor SUNO API notifications
     
@@ -744,23 +768,33 @@ async def suno_callback_endpoint(request: dict):
     - text: Tekst generatie voltooid
     - first: Eerste track voltooid  
     - complete: Alle tracks voltooid
+    - error: Generatie mislukt
+    
+    Elke update wordt met de tracks (audio/stream/image URLs, duur) in music_tasks
+    opgeslagen; /suno-status leest daarna alleen die rij. Alleen callbacks met het
+    token uit de callBackUrl en voor taken die wij hebben ingediend worden verwerkt.
     """
     try:
+        from app.services.suno_client import suno_task_tracker
+        
         logger.info(f"SUNO callback ontvangen: {json.dumps(request, indent=2)}")
         
-        # Extract callback data
-        callback_type = request.get("callbackType")
-        task_id = request.get("taskId")
+        task = apply_suno_callback(db, request)
+        if task is None:
+            return {
+                "success": False,
+                "error": "Callback zonder bekende task_id"
+            }
         
-        if callback_type == "complete":
-            logger.info(f"SUNO muziekgeneratie voltooid voor task {task_id}")
-            # Hier zou je de database kunnen updaten of notifications versturen
+        if is_terminal(task.status):
+            logger.info(f"SUNO muziekgeneratie voor task {task.task_id} afgerond met status {task.status}")
+            suno_task_tracker.resolve(task.task_id)
         
         return {
             "success": True,
             "message": "Callback ontvangen",
-            "callback_type": callback_type,
-            "task_id": task_id
+            "status": task.status,
+            "task_id": task.task_id
         }
         
     except Exception as e:
@@ -768,4 +802,4 @@ async def suno_callback_endpoint(request: dict):
         return {
             "success": False,
             "error": str(e)
-        }
\ No newline at end of file
+        }
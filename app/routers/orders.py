@@ -4,23 +4,36 @@ Orders Router
 Deze module bevat API endpoints voor het beheren van bestellingen.
 """
 
+import itertools
+import json
 import logging
-import re
+from datetime import datetime
 from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request, Path, Body
-from fastapi.responses import JSONResponse, Response
-from sqlalchemy.orm import Session
-from sqlalchemy import exc as sa_exc
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request, Path, Body, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy.orm import Session, load_only, undefer
+from sqlalchemy import exc as sa_exc, func, or_, text, tuple_
 from pydantic import BaseModel, ValidationError, Field
-from sqlalchemy.orm.attributes import flag_modified
 
 from app.db.session import get_db
 from app.models.order import Order
-from app.schemas.order import OrderRead, UpdateSongtextRequest
+from app.schemas.order import OrderRead, OrderSummary, UpdateSongtextRequest
+from app.services.order_extraction import extract_order_fields
+from app.services.order_names import get_order_names_progress, run_order_names_job
 from app.services.plugpay_client import fetch_and_store_recent_orders, PlugPayAPIError
+from app.services.songtexts import diff_songtext_versions, get_songtext_history, get_songtext_version, save_songtext
 from app.auth.token import get_api_key
 from app.crud import order as crud
-from app.services.upsell_linking import find_original_order_for_upsell, inherit_theme_from_original
+from app.services.upsell_linking import (
+    MIN_LINK_CONFIDENCE,
+    get_stored_candidates,
+    is_upsell_scored,
+    link_upsells_in_bulk,
+    page_stored_candidates,
+    parse_upsell,
+    propagate_songtext_to_upsells,
+    refresh_upsell_candidates,
+)
 
 # Configureer logging
 logger = logging.getLogger(__name__)
@@ -78,42 +91,205 @@ async def options_order_detail():
     response = Response(status_code=200)
     return response
 
-@router.get("/orders", response_model=List[OrderRead])
-async def get_all_orders(db: Session = Depends(get_db), api_key: str = Depends(get_api_key)):
+# Maximaal aantal orders per pagina bij keyset-paginatie
+MAX_PAGE_SIZE = 500
+
+# Aantal rijen dat per keer van de server-side cursor wordt gehaald bij streaming
+STREAM_BATCH_SIZE = 200
+
+# Order attributen die read_order overschrijft met de waarde uit de custom fields
+CUSTOM_FIELD_ATTRIBUTES = ("voornaam", "relatie", "datum", "thema", "toon", "structuur", "rijm", "beschrijving")
+
+def _parse_after_cursor(after: Optional[str]):
     """
-    Haalt alle bestellingen op uit de database.
+    Parseert een keyset-cursor van de vorm "<bestel_datum ISO>,<id>" (of "null,<id>").
     
-    Vereist API-key authenticatie.
+    Raises:
+        HTTPException: Als de cursor ongeldig is (400)
+    """
+    try:
+        datum_str, id_str = after.rsplit(",", 1)
+        after_id = int(id_str)
+        after_datum = None if datum_str in ("", "null") else datetime.fromisoformat(datum_str)
+        return after_datum, after_id
+    except (ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="Ongeldige cursor, verwacht after=<bestel_datum>,<id>")
+
+def _format_after_cursor(order) -> str:
+    """Maakt de keyset-cursor voor de volgende pagina op basis van de laatste order."""
+    datum = order.bestel_datum.isoformat() if order.bestel_datum else "null"
+    return f"{datum},{order.id}"
+
+# Velden die met view=summary of fields= opgevraagd kunnen worden
+SUMMARY_FIELDS = list(OrderSummary.model_fields)
+
+def _parse_fields(view: str, fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Bepaalt welke kolommen geladen moeten worden.
     
     Returns:
-        Een lijst van alle bestellingen
+        None voor de volledige view (OrderRead incl. raw_data), anders de lijst met
+        summary-velden (fields= impliceert view=summary)
+        
+    Raises:
+        HTTPException: Bij onbekende velden (400)
+    """
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in SUMMARY_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Onbekende velden: {', '.join(unknown)}. Toegestaan: {', '.join(SUMMARY_FIELDS)}"
+            )
+        return requested
+    if view == "summary":
+        return list(SUMMARY_FIELDS)
+    return None
+
+def _order_list_query(db: Session, after: Optional[str], columns: Optional[List[str]] = None):
+    """
+    Bouwt de query voor de orderlijst: nieuwste eerst, met id als tie-breaker zodat
+    de volgorde stabiel is en keyset-paginatie via de index kan (zie idx_orders_bestel_datum_id).
+    
+    Met columns worden alleen de (smalle) summary-kolommen geladen, altijd allemaal:
+    OrderSummary leest ze elk, en een niet-geladen kolom zou per rij lazy geladen
+    worden. raw_data wordt dan nooit opgehaald of ge-deTOAST.
+    """
+    query = db.query(Order)
+    if columns is not None:
+        query = query.options(load_only(*[getattr(Order, c) for c in SUMMARY_FIELDS]))
+    else:
+        query = query.options(undefer(Order.songtekst))
+    query = query.order_by(Order.bestel_datum.desc().nulls_last(), Order.id.desc())
+    if after:
+        after_datum, after_id = _parse_after_cursor(after)
+        if after_datum is None:
+            query = query.filter(Order.bestel_datum.is_(None), Order.id < after_id)
+        else:
+            query = query.filter(or_(
+                tuple_(Order.bestel_datum, Order.id) < tuple_(after_datum, after_id),
+                Order.bestel_datum.is_(None)
+            ))
+    return query
+
+def _serialize_order(o, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Valideert één order via OrderRead, of via OrderSummary als columns is opgegeven.
+    Geeft None terug bij een schema-fout.
     """
     try:
-        orders = db.query(Order).order_by(Order.bestel_datum.desc()).all()
-        safe_orders = []
-        skipped = 0
-        for o in orders:
-            try:
-                safe_orders.append(OrderRead.model_validate(o).model_dump(mode='json'))
-            except ValidationError as ve:
-                skipped += 1
-                logger.warning(f"Order {o.id} overgeslagen door schema-fout: {str(ve)}")
-        logger.info(f"Total {len(safe_orders)} orders ok, {skipped} skipped")
+        if columns is not None:
+            return OrderSummary.model_validate(o).model_dump(mode='json', include=set(columns))
+        return OrderRead.model_validate(o).model_dump(mode='json')
+    except ValidationError as ve:
+        logger.warning(f"Order {o.id} overgeslagen door schema-fout: {str(ve)}")
+        return None
+
+def _stream_orders(first_batch: List[Any], rows, columns: Optional[List[str]] = None):
+    """
+    Genereert de JSON-array met orders in stukken, zodat niet de hele lijst in het
+    geheugen wordt opgebouwd. De rijen komen via yield_per van een server-side cursor.
+    """
+    yield "["
+    count = 0
+    skipped = 0
+    chunk = []
+    for o in itertools.chain(first_batch, rows):
+        item = _serialize_order(o, columns)
+        if item is None:
+            skipped += 1
+            continue
+        chunk.append(("," if count else "") + json.dumps(item, ensure_ascii=False))
+        count += 1
+        if len(chunk) >= STREAM_BATCH_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+    yield "]"
+    logger.info(f"Total {count} orders ok, {skipped} skipped (streaming)")
+
+def _list_orders_response(
+    db: Session, after: Optional[str], limit: Optional[int],
+    view: str = "full", fields: Optional[str] = None
+):
+    """
+    Gedeelde implementatie van de orderlijst-endpoints.
+    
+    - Met limit: één pagina van maximaal `limit` orders; de cursor voor de volgende
+      pagina staat in de X-Next-After header (ontbreekt op de laatste pagina).
+    - Zonder limit: alle orders (na de optionele cursor) als gestreamde JSON-array.
+    - Met view=summary of fields=: alleen de gevraagde kolommen, zonder raw_data.
+    """
+    columns = _parse_fields(view, fields)
+    query = _order_list_query(db, after, columns)
+    
+    if limit:
+        orders = query.limit(limit + 1).all()
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        safe_orders = [item for item in (_serialize_order(o, columns) for o in orders) if item is not None]
+        logger.info(f"Page {len(safe_orders)} orders ok, {len(orders) - len(safe_orders)} skipped")
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        if has_more and orders:
+            headers["X-Next-After"] = _format_after_cursor(orders[-1])
+        return JSONResponse(content=safe_orders, headers=headers)
+    
+    # Haal de eerste batch op vóór de response start, zodat databasefouten
+    # (zoals een ontbrekende kolom) nog als nette foutmelding terug kunnen
+    rows = iter(query.yield_per(STREAM_BATCH_SIZE))
+    first_batch = list(itertools.islice(rows, STREAM_BATCH_SIZE))
+    return StreamingResponse(
+        _stream_orders(first_batch, rows, columns),
+        media_type="application/json; charset=utf-8"
+    )
+
+def _schema_error_response(pe: sa_exc.ProgrammingError):
+    """Geeft een nette 500-response als een DB-kolom ontbreekt; anders None."""
+    error_msg = str(pe)
+    if ("column orders.thema does not exist" in error_msg or 
+        "column orders.persoonlijk_verhaal does not exist" in error_msg or 
+        "UndefinedColumn" in str(pe.__class__)):
+        logger.error("DB-kolom ontbreekt – heeft migration al gedraaid? %s", pe)
         return JSONResponse(
-            content=safe_orders,
+            status_code=500,
+            content={"detail": "Database-schema niet up-to-date. Voer de Alembic migratie uit."},
             headers={"Content-Type": "application/json; charset=utf-8"}
         )
+    return None
+
+@router.get("/orders", response_model=List[OrderRead])
+async def get_all_orders(
+    after: Optional[str] = Query(None, description="Keyset-cursor <bestel_datum>,<id> uit de X-Next-After header"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Aantal orders per pagina; zonder limit wordt de hele lijst gestreamd"),
+    view: str = Query("full", pattern="^(full|summary)$", description="summary: compacte lijst zonder raw_data"),
+    fields: Optional[str] = Query(None, description="Komma-gescheiden summary-velden, bijv. id,order_id,klant_naam"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Haalt bestellingen op uit de database, nieuwste eerst.
+    
+    Vereist API-key authenticatie.
+    
+    Args:
+        after: Cursor van de vorige pagina (X-Next-After header)
+        limit: Paginagrootte; zonder limit worden alle orders gestreamd
+        view: "full" (OrderRead met raw_data) of "summary" (OrderSummary, zonder raw_data)
+        fields: Subset van de summary-velden (impliceert view=summary)
+    
+    Returns:
+        Een lijst van bestellingen
+    """
+    try:
+        return _list_orders_response(db, after, limit, view, fields)
+    except HTTPException:
+        raise
     except sa_exc.ProgrammingError as pe:
-        error_msg = str(pe)
-        if ("column orders.thema does not exist" in error_msg or 
-            "column orders.persoonlijk_verhaal does not exist" in error_msg or 
-            "UndefinedColumn" in str(pe.__class__)):
-            logger.error("DB-kolom ontbreekt – heeft migration al gedraaid? %s", pe)
-            return JSONResponse(
-                status_code=500,
-                content={"detail": "Database-schema niet up-to-date. Voer de Alembic migratie uit."},
-                headers={"Content-Type": "application/json; charset=utf-8"}
-            )
+        response = _schema_error_response(pe)
+        if response is not None:
+            return response
         raise
     except Exception as e:
         logger.error(f"Fout bij ophalen van bestellingen: {str(e)}")
@@ -124,41 +300,36 @@ async def get_all_orders(db: Session = Depends(get_db), api_key: str = Depends(g
         )
 
 @router.get("/orders/orders", response_model=List[OrderRead])
-async def get_all_orders_nested(db: Session = Depends(get_db), api_key: str = Depends(get_api_key)):
+async def get_all_orders_nested(
+    after: Optional[str] = Query(None, description="Keyset-cursor <bestel_datum>,<id> uit de X-Next-After header"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Aantal orders per pagina; zonder limit wordt de hele lijst gestreamd"),
+    view: str = Query("full", pattern="^(full|summary)$", description="summary: compacte lijst zonder raw_data"),
+    fields: Optional[str] = Query(None, description="Komma-gescheiden summary-velden, bijv. id,order_id,klant_naam"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
     """
-    Haalt alle bestellingen op uit de database (geneste route).
+    Haalt bestellingen op uit de database, nieuwste eerst (geneste route).
     
     Vereist API-key authenticatie.
     
+    Args:
+        after: Cursor van de vorige pagina (X-Next-After header)
+        limit: Paginagrootte; zonder limit worden alle orders gestreamd
+        view: "full" (OrderRead met raw_data) of "summary" (OrderSummary, zonder raw_data)
+        fields: Subset van de summary-velden (impliceert view=summary)
+    
     Returns:
-        Een lijst van alle bestellingen
+        Een lijst van bestellingen
     """
     try:
-        orders = db.query(Order).order_by(Order.bestel_datum.desc()).all()
-        safe_orders = []
-        skipped = 0
-        for o in orders:
-            try:
-                safe_orders.append(OrderRead.model_validate(o).model_dump(mode='json'))
-            except ValidationError as ve:
-                skipped += 1
-                logger.warning(f"Order {o.id} overgeslagen door schema-fout: {str(ve)}")
-        logger.info(f"Total {len(safe_orders)} orders ok, {skipped} skipped")
-        return JSONResponse(
-            content=safe_orders,
-            headers={"Content-Type": "application/json; charset=utf-8"}
-        )
+        return _list_orders_response(db, after, limit, view, fields)
+    except HTTPException:
+        raise
     except sa_exc.ProgrammingError as pe:
-        error_msg = str(pe)
-        if ("column orders.thema does not exist" in error_msg or 
-            "column orders.persoonlijk_verhaal does not exist" in error_msg or 
-            "UndefinedColumn" in str(pe.__class__)):
-            logger.error("DB-kolom ontbreekt – heeft migration al gedraaid? %s", pe)
-            return JSONResponse(
-                status_code=500,
-                content={"detail": "Database-schema niet up-to-date. Voer de Alembic migratie uit."},
-                headers={"Content-Type": "application/json; charset=utf-8"}
-            )
+        response = _schema_error_response(pe)
+        if response is not None:
+            return response
         raise
     except Exception as e:
         logger.error(f"Fout bij ophalen van bestellingen (geneste route): {str(e)}")
@@ -168,6 +339,90 @@ async def get_all_orders_nested(db: Session = Depends(get_db), api_key: str = De
             headers={"Content-Type": "application/json; charset=utf-8"}
         )
 
+@router.get("/count")
+async def count_orders(
+    exact: bool = Query(True, description="Exacte telling; met false een snelle schatting uit de Postgres-statistieken"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Geeft het totaal aantal bestellingen terug, los van de (gepagineerde) lijst.
+    
+    Vereist API-key authenticatie.
+    
+    Returns:
+        {"count": <aantal>, "exact": <bool>}
+    """
+    try:
+        if not exact:
+            estimate = db.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'orders'")
+            ).scalar()
+            if estimate is not None and estimate >= 0:
+                return {"count": int(estimate), "exact": False}
+        
+        count = db.query(func.count(Order.id)).scalar()
+        return {"count": count, "exact": True}
+    except Exception as e:
+        logger.error(f"Fout bij tellen van bestellingen: {str(e)}")
+        raise HTTPException(status_code=500, detail="Er is een fout opgetreden bij het tellen van bestellingen")
+
+def _format_upsell_match(row) -> Dict[str, Any]:
+    """Zet een opgeslagen kandidaat om naar een match in de response."""
+    return {
+        "order_id": row.order_id,
+        "klant_naam": row.klant_naam,
+        "klant_email": row.klant_email,
+        "voornaam": row.voornaam,
+        "bestel_datum": row.bestel_datum.isoformat() if row.bestel_datum else None,
+        "thema": row.thema,
+        "product_naam": row.product_naam,
+        "confidence": round(row.score, 1),
+        "score_components": row.components,
+        "computed_at": row.computed_at.isoformat() if row.computed_at else None
+    }
+
+@router.get("/upsell-matches")
+def list_upsell_matches(
+    min_score: float = Query(50, description="Ondergrens van de score (exclusief)"),
+    max_score: float = Query(70, description="Bovengrens van de score (inclusief); standaard de dubieuze band 50-70%"),
+    after: Optional[str] = Query(None, description="Keyset-cursor <score>,<id> uit de X-Next-After header"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="Aantal matches per pagina"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Bladert door de opgeslagen UpSell matches van alle UpSells, hoogste score eerst.
+    
+    Standaard alleen de dubieuze matches (50% < score <= 70%) die de linker niet
+    automatisch koppelt. De cursor voor de volgende pagina staat in de X-Next-After
+    header (ontbreekt op de laatste pagina).
+    
+    Vereist API-key authenticatie.
+    """
+    after_key = None
+    if after:
+        try:
+            score_str, id_str = after.rsplit(",", 1)
+            after_key = (float(score_str), int(id_str))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Ongeldige cursor, verwacht after=<score>,<id>")
+    
+    try:
+        rows = page_stored_candidates(db, min_score, max_score, limit + 1, after_key)
+    except Exception as e:
+        logger.error(f"Fout bij ophalen van UpSell matches: {str(e)}")
+        raise HTTPException(status_code=500, detail="Er is een fout opgetreden bij het ophalen van UpSell matches")
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    matches = [{"upsell_order_id": row.upsell_order_id, **_format_upsell_match(row)} for row in rows]
+    
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+    if has_more and rows:
+        headers["X-Next-After"] = f"{rows[-1].score},{rows[-1].id}"
+    return JSONResponse(content=matches, headers=headers)
+
 @router.get("/{order_id}", response_model=OrderRead)
 def read_order(
     order_id: int = Path(..., description="Plug&Pay order_id"),
@@ -190,99 +445,25 @@ def read_order(
     Raises:
         HTTPException: Als de bestelling niet gevonden wordt (404)
     """
-    order = crud.get_order(db, order_id)
+    order = crud.get_order(db, order_id, with_songtext=True)
     if not order:
         raise HTTPException(status_code=404, detail="Order niet gevonden")
     
-    # Controleer of de order custom fields heeft
-    if order.raw_data and "custom_field_inputs" in order.raw_data:
-        custom_fields = {}
-        
-        # Verzamel alle custom fields uit de raw_data
-        for field in order.raw_data["custom_field_inputs"]:
-            if "name" in field and "value" in field:
-                custom_fields[field["name"]] = field["value"]
-        
-        # Mapping van custom field namen naar order attributen
-        field_mapping = {
-            # Voornaam varianten
-            "Voornaam": "voornaam",
-            "Naam": "voornaam",
-            "Voor wie is dit lied?": "voornaam",
-            
-            # Achternaam varianten
-            "Achternaam": "van",
-            "Van": "van",
-            
-            # Relatie varianten
-            "Relatie": "relatie",
-            "Wat is je relatie tot deze persoon?": "relatie",
-            "Hoe ken je deze persoon?": "relatie",
-            
-            # Datum varianten
-            "Datum": "datum",
-            "Wanneer": "datum",
-            "Wanneer is de gelegenheid?": "datum",
-            "Wanneer moet het lied klaar zijn?": "datum",
-            
-            # Thema varianten
-            "Thema": "thema",
-            "Gelegenheid": "thema",
-            "Voor welke gelegenheid": "thema",
-            "Voor welke gelegenheid?": "thema",
-            "Waarvoor is dit lied?": "thema",
-            "Vertel over de gelegenheid": "thema",
-            
-            # Toon varianten
-            "Toon": "toon",
-            "Gewenste stijl": "toon",
-            "Stijl": "toon",
-            "Sfeer": "toon",
-            
-            # Structuur varianten
-            "Structuur": "structuur",
-            "Opbouw": "structuur",
-            
-            # Rijm varianten
-            "Rijm": "rijm",
-            "Rijmschema": "rijm",
-            
-            # Beschrijving varianten
-            "Beschrijf": "beschrijving",
-            "Toelichting": "beschrijving",
-            "Vertel over de persoon": "beschrijving",
-            "Vertel over deze persoon": "beschrijving",
-            "Vertel over je wensen": "beschrijving",
-            "Vertel over je ideeën": "beschrijving",
-            "Vertel je verhaal": "beschrijving",
-            "Vertel meer": "beschrijving",
-            "Vertel": "beschrijving",
-            
-            # Persoonlijk verhaal varianten (mapped to beschrijving)
-            "Persoonlijk verhaal": "beschrijving",
-            "Vertel iets over deze persoon": "beschrijving",
+    # Wijs de waarden uit de custom fields toe aan de order attributen (gedeelde extractie)
+    if order.raw_data:
+        fields = extract_order_fields(order.raw_data)
+        mapped = {
+            attr_name: fields[attr_name]
+            for attr_name in CUSTOM_FIELD_ATTRIBUTES
+            if fields[attr_name]
         }
-        
-        # Log summary of found fields before mapping
-        logger.info(f"Order {order_id}: Found {len(custom_fields)} custom fields in total: {', '.join(custom_fields.keys())}")
-        
-        # Wijs custom fields toe aan order attributen
-        mapped_fields = 0
-        for field_name, field_value in custom_fields.items():
-            # Check of dit veld in onze mapping staat
-            if field_name in field_mapping:
-                attr_name = field_mapping[field_name]
-                setattr(order, attr_name, field_value)
-                mapped_fields += 1
-                logger.info(f"Order {order_id}: Custom field '{field_name}' toegewezen aan '{attr_name}'")
-        
-        # Log resultaat
-        logger.info(f"Order {order_id}: {len(custom_fields)} custom fields verwerkt")
+        for attr_name, value in mapped.items():
+            setattr(order, attr_name, value)
+        logger.info(f"Order {order_id}: {len(mapped)} velden uit custom fields toegewezen: {', '.join(mapped)}")
         
         # Final verification for critical fields
-        if hasattr(order, 'beschrijving') and order.beschrijving:
-            desc_length = len(order.beschrijving)
-            logger.info(f"Order {order_id}: Final beschrijving field has {desc_length} characters")
+        if order.beschrijving:
+            logger.info(f"Order {order_id}: Final beschrijving field has {len(order.beschrijving)} characters")
         else:
             logger.warning(f"Order {order_id}: No beschrijving field was mapped or it's empty")
     
@@ -294,6 +475,7 @@ def read_order(
 @router.post("/fetch")
 async def fetch_orders(
     background_tasks: BackgroundTasks,
+    incremental: bool = Query(False, description="Alle pagina's sinds de vorige sync doorlopen en ongewijzigde bestellingen overslaan"),
     db: Session = Depends(get_db),
     api_key: str = Depends(get_api_key)
 ):
@@ -303,12 +485,15 @@ async def fetch_orders(
     
     Vereist API-key authenticatie.
     
+    Args:
+        incremental: Gebruik de opgeslagen high-water mark i.p.v. alleen de eerste pagina
+    
     Returns:
         Een JSON-response met een bevestiging en het resultaat
     """
     try:
         # Voer de taak uit en haal het resultaat op
-        new_orders, skipped_orders = fetch_and_store_recent_orders(db)
+        new_orders, skipped_orders = fetch_and_store_recent_orders(db, incremental=incremental)
         
         # Stuur een bevestiging terug met het resultaat
         return JSONResponse(
@@ -370,166 +555,58 @@ def get_order_raw_data(
         headers={"Content-Type": "application/json; charset=utf-8"}
     )
 
+def _run_order_names_job_in_background(batch_size: Optional[int], restart: bool):
+    """Draait de order names job met een eigen database sessie (na de response)."""
+    from app.db.session import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        run_order_names_job(db, batch_size=batch_size, restart=restart)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Fout in order names job: {str(e)}")
+    finally:
+        db.close()
+
 @router.post("/update-names", response_model=UpdateResponse)
-async def update_order_names(
+def update_order_names(
+    background_tasks: BackgroundTasks,
+    batch_size: Optional[int] = Query(None, ge=1, le=5000, description="Aantal orders per batch"),
+    restart: bool = Query(False, description="Opnieuw bij het begin beginnen i.p.v. een onderbroken job te hervatten"),
+    background: bool = Query(False, description="De job op de achtergrond draaien en direct antwoorden"),
     db: Session = Depends(get_db),
     api_key: str = Depends(get_api_key)
 ):
     """
     Update bestaande orders met verbeterde klantnaam extractie.
     
+    De orders worden in batches op volgorde van id verwerkt en per batch met één
+    bulk UPDATE teruggeschreven. Een onderbroken job wordt standaard hervat; de
+    voortgang is op te vragen via GET /orders/update-names/status.
+    
     Vereist API-key authenticatie.
     
     Returns:
-        UpdateResponse met aantal bijgewerkte orders
+        UpdateResponse met aantal bijgewerkte orders (202 bij background=true)
     """
+    if background:
+        background_tasks.add_task(_run_order_names_job_in_background, batch_size, restart)
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": "Order names job gestart",
+                "updated_count": 0,
+                "total_processed": 0
+            },
+            headers={"Content-Type": "application/json; charset=utf-8"}
+        )
+    
     try:
-        # Get all orders
-        orders = db.query(Order).all()
-        logger.info(f"Found {len(orders)} orders to process")
-        
-        updated_count = 0
-        
-        for order in orders:
-            if not order.raw_data:
-                logger.warning(f"Order {order.order_id} has no raw_data, skipping")
-                continue
-            
-            # Extract improved name using the new logic
-            customer = order.raw_data.get("customer", {})
-            
-            # Custom fields extractie (try both locations)
-            custom = {}
-            
-            # Check root level custom_field_inputs
-            custom_field_inputs = order.raw_data.get("custom_field_inputs", [])
-            for field in custom_field_inputs:
-                name = field.get("name") or field.get("label")
-                value = field.get("value") or field.get("input")
-                if name and value:
-                    custom[name] = value
-            
-            # Check products level custom_field_inputs
-            products = order.raw_data.get("products", [])
-            for product in products:
-                product_custom_fields = product.get("custom_field_inputs", [])
-                for field in product_custom_fields:
-                    name = field.get("name") or field.get("label")
-                    value = field.get("value") or field.get("input")
-                    if name and value:
-                        custom[name] = value
-            
-            def pick(*keys):
-                for k in keys:
-                    if k in custom:
-                        return custom[k]
-                return None
-            
-            # Verbeterde klantnaam extractie (6-staps systeem)
-            def get_klant_naam():
-                # Stap 1: Address full_name
-                address = order.raw_data.get("address", {})
-                if address.get("full_name"):
-                    return address.get("full_name")
-                
-                # Stap 2: Address firstname + lastname
-                if address.get("firstname"):
-                    firstname = address.get("firstname")
-                    lastname = address.get("lastname", "")
-                    return f"{firstname} {lastname}".strip()
-                
-                # Stap 3: Customer name
-                if customer.get("name"):
-                    return customer.get("name")
-                
-                # Stap 4: Custom fields (uitgebreide lijst)
-                name_fields = [
-                    "Voornaam", "Voor wie is dit lied?", "Voor wie", "Naam",
-                    "Voor wie is het lied?", "Wie is de ontvanger?", 
-                    "Naam ontvanger", "Klant naam"
-                ]
-                for field_name in name_fields:
-                    value = pick(field_name)
-                    if value:
-                        # Probeer ook achternaam toe te voegen
-                        achternaam = pick("Achternaam", "Van")
-                        if achternaam:
-                            return f"{value} {achternaam}"
-                        return value
-                
-                # Stap 5: Name extraction from description (basic regex)
-                description = order.raw_data.get("description", "")
-                if description:
-                    # Zoek naar patronen zoals "voor [naam]" of "aan [naam]"
-                    patterns = [
-                        r"voor\s+([A-Za-z]+(?:\s+[A-Za-z]+)?)",
-                        r"aan\s+([A-Za-z]+(?:\s+[A-Za-z]+)?)",
-                        r"van\s+([A-Za-z]+(?:\s+[A-Za-z]+)?)"
-                    ]
-                    for pattern in patterns:
-                        match = re.search(pattern, description, re.IGNORECASE)
-                        if match:
-                            return match.group(1).strip()
-                
-                return None
-            
-            new_klant_naam = get_klant_naam()
-            
-            # Update als er een verbetering is
-            if new_klant_naam and new_klant_naam != order.klant_naam:
-                old_name = order.klant_naam or "None"
-                order.klant_naam = new_klant_naam
-                logger.info(f"Order {order.order_id}: Updated klant_naam from '{old_name}' to '{new_klant_naam}'")
-                updated_count += 1
-            
-            # Update voornaam field for better frontend display (4-staps systeem)
-            def get_voornaam():
-                # Stap 1: Address firstname
-                address = order.raw_data.get("address", {})
-                if address.get("firstname"):
-                    return address.get("firstname")
-                
-                # Stap 2: Custom fields (uitgebreide lijst)
-                voornaam_fields = [
-                    "Voornaam", "Voor wie is dit lied?", "Voor wie", "Naam",
-                    "Voor wie is het lied?", "Wie is de ontvanger?", 
-                    "Naam ontvanger"
-                ]
-                for field_name in voornaam_fields:
-                    value = pick(field_name)
-                    if value:
-                        return value.split()[0]  # First word only for voornaam
-                
-                # Stap 3: Customer name (first word)
-                if customer.get("name"):
-                    return customer.get("name").split()[0]
-                
-                # Stap 4: Address full_name (first word)
-                if address.get("full_name"):
-                    return address.get("full_name").split()[0]
-                
-                return None
-            
-            # Temporarily disabled until voornaam column is added to database
-            # new_voornaam = get_voornaam()
-            # 
-            # if new_voornaam and new_voornaam != order.voornaam:
-            #     old_voornaam = order.voornaam or "None"
-            #     order.voornaam = new_voornaam
-            #     logger.info(f"Order {order.order_id}: Updated voornaam from '{old_voornaam}' to '{new_voornaam}'")
-            #     updated_count += 1
-        
-        # Commit changes
-        if updated_count > 0:
-            db.commit()
-            logger.info(f"Successfully updated {updated_count} orders")
-        else:
-            logger.info("No orders needed updating")
-        
+        progress = run_order_names_job(db, batch_size=batch_size, restart=restart)
         return UpdateResponse(
-            message=f"Successfully processed {len(orders)} orders",
-            updated_count=updated_count,
-            total_processed=len(orders)
+            message=f"Successfully processed {progress['processed']} orders",
+            updated_count=progress["updated"],
+            total_processed=progress["processed"]
         )
         
     except Exception as e:
@@ -540,55 +617,39 @@ async def update_order_names(
             detail=f"Error updating orders: {str(e)}"
         )
 
+@router.get("/update-names/status")
+def get_update_names_status(
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Geeft de voortgang van de (laatste) order names job terug.
+    
+    Vereist API-key authenticatie.
+    """
+    progress = get_order_names_progress(db)
+    if progress is None:
+        return {"status": "never_run"}
+    return {"status": "finished" if progress.get("finished_at") else "in_progress", **progress}
+
 @router.post("/link-upsell-orders", response_model=UpdateResponse)
-async def link_upsell_orders(
+def link_upsell_orders(
     db: Session = Depends(get_db),
     api_key: str = Depends(get_api_key)
 ):
     """
     Link bestaande UpSell orders aan hun originele orders en neem thema's over.
+    
+    Alle ongelinkte UpSells worden in één batch gematcht en met één bulk UPDATE
+    gekoppeld (zie link_upsells_in_bulk).
     """
     try:
-        # Haal alle UpSell orders op die nog niet gelinkt zijn
-        upsell_orders = db.query(Order).filter(
-            Order.origin_song_id.is_(None)  # Nog niet gelinkt
-        ).all()
-        
-        linked_count = 0
-        theme_inherited_count = 0
-        
-        for order in upsell_orders:
-            # Check of dit een UpSell order is
-            is_upsell = False
-            if order.raw_data and order.raw_data.get("products"):
-                for product in order.raw_data["products"]:
-                    pivot_type = product.get("pivot", {}).get("type")
-                    if pivot_type == "upsell":
-                        is_upsell = True
-                        break
-            
-            if is_upsell:
-                # Probeer originele order te vinden
-                original_order_id = find_original_order_for_upsell(db, order.raw_data)
-                
-                if original_order_id:
-                    order.origin_song_id = original_order_id
-                    linked_count += 1
-                    
-                    # Probeer thema over te nemen als de UpSell order geen thema heeft
-                    if not order.thema or order.thema == '-' or order.thema == 'Onbekend':
-                        if inherit_theme_from_original(db, order, original_order_id):
-                            theme_inherited_count += 1
-                    
-                    logger.info(f"UpSell order {order.order_id} gelinkt aan originele order {original_order_id}")
-        
-        # Commit alle wijzigingen
-        db.commit()
+        result = link_upsells_in_bulk(db)
         
         return UpdateResponse(
-            message=f"UpSell linking voltooid: {linked_count} orders gelinkt, {theme_inherited_count} thema's overgenomen",
-            updated_count=linked_count,
-            total_processed=len(upsell_orders)
+            message=f"UpSell linking voltooid: {result['linked']} orders gelinkt, {result['themes_inherited']} thema's overgenomen",
+            updated_count=result["linked"],
+            total_processed=result["processed"]
         )
         
     except Exception as e:
@@ -643,9 +704,9 @@ async def get_original_songtext(
                 detail=f"Originele order {upsell_order.origin_song_id} niet gevonden"
             )
         
-        # Haal de songtekst op uit raw_data
-        original_songtext = ""
-        if original_order.raw_data and original_order.raw_data.get('songtekst'):
+        # Huidige songtekst uit songtexts, anders een oude songtekst uit raw_data
+        original_songtext = original_order.songtekst or ""
+        if not original_songtext and original_order.raw_data and original_order.raw_data.get('songtekst'):
             original_songtext = original_order.raw_data['songtekst']
         
         return JSONResponse(
@@ -692,17 +753,12 @@ async def update_order_songtext(
         De bijgewerkte order
     """
     try:
-        order = crud.get_order(db, order_id)
+        order = crud.get_order(db, order_id, with_songtext=True)
         if not order:
             raise HTTPException(status_code=404, detail="Order niet gevonden")
         
-        # Update de songtekst - sla op in raw_data
-        if not order.raw_data:
-            order.raw_data = {}
-        order.raw_data['songtekst'] = request.songtekst
-        flag_modified(order, 'raw_data')
-        
-        db.commit()
+        # Nieuwe versie in songtexts; raw_data blijft ongewijzigd
+        save_songtext(db, order_id, request.songtekst, request.author)
         
         return JSONResponse(
             content=OrderRead.model_validate(order).model_dump(mode='json'),
@@ -720,6 +776,7 @@ async def update_order_songtext(
 
 @router.put("/{order_id}/songtext", response_model=OrderRead)
 async def update_songtext(
+    background_tasks: BackgroundTasks,
     order_id: int = Path(..., description="Order ID"),
     songtext_update: UpdateSongtextRequest = Body(...),
     db: Session = Depends(get_db),
@@ -727,24 +784,21 @@ async def update_songtext(
 ):
     """
     Update songtekst voor een order en synchroniseer naar gerelateerde UpSell orders.
+    
+    De synchronisatie naar de UpSells draait na de response (zie sync_songtext_to_upsells).
     """
     try:
         # Haal de order op
-        order = crud.get_order(db, order_id)
+        order = crud.get_order(db, order_id, with_songtext=True)
         if not order:
             raise HTTPException(status_code=404, detail="Order niet gevonden")
         
-        # Update de songtekst - sla op in raw_data
-        if not order.raw_data:
-            order.raw_data = {}
-        order.raw_data['songtekst'] = songtext_update.songtekst
-        
-        # Commit de wijziging
-        db.commit()
-        db.refresh(order)
+        # Nieuwe versie in songtexts; raw_data blijft ongewijzigd
+        save_songtext(db, order_id, songtext_update.songtekst, songtext_update.author)
         
-        # SYNCHRONISEER NAAR UPSELL ORDERS
-        await sync_songtext_to_upsells(db, order_id, songtext_update.songtekst)
+        # SYNCHRONISEER NAAR UPSELL ORDERS (na de response)
+        if songtext_update.sync_to_upsells:
+            background_tasks.add_task(sync_songtext_to_upsells, order_id, songtext_update.songtekst)
         
         return OrderRead.model_validate(order)
         
@@ -757,56 +811,105 @@ async def update_songtext(
             detail="Er is een fout opgetreden bij het updaten van de songtekst"
         )
 
-async def sync_songtext_to_upsells(db: Session, original_order_id: int, songtext: str):
+def _songtext_version_response(songtext) -> Dict[str, Any]:
+    """Zet een Songtext rij om naar de response van de songtekst-endpoints."""
+    return {
+        "order_id": songtext.order_id,
+        "version": songtext.version,
+        "songtekst": songtext.songtekst,
+        "author": songtext.author,
+        "created_at": songtext.created_at.isoformat() if songtext.created_at else None
+    }
+
+@router.get("/{order_id}/songtext")
+def get_songtext(
+    order_id: int = Path(..., description="Order ID"),
+    version: Optional[int] = Query(None, ge=1, description="Specifieke versie; standaard de huidige"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Haalt de huidige (of een specifieke) versie van de songtekst van een order op.
+    
+    Vereist API-key authenticatie.
+    """
+    songtext = get_songtext_version(db, order_id, version)
+    if songtext is None:
+        raise HTTPException(status_code=404, detail="Songtekst niet gevonden")
+    return _songtext_version_response(songtext)
+
+@router.get("/{order_id}/songtext/history")
+def get_songtext_history_endpoint(
+    order_id: int = Path(..., description="Order ID"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="Aantal versies per pagina"),
+    before_version: Optional[int] = Query(None, ge=1, description="Alleen versies ouder dan deze (volgende pagina)"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Geeft de versiegeschiedenis van de songtekst, nieuwste eerst, zonder de teksten zelf.
+    
+    Vereist API-key authenticatie.
+    """
+    versions = get_songtext_history(db, order_id, limit=limit, before_version=before_version)
+    return {
+        "order_id": order_id,
+        "versions": [
+            {**version, "created_at": version["created_at"].isoformat() if version["created_at"] else None}
+            for version in versions
+        ]
+    }
+
+@router.get("/{order_id}/songtext/diff")
+def get_songtext_diff(
+    order_id: int = Path(..., description="Order ID"),
+    from_version: int = Query(..., ge=1, description="Oude versie"),
+    to_version: int = Query(..., ge=1, description="Nieuwe versie"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Geeft een unified diff tussen twee versies van de songtekst.
+    
+    Vereist API-key authenticatie.
+    """
+    diff = diff_songtext_versions(db, order_id, from_version, to_version)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Songtekst versie niet gevonden")
+    return {"order_id": order_id, **diff}
+
+def sync_songtext_to_upsells(original_order_id: int, songtext: str):
     """
     Synchroniseer songtekst naar alle UpSell orders die gelinkt zijn aan deze originele order.
+    
+    Draait na de response met een eigen database sessie; fouten worden gelogd, want de
+    update van de originele order is dan al opgeslagen.
     """
+    from app.db.session import SessionLocal
+    
+    db = SessionLocal()
     try:
-        # Zoek alle UpSell orders die gelinkt zijn aan deze originele order
-        upsell_orders = db.query(Order).filter(
-            Order.origin_song_id == original_order_id
-        ).all()
-        
-        if not upsell_orders:
-            logger.info(f"Geen UpSell orders gevonden voor originele order {original_order_id}")
-            return
-        
-        # Update songtekst in alle UpSell orders
-        updated_count = 0
-        for upsell_order in upsell_orders:
-            # Alleen updaten als de UpSell order nog geen eigen songtekst heeft
-            # of als de songtekst leeg is
-            current_songtext = ""
-            if upsell_order.raw_data and upsell_order.raw_data.get('songtekst'):
-                current_songtext = upsell_order.raw_data['songtekst']
-            
-            if not current_songtext or current_songtext.strip() == "":
-                if not upsell_order.raw_data:
-                    upsell_order.raw_data = {}
-                upsell_order.raw_data['songtekst'] = songtext
-                flag_modified(upsell_order, 'raw_data')
-                updated_count += 1
-                logger.info(f"Songtekst gesynchroniseerd naar UpSell order {upsell_order.order_id}")
-        
-        if updated_count > 0:
-            db.commit()
-            logger.info(f"Songtekst gesynchroniseerd naar {updated_count} UpSell orders voor originele order {original_order_id}")
-        else:
-            logger.info(f"Geen UpSell orders bijgewerkt (alleen orders zonder bestaande songtekst)")
-            
+        propagate_songtext_to_upsells(db, original_order_id, songtext)
     except Exception as e:
+        db.rollback()
         logger.error(f"Fout bij synchroniseren songtekst naar UpSell orders: {str(e)}")
-        # Niet re-raise, want de originele update moet wel doorgaan
+    finally:
+        db.close()
 
 @router.get("/upsell-matches/{order_id}")
-async def get_upsell_matches(
+def get_upsell_matches(
     order_id: int = Path(..., description="UpSell order ID"),
+    refresh: bool = Query(False, description="Kandidaten opnieuw berekenen in plaats van de opgeslagen scores te gebruiken"),
     db: Session = Depends(get_db),
     api_key: str = Depends(get_api_key)
 ):
     """
     Haalt alle mogelijke matches op voor een UpSell order met confidence scores.
     Handig voor het reviewen van dubieuze matches.
+    
+    De scores komen uit upsell_link_candidates (gevuld door de linker); alleen als de
+    linker deze UpSell nog niet heeft gescoord (of bij refresh=true) worden ze berekend.
+    Kandidaten zijn orders van dezelfde klant (e-mail of naam) in de 7 dagen ervoor.
     """
     try:
         # Haal de UpSell order op
@@ -814,79 +917,25 @@ async def get_upsell_matches(
         if not upsell_order:
             raise HTTPException(status_code=404, detail="UpSell order niet gevonden")
         
-        # Check of dit een UpSell order is
-        is_upsell = False
-        if upsell_order.raw_data and upsell_order.raw_data.get("products"):
-            for product in upsell_order.raw_data["products"]:
-                pivot_type = product.get("pivot", {}).get("type")
-                if pivot_type == "upsell":
-                    is_upsell = True
-                    break
-        
-        if not is_upsell:
+        if not upsell_order.is_upsell:
             raise HTTPException(status_code=400, detail="Dit is geen UpSell order")
         
-        # Zoek alle mogelijke matches
-        from app.services.upsell_linking import calculate_linking_confidence
-        from datetime import datetime, timedelta
-        
-        # Haal klant informatie op
-        customer_email = None
-        customer_name = None
-        
-        if upsell_order.raw_data.get("customer", {}).get("email"):
-            customer_email = upsell_order.raw_data["customer"]["email"]
-        elif upsell_order.raw_data.get("address", {}).get("email"):
-            customer_email = upsell_order.raw_data["address"]["email"]
-        
-        if upsell_order.raw_data.get("address", {}).get("full_name"):
-            customer_name = upsell_order.raw_data["address"]["full_name"]
-        elif upsell_order.raw_data.get("customer", {}).get("name"):
-            customer_name = upsell_order.raw_data["customer"]["name"]
-        elif upsell_order.raw_data.get("address", {}).get("firstname"):
-            firstname = upsell_order.raw_data["address"]["firstname"]
-            lastname = upsell_order.raw_data["address"].get("lastname", "")
-            customer_name = f"{firstname} {lastname}".strip()
-        
-        # Zoek originele orders
-        search_start = upsell_order.bestel_datum - timedelta(days=7)
-        
-        potential_orders = db.query(Order).filter(
-            Order.bestel_datum >= search_start,
-            Order.bestel_datum < upsell_order.bestel_datum,
-            Order.order_id != order_id
-        ).all()
+        if refresh or not is_upsell_scored(db, order_id):
+            refresh_upsell_candidates(db, [order_id])
+        rows = get_stored_candidates(db, order_id)
         
-        matches = []
+        parsed = parse_upsell(upsell_order.raw_data or {"id": order_id})
+        customer_email, customer_name = parsed[1:] if parsed else (None, None)
         
-        for order in potential_orders:
-            if order.raw_data and order.raw_data.get("products"):
-                for product in order.raw_data["products"]:
-                    product_id = product.get("id")
-                    pivot_type = product.get("pivot", {}).get("type")
-                    
-                    if product_id in [274588, 289456] and pivot_type != "upsell":
-                        confidence = calculate_linking_confidence(
-                            upsell_order.raw_data, order, customer_email, customer_name, 
-                            upsell_order.bestel_datum, db
-                        )
-                        
-                        matches.append({
-                            "order_id": order.order_id,
-                            "klant_naam": order.klant_naam,
-                            "klant_email": order.klant_email,
-                            "voornaam": order.voornaam,
-                            "bestel_datum": order.bestel_datum.isoformat() if order.bestel_datum else None,
-                            "thema": order.thema,
-                            "product_naam": order.product_naam,
-                            "confidence": round(confidence, 1),
-                            "time_diff_hours": round((upsell_order.bestel_datum - order.bestel_datum).total_seconds() / 3600, 1) if order.bestel_datum else None,
-                            "is_currently_linked": order.order_id == upsell_order.origin_song_id
-                        })
-                        break
-        
-        # Sorteer op confidence
-        matches.sort(key=lambda x: x["confidence"], reverse=True)
+        matches = []
+        for row in rows:
+            match = _format_upsell_match(row)
+            match["time_diff_hours"] = (
+                round((upsell_order.bestel_datum - row.bestel_datum).total_seconds() / 3600, 1)
+                if upsell_order.bestel_datum and row.bestel_datum else None
+            )
+            match["is_currently_linked"] = row.order_id == upsell_order.origin_song_id
+            matches.append(match)
         
         return {
             "upsell_order": {
@@ -901,8 +950,8 @@ async def get_upsell_matches(
             },
             "matches": matches,
             "total_matches": len(matches),
-            "high_confidence_matches": len([m for m in matches if m["confidence"] > 70]),
-            "ambiguous_matches": len([m for m in matches if m["confidence"] > 50 and m["confidence"] <= 70])
+            "high_confidence_matches": len([m for m in matches if m["confidence"] > MIN_LINK_CONFIDENCE]),
+            "ambiguous_matches": len([m for m in matches if m["confidence"] > 50 and m["confidence"] <= MIN_LINK_CONFIDENCE])
         }
         
     except HTTPException:
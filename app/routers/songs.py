@@ -1,9 +1,13 @@
 import logging
 import os
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
 from app.schemas.song import SongRequest, PromptResponse
 from app.templates.prompt_templates import generate_prompt
 from app.auth.token import get_api_key
+from app.db.session import get_db
+from app.services.order_ingest import enqueue_order, order_ingest_worker
 
 # Configureer logging
 logging.basicConfig(level=logging.INFO)
@@ -42,17 +46,31 @@ async def generate_song_prompt(song_request: SongRequest, api_key: str = Depends
             detail="Er is een fout opgetreden bij het genereren van de prompt"
         )
 
-@router.post("/webhook")
-async def plugpay_webhook(request: Request):
+def _extract_webhook_order_id(payload: dict):
+    """Haalt het Plug&Pay order_id uit een webhook payload (order_id, id of data.id)."""
+    candidates = [payload.get("order_id"), payload.get("id")]
+    data = payload.get("data")
+    if isinstance(data, dict):
+        candidates.extend([data.get("order_id"), data.get("id")])
+    for candidate in candidates:
+        try:
+            return int(candidate)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+@router.post("/webhook", status_code=status.HTTP_202_ACCEPTED)
+async def plugpay_webhook(request: Request, db: Session = Depends(get_db)):
     """
     Webhook endpoint voor Plug&Pay bestellingen.
-    Ontvangt bestelgegevens en logt deze voor verdere verwerking.
+    Zet het order_id in de durable ingest-queue en antwoordt direct met 202;
+    de order-worker haalt daarna de volledige details op en slaat de bestelling op.
     
     Args:
         request: De FastAPI request met JSON payload van Plug&Pay
         
     Returns:
-        Een bevestiging dat de webhook is ontvangen
+        Een bevestiging dat de webhook is ontvangen (en of de order is ingepland)
         
     Voorbeeld van verwachte Plug&Pay JSON-payload:
     ```json
@@ -124,8 +142,6 @@ async def plugpay_webhook(request: Request):
             """
             logging.info(order_summary)
             
-            # TODO: genereer songtekst op basis van bestelling
-            
         except Exception as e:
             logging.error(f"Fout bij verwerken van ordergegevens: {str(e)}")
             # Ga door met de verwerking ondanks fouten bij het parsen
@@ -133,12 +149,26 @@ async def plugpay_webhook(request: Request):
         # Log de volledige payload voor debugging
         logging.debug(f"Volledige Plug&Pay webhook payload: {payload}")
         
-        # Hier kan in de toekomst meer logica worden toegevoegd:
-        # - Bestellingen opslaan in database
-        # - Notificaties versturen naar klant of beheerder
+        # Zet de bestelling in de ingest-queue; de worker doet de detail-fetch en upsert
+        webhook_order_id = _extract_webhook_order_id(payload)
+        if webhook_order_id is None:
+            logging.warning("Webhook ontvangen zonder geldig order_id, niets ingepland")
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content={"status": "ontvangen", "queued": False}
+            )
+        
+        stored_payload = {key: value for key, value in payload.items() if key != "secret"}
+        queued = enqueue_order(db, webhook_order_id, source="webhook", payload=stored_payload)
+        order_ingest_worker.kick()
         
         # Stuur een bevestiging terug
-        return {"status": "ontvangen"}
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"status": "ontvangen", "order_id": webhook_order_id, "queued": queued}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error bij verwerken van Plug&Pay webhook: {str(e)}")
         raise HTTPException(
@@ -12,6 +12,10 @@ from enum import Enum
 from datetime import datetime
 from dotenv import load_dotenv
 
+from app.config.feature_flags import should_cache_prompts
+from app.services.async_http import SharedClientSession
+from app.services.prompt_cache import prompt_cache, prompt_cache_key
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -27,6 +31,12 @@ except ImportError:
     HAS_AIOHTTP = False
     logger.warning("aiohttp not available, using synchronous requests")
 
+# Gedeelde keep-alive sessie: max. verbindingen (totaal en per host), keep-alive en DNS-cache (seconden)
+AI_HTTP_POOL_LIMIT = int(os.getenv("AI_HTTP_POOL_LIMIT", "20"))
+AI_HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("AI_HTTP_POOL_LIMIT_PER_HOST", "10"))
+AI_HTTP_KEEPALIVE = float(os.getenv("AI_HTTP_KEEPALIVE", "60"))
+AI_HTTP_DNS_TTL = int(os.getenv("AI_HTTP_DNS_TTL", "300"))
+
 class AIProvider(Enum):
     """Ondersteunde AI providers"""
     OPENAI = "openai"
@@ -47,15 +57,38 @@ class AIClient:
         # Default provider
         self.default_provider = self._determine_default_provider()
         
-        # API Endpoints
+        # Modellen (onderdeel van de prompt cache sleutel) en API Endpoints
+        self.models = {
+            AIProvider.GEMINI: "gemini-2.0-flash"
+        }
         self.endpoints = {
             AIProvider.OPENAI: "https://api.openai.com/v1/chat/completions",
             AIProvider.CLAUDE: "https://api.anthropic.com/v1/messages",
-            AIProvider.GEMINI: "https://generativelanguage.googleapis.com/v1/models/gemini-2.0-flash:generateContent"
+            AIProvider.GEMINI: f"https://generativelanguage.googleapis.com/v1/models/{self.models[AIProvider.GEMINI]}:generateContent"
         }
         
+        # Lopende API-calls per (order_id, prompt-hash), voor single-flight
+        self._inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        
+        # Eén sessie en connection pool voor alle calls naar de providers
+        self.http = SharedClientSession(
+            "AI providers",
+            limit=AI_HTTP_POOL_LIMIT,
+            limit_per_host=AI_HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=AI_HTTP_KEEPALIVE,
+            dns_cache_ttl=AI_HTTP_DNS_TTL
+        )
+        
         logger.info(f"AI Client initialized with provider: {self.default_provider}")
     
+    async def start(self) -> None:
+        """Maakt de gedeelde HTTP-sessie aan (bij het opstarten van de app)."""
+        await self.http.start()
+    
+    async def close(self) -> None:
+        """Sluit de gedeelde HTTP-sessie (bij het afsluiten van de app)."""
+        await self.http.close()
+    
     def _determine_default_provider(self) -> AIProvider:
         """Bepaal welke AI provider te gebruiken - alleen Gemini ondersteund"""
         if self.gemini_api_key:
@@ -134,16 +167,26 @@ class AIClient:
         prompt: str,
         provider: Optional[AIProvider] = None,
         max_tokens: int = 1500,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        use_cache: bool = True,
+        order_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Genereer een songtekst op basis van een prompt
         
+        Met FEATURE_PROMPT_CACHING komt een eerder resultaat voor dezelfde prompt en
+        instellingen uit de prompt cache (met "cached": True), zonder API-call.
+        Gelijktijdige identieke calls (zelfde order_id en prompt-hash) wachten op
+        één lopende API-call en krijgen allemaal het resultaat (met "coalesced": True
+        voor de meeliftende calls).
+        
         Args:
             prompt: De prompt voor de AI
             provider: Welke AI provider te gebruiken (default: auto)
             max_tokens: Maximum aantal tokens in response
             temperature: Creativiteit van de AI (0.0 - 1.0)
+            use_cache: False om de cache over te slaan (altijd een nieuw resultaat)
+            order_id: Optionele order waarvoor gegenereerd wordt (onderdeel van de single-flight sleutel)
         
         Returns:
             Dict met gegenereerde songtekst en metadata
@@ -158,39 +201,73 @@ class AIClient:
             logger.warning(f"No API key for {provider.value}, using dummy response")
             return await self._generate_dummy_songtext(prompt)
         
+        prompt_hash = prompt_cache_key(provider.value, self.models.get(provider), prompt, temperature, max_tokens)
+        cache_key = None
+        if use_cache and should_cache_prompts():
+            cache_key = prompt_hash
+            cached = await prompt_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Songtekst uit de prompt cache ({provider.value})")
+                return {**cached, "cached": True}
+        
+        # Single-flight: identieke calls die al lopen delen het resultaat
+        flight_key = f"{order_id if order_id is not None else '-'}:{prompt_hash}"
+        flight = self._inflight.get(flight_key)
+        if flight is not None:
+            logger.info(f"Identieke AI-call voor order {order_id} loopt al, wacht op het resultaat")
+            result = await asyncio.shield(flight)
+            return {**result, "coalesced": True}
+        
+        # De call draait als eigen task, zodat een afgebroken request de wachtenden niet meeneemt
+        flight = asyncio.ensure_future(self._request_songtext(prompt, provider, temperature, cache_key))
+        self._inflight[flight_key] = flight
+        flight.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+        return await asyncio.shield(flight)
+    
+    async def _request_songtext(
+        self,
+        prompt: str,
+        provider: AIProvider,
+        temperature: float,
+        cache_key: Optional[str]
+    ) -> Dict[str, Any]:
+        """Doet de eigenlijke API-call en slaat een geslaagd resultaat op in de prompt cache."""
         try:
-            async with aiohttp.ClientSession() as session:
-                # Build payload gebaseerd op provider - alleen Gemini ondersteund
-                if provider == AIProvider.GEMINI:
-                    payload = self._build_gemini_payload(prompt, temperature)
-                    url = f"{self.endpoints[provider]}?key={self.gemini_api_key}"
+            session = self.http.get()
+            # Build payload gebaseerd op provider - alleen Gemini ondersteund
+            if provider == AIProvider.GEMINI:
+                payload = self._build_gemini_payload(prompt, temperature)
+                url = f"{self.endpoints[provider]}?key={self.gemini_api_key}"
+            else:
+                raise ValueError(f"Unsupported provider: {provider}. Alleen Gemini wordt ondersteund.")
+            
+            headers = self._get_headers(provider)
+            
+            # Make API call
+            async with session.post(url, headers=headers, json=payload, timeout=30) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    songtext = self._extract_songtext_from_response(result, provider)
+                    
+                    generated = {
+                        "success": True,
+                        "songtext": songtext,
+                        "provider": provider.value,
+                        "tokens_used": self._extract_tokens_used(result, provider),
+                        "generated_at": datetime.now().isoformat(),
+                        "prompt_length": len(prompt)
+                    }
+                    if cache_key and not songtext.startswith("Error:"):
+                        await prompt_cache.set(cache_key, generated, provider.value, self.models.get(provider))
+                    return generated
                 else:
-                    raise ValueError(f"Unsupported provider: {provider}. Alleen Gemini wordt ondersteund.")
-                
-                headers = self._get_headers(provider)
-                
-                # Make API call
-                async with session.post(url, headers=headers, json=payload, timeout=30) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        songtext = self._extract_songtext_from_response(result, provider)
-                        
-                        return {
-                            "success": True,
-                            "songtext": songtext,
-                            "provider": provider.value,
-                            "tokens_used": self._extract_tokens_used(result, provider),
-                            "generated_at": datetime.now().isoformat(),
-                            "prompt_length": len(prompt)
-                        }
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"AI API error {response.status}: {error_text}")
-                        return {
-                            "success": False,
-                            "error": f"AI API returned status {response.status}",
-                            "provider": provider.value
-                        }
+                    error_text = await response.text()
+                    logger.error(f"AI API error {response.status}: {error_text}")
+                    return {
+                        "success": False,
+                        "error": f"AI API returned status {response.status}",
+                        "provider": provider.value
+                    }
         
         except asyncio.TimeoutError:
             logger.error("AI API request timed out")
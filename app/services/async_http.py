@@ -0,0 +1,109 @@
+"""
+Gedeelde aiohttp-sessie voor uitgaande calls vanaf de event loop.
+
+Een aiohttp.ClientSession per request kost elke keer een nieuwe connector, DNS-lookup,
+TCP- en TLS-handshake. SharedClientSession maakt de sessie één keer aan per event loop
+(bij het opstarten, of lazy bij de eerste call) en houdt de verbindingen open
+(keep-alive), met een DNS-cache en een limiet op het aantal verbindingen.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+# Configureer logging
+logger = logging.getLogger(__name__)
+
+
+class SharedClientSession:
+    """
+    Gedeelde aiohttp.ClientSession met een afgestelde TCPConnector.
+
+    De sessie hoort bij de event loop waarop hij is aangemaakt; draait de code op een
+    andere loop (bijv. in tests) of is hij gesloten, dan wordt een nieuwe gemaakt.
+    Via trace hooks wordt bijgehouden hoeveel requests een bestaande verbinding
+    hergebruikten (zie get_stats).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int = 20,
+        limit_per_host: int = 10,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: int = 300
+    ):
+        self.name = name
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {"requests": 0, "connections_opened": 0, "handshakes_saved": 0,
+                       "dns_lookups": 0, "dns_cache_hits": 0, "failed_requests": 0}
+
+    def _count(self, key: str):
+        async def hook(session, context, params):
+            self._stats[key] += 1
+        return hook
+
+    def _create_session(self) -> "aiohttp.ClientSession":
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl
+        )
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._count("requests"))
+        trace.on_request_exception.append(self._count("failed_requests"))
+        trace.on_connection_create_end.append(self._count("connections_opened"))
+        trace.on_connection_reuseconn.append(self._count("handshakes_saved"))
+        trace.on_dns_resolvehost_end.append(self._count("dns_lookups"))
+        trace.on_dns_cache_hit.append(self._count("dns_cache_hits"))
+        return aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+
+    def get(self) -> "aiohttp.ClientSession":
+        """Geeft de sessie voor de huidige event loop (moet vanuit een coroutine worden aangeroepen)."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = self._create_session()
+            self._loop = loop
+            logger.info(f"Gedeelde HTTP-sessie voor {self.name} aangemaakt")
+        return self._session
+
+    async def start(self) -> None:
+        """Maakt de sessie direct aan (bij het opstarten van de app) in plaats van bij de eerste call."""
+        if HAS_AIOHTTP:
+            self.get()
+
+    async def close(self) -> None:
+        """Sluit de sessie en alle open verbindingen."""
+        session, self._session, self._loop = self._session, None, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Geeft tellers terug over het gebruik van de sessie.
+
+        Returns:
+            dict: requests, failed_requests, connections_opened, handshakes_saved
+                  (requests die een bestaande keep-alive verbinding hergebruikten),
+                  dns_lookups, dns_cache_hits, idle_connections en de limieten
+        """
+        stats = dict(self._stats)
+        connector = self._session.connector if self._session is not None and not self._session.closed else None
+        # Verbindingen die in de pool klaarstaan voor hergebruik
+        stats["idle_connections"] = sum(len(conns) for conns in connector._conns.values()) if connector else 0
+        stats["limit"] = self.limit
+        stats["limit_per_host"] = self.limit_per_host
+        return stats
@@ -0,0 +1,214 @@
+"""
+Music Tasks Service
+
+Deze module houdt de status van Suno muziektaken bij in de music_tasks-tabel.
+De tabel wordt gevuld door /suno-callback (en als vangnet door een poll bij Suno);
+status-requests lezen de rij via de unieke index op task_id en vragen Suno alleen
+om de status als een lopende taak al een tijd niets van zich heeft laten horen.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models.music_task import MusicTask
+from app.services.suno_client import SUNO_FAILED_STATUSES
+
+# Configureer logging
+logger = logging.getLogger(__name__)
+
+# Een lopende taak zonder update in deze periode (seconden) wordt bij het opvragen bij Suno gecontroleerd
+MUSIC_TASK_STALE_AFTER = timedelta(seconds=int(os.getenv("MUSIC_TASK_STALE_AFTER", "60")))
+
+# Volgorde van de Suno statussen; een status gaat nooit terug
+STATUS_RANK = {"PENDING": 0, "TEXT_SUCCESS": 1, "FIRST_SUCCESS": 2, "SUCCESS": 3}
+
+# callbackType van Suno -> status
+CALLBACK_STATUSES = {"text": "TEXT_SUCCESS", "first": "FIRST_SUCCESS", "complete": "SUCCESS"}
+
+
+def is_terminal(status: Optional[str]) -> bool:
+    """Of de taak klaar is (gelukt of mislukt)."""
+    return status == "SUCCESS" or status in SUNO_FAILED_STATUSES
+
+
+def _rank(status: Optional[str]) -> int:
+    return STATUS_RANK["SUCCESS"] if status in SUNO_FAILED_STATUSES else STATUS_RANK.get(status, 0)
+
+
+def _normalize_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    """Zet een track uit een callback (snake_case) of status-poll (camelCase) om naar één vorm."""
+    return {
+        "id": track.get("id"),
+        "title": track.get("title"),
+        "audio_url": track.get("audio_url") or track.get("audioUrl"),
+        "stream_url": track.get("stream_url") or track.get("stream_audio_url") or track.get("streamAudioUrl"),
+        "image_url": track.get("image_url") or track.get("imageUrl"),
+        "duration": track.get("duration"),
+        "model_name": track.get("model_name") or track.get("modelName"),
+        "tags": track.get("tags"),
+        "create_time": track.get("create_time") or track.get("createTime"),
+    }
+
+
+def create_music_task(db: Session, task_id: str, order_id: Optional[int] = None) -> None:
+    """
+    Legt een ingediende taak vast (idempotent; een al bestaande rij krijgt alleen de order_id).
+
+    Args:
+        db: SQLAlchemy database sessie
+        task_id: Suno taskId
+        order_id: Optionele Plug&Pay order_id waarvoor de muziek is
+    """
+    table = MusicTask.__table__
+    stmt = pg_insert(table).values(
+        task_id=task_id,
+        order_id=order_id,
+        status="PENDING",
+        status_history=[{"status": "PENDING", "source": "submit", "at": datetime.utcnow().isoformat()}],
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.task_id],
+        set_={"order_id": func.coalesce(table.c.order_id, stmt.excluded.order_id)},
+    )
+    db.execute(stmt)
+    db.commit()
+
+
+def get_music_task(db: Session, task_id: str) -> Optional[MusicTask]:
+    """Haalt een taak op via de unieke index op task_id."""
+    return db.query(MusicTask).filter(MusicTask.task_id == task_id).first()
+
+
+def is_stale(task: MusicTask, now: Optional[datetime] = None) -> bool:
+    """Of een lopende taak al MUSIC_TASK_STALE_AFTER geen update meer heeft gehad."""
+    if is_terminal(task.status):
+        return False
+    return (now or datetime.utcnow()) - task.updated_at >= MUSIC_TASK_STALE_AFTER
+
+
+def _lock_task(db: Session, task_id: str) -> MusicTask:
+    """
+    Haalt de rij van een taak op met een row lock en maakt hem zo nodig eerst aan.
+
+    Een onbekende taak wordt net als in create_music_task met INSERT ... ON CONFLICT
+    DO NOTHING aangemaakt, zodat gelijktijdige callers niet allebei een rij toevoegen.
+    """
+    query = db.query(MusicTask).filter(MusicTask.task_id == task_id)
+    task = query.with_for_update().first()
+    if task is None:
+        now = datetime.utcnow()
+        stmt = pg_insert(MusicTask.__table__).values(
+            task_id=task_id, status="PENDING", status_history=[], created_at=now, updated_at=now
+        ).on_conflict_do_nothing(index_elements=[MusicTask.__table__.c.task_id])
+        db.execute(stmt)
+        task = query.with_for_update().first()
+    return task
+
+
+def record_task_status(
+    db: Session,
+    task_id: str,
+    status: str,
+    tracks: Optional[List[Dict[str, Any]]] = None,
+    error: Optional[str] = None,
+    source: str = "callback",
+) -> MusicTask:
+    """
+    Verwerkt een statusupdate voor een taak.
+
+    De rij wordt gelockt (en zo nodig aangemaakt) zodat gelijktijdige callbacks
+    elkaar niet overschrijven. Een status die lager is dan de huidige (bijv. een
+    late "text"-callback na "complete") wordt genegeerd; een nieuwe status wordt
+    aan status_history toegevoegd. updated_at wordt altijd bijgewerkt, zodat een poll zonder
+    nieuws de taak ook weer even als actueel markeert.
+
+    Returns:
+        MusicTask: De bijgewerkte taak
+    """
+    task = _lock_task(db, task_id)
+    now = datetime.utcnow()
+
+    if not is_terminal(task.status) and _rank(status) >= _rank(task.status):
+        if status != task.status:
+            task.status_history = list(task.status_history or []) + [
+                {"status": status, "source": source, "at": now.isoformat()}
+            ]
+            task.status = status
+            logger.info(f"Muziektaak {task_id}: status {status} ({source})")
+        if tracks:
+            task.tracks = [_normalize_track(track) for track in tracks]
+        if error:
+            task.error = error
+        if is_terminal(status):
+            task.completed_at = now
+    task.updated_at = now
+    db.commit()
+    return task
+
+
+def apply_suno_callback(db: Session, payload: Dict[str, Any]) -> Optional[MusicTask]:
+    """
+    Verwerkt een callback van Suno.
+
+    Suno stuurt {"code", "msg", "data": {"callbackType", "task_id", "data": [tracks]}};
+    de oudere platte vorm met callbackType/taskId op het hoogste niveau wordt ook
+    geaccepteerd.
+
+    Alleen taken die al in music_tasks staan (aangemaakt bij het indienen) worden
+    bijgewerkt; een callback voor een onbekende task_id wordt genegeerd.
+
+    Returns:
+        MusicTask, of None als de callback geen (bekende) task_id bevat
+    """
+    data = payload.get("data") if isinstance(payload.get("data"), dict) else payload
+    task_id = data.get("task_id") or data.get("taskId") or payload.get("taskId")
+    if not task_id:
+        logger.warning("Suno callback zonder task_id ontvangen")
+        return None
+    if get_music_task(db, task_id) is None:
+        logger.warning(f"Suno callback voor onbekende taak {task_id} genegeerd")
+        return None
+
+    callback_type = data.get("callbackType") or payload.get("callbackType")
+    code = payload.get("code", 200)
+    tracks = data.get("data") if isinstance(data.get("data"), list) else None
+    if code != 200 or callback_type == "error":
+        return record_task_status(db, task_id, "GENERATE_AUDIO_FAILED", tracks, error=payload.get("msg"))
+    status = CALLBACK_STATUSES.get(callback_type)
+    if status is None:
+        logger.warning(f"Onbekend Suno callbackType '{callback_type}' voor taak {task_id}")
+        return get_music_task(db, task_id)
+    return record_task_status(db, task_id, status, tracks)
+
+
+def record_polled_status(db: Session, task_id: str, result: Dict[str, Any]) -> Optional[MusicTask]:
+    """Slaat het resultaat van SunoClient.get_task_status op (alleen bij een geslaagde poll)."""
+    if not result.get("success") or not result.get("status"):
+        return None
+    return record_task_status(db, task_id, result["status"], result.get("tracks"), source="poll")
+
+
+def music_task_response(task: MusicTask) -> Dict[str, Any]:
+    """Zet een taak om naar het antwoord van /suno-status (zelfde vorm als SunoClient.get_task_status)."""
+    response = {
+        "success": True,
+        "status": task.status,
+        "task_id": task.task_id,
+        "order_id": task.order_id,
+        "updated_at": task.updated_at.isoformat() if task.updated_at else None,
+    }
+    if task.tracks:
+        response["tracks"] = task.tracks
+    else:
+        response["message"] = f"Task status: {task.status}"
+    if task.error:
+        response["error"] = task.error
+    return response
@@ -0,0 +1,303 @@
+"""
+Order Derivation Service
+
+Deze module bevat de afleiding van weergavevelden (klantnaam, voornaam, thema,
+deadline, ...) uit raw_data. De afgeleide waarden worden bij het
+opslaan van een order berekend en in de kolommen derived/derived_version
+bewaard, zodat OrderRead ze niet bij elke request opnieuw hoeft af te leiden.
+
+Verhoog DERIVER_VERSION als de regels hieronder veranderen en draai daarna
+`python cli.py backfill-derived` om bestaande orders opnieuw af te leiden.
+
+Deze module heeft bewust geen database-imports, zodat de schemas hem kunnen gebruiken.
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.services.order_extraction import extract_order_fields
+
+# Configureer logging
+logger = logging.getLogger(__name__)
+
+# Versie van de afleidingsregels; orders met een andere derived_version worden opnieuw afgeleid
+DERIVER_VERSION = 3
+
+# Velden van OrderRead die (naast raw_data) door de afleiding gevuld kunnen worden.
+# De songtekst hoort er niet bij: die komt uit de songtexts-tabel (Order.songtekst)
+# en een oude songtekst in raw_data wordt bij het lezen aangevuld (fill_legacy_songtext)
+DERIVED_FIELDS = (
+    "klant_naam", "klant_email", "product_naam", "bestel_datum",
+    "status", "voornaam", "van_naam", "relatie", "datum",
+    "thema", "toon", "structuur", "rijm", "beschrijving", "deadline", "typeOrder",
+)
+
+# Markering in de validator-values dat de opgeslagen afleiding al is toegepast
+DERIVED_APPLIED_KEY = "__derived_applied__"
+
+# Kolommen waarvan een wijziging een nieuwe afleiding vereist
+DERIVATION_INPUTS = (
+    "raw_data", "klant_naam", "voornaam", "klant_email", "product_naam", "bestel_datum",
+    "thema", "toon", "structuur", "beschrijving", "deadline", "typeOrder",
+)
+
+
+def detect_order_type(raw_data: dict) -> str:
+    """Detect order type based on product information."""
+    products = raw_data.get("products", [])
+    
+    if not products:
+        return "Onbekend"
+    
+    # Debug logging
+    logger.debug(f"Detecting order type for {len(products)} products")
+    
+    # Find the main product (highest priority)
+    main_order_type = None
+    additional_types = []
+    
+    for product in products:
+        product_id = product.get("id")
+        pivot_type = product.get("pivot", {}).get("type")
+        title = product.get("title", "") or product.get("name", "")
+        
+        logger.debug(f"Product: id={product_id}, pivot_type={pivot_type}, title='{title}'")
+        
+        # Determine product type and priority
+        order_type = None
+        priority = 0
+        
+        # Main products (highest priority)
+        if product_id == 274588:
+            order_type = "Standaard 72u"
+            priority = 100
+        elif product_id == 289456:
+            order_type = "Spoed 24u"
+            priority = 200
+        # Upsells
+        elif pivot_type == "upsell":
+            if product_id == 294847:
+                order_type = "Revisie"
+            elif product_id == 299107:
+                order_type = "Soundtrack Bundel"
+            elif product_id == 299088:
+                order_type = "Extra Coupletten"
+            else:
+                order_type = "Upsell"
+            priority = 50
+        # Order-bumps
+        elif pivot_type == "order-bump":
+            if product_id == 294792:
+                order_type = "Karaoke Track"
+            elif product_id == 299891:
+                order_type = "Engelstalig"
+            else:
+                order_type = "Order-bump"
+            priority = 30
+        # Fallback based on title analysis
+        else:
+            title_lower = title.lower()
+            if "24" in title or "24u" in title_lower or "24 u" in title_lower or "spoed" in title_lower:
+                order_type = "Spoed 24u"
+                priority = 200
+            elif "72" in title or "72u" in title_lower or "72 u" in title_lower or "standaard" in title_lower:
+                order_type = "Standaard 72u"
+                priority = 100
+            else:
+                # Als we geen specifieke match hebben, probeer te raden op basis van titel
+                if "songtekst" in title_lower or "lied" in title_lower:
+                    order_type = "Standaard 72u"  # Default voor songtekst orders
+                    priority = 100
+                else:
+                    order_type = "Onbekend"
+                    priority = 0
+        
+        logger.debug(f"Determined: order_type='{order_type}', priority={priority}")
+        
+        # Keep track of main order type (highest priority)
+        if order_type and (not main_order_type or priority > main_order_type[1]):
+            if main_order_type:
+                additional_types.append(main_order_type[0])
+            main_order_type = (order_type, priority)
+        elif order_type:
+            additional_types.append(order_type)
+    
+    # Return combined type if we have additional types
+    if main_order_type:
+        result = main_order_type[0]
+        if additional_types:
+            result = f"{result} + {', '.join(additional_types)}"
+        logger.debug(f"Final order type: '{result}'")
+        return result
+    
+    logger.debug("No order type detected, returning 'Onbekend'")
+    return "Onbekend"
+
+
+def fill_legacy_songtext(values: Dict[str, Any]) -> None:
+    """Vult een ontbrekende songtekst aan met een oude songtekst uit raw_data."""
+    raw = values.get("raw_data") or {}
+    if not values.get("songtekst") and raw.get("songtekst"):
+        values["songtekst"] = raw["songtekst"]
+
+
+def derive_order_fields(values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Leidt velden af uit raw_data.custom_field_inputs voor oudere records.
+    
+    Args:
+        values: Dict met de veldwaarden van de order (inclusief raw_data); wordt aangevuld
+        
+    Returns:
+        dict: Dezelfde dict met de afgeleide waarden ingevuld
+    """
+    # Zorg ervoor dat raw_data een dict is
+    raw = values.get("raw_data") or {}
+    if raw is None:
+        raw = {}
+    values["raw_data"] = raw
+    
+    # Alle waarden uit raw_data in één keer via de gedeelde extractie
+    extracted = extract_order_fields(raw)
+    
+    # Vul ontbrekende velden in
+    for field in ("thema", "toon", "structuur", "beschrijving", "relatie", "rijm"):
+        values.setdefault(field, extracted[field])
+    
+    # Detect order type based on products
+    order_type = detect_order_type(raw)
+    values.setdefault("typeOrder", order_type)
+    
+    if not values.get("voornaam"):
+        values.setdefault("voornaam", extracted["voornaam"])
+    
+    if not values.get("klant_naam"):
+        values.setdefault("klant_naam", extracted["klant_naam"])
+    
+    values.setdefault("achternaam", extracted["achternaam"])
+    
+    # Datum uit custom fields, anders uit created_at
+    if not values.get("datum") and (extracted["datum"] or raw.get("created_at")):
+        values["datum"] = extracted["datum"] or raw.get("created_at")
+    
+    # Songtekst uit raw_data halen
+    fill_legacy_songtext(values)
+    
+    # Fallbacks voor kritieke DB-velden
+    products = raw.get("products", [])
+    if values.get("product_naam") is None and products and len(products) > 0:
+        first_product = products[0]
+        values["product_naam"] = first_product.get("title") or first_product.get("name") or "Onbekend product"
+    
+    if values.get("bestel_datum") is None:
+        # Probeer ISO-date uit raw_data.created_at
+        iso = raw.get("created_at")
+        if not iso and products and len(products) > 0:
+            # Anders uit eerste product.created_at
+            iso = products[0].get("created_at")
+        if iso:
+            values["bestel_datum"] = iso  # laat Pydantic casten
+    
+    # deadline afleiden uit product-titel, blijft optioneel
+    if not values.get("deadline") and products and len(products) > 0:
+        title = products[0].get("title", "")
+        if isinstance(title, str) and "Binnen" in title and "uur" in title:
+            values["deadline"] = title.replace("Songtekst - ", "")
+    
+    return values
+
+
+def _jsonable(value: Any) -> Any:
+    """Zet datetimes om naar ISO-strings voor opslag in JSONB."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def compute_derived(order: Any) -> Dict[str, Any]:
+    """
+    Berekent de afgeleide velden van een Order object zoals OrderRead ze zou tonen.
+    
+    Alleen velden waarvan de afgeleide waarde afwijkt van de kolomwaarde worden
+    bewaard; bij het lezen vullen ze lege kolommen aan.
+    
+    Args:
+        order: Order object (of ander object met dezelfde attributen)
+        
+    Returns:
+        dict: veldnaam -> afgeleide waarde (JSON-serialiseerbaar)
+    """
+    original = {field: getattr(order, field, None) for field in DERIVED_FIELDS}
+    values = dict(original)
+    values["raw_data"] = getattr(order, "raw_data", None)
+    derive_order_fields(values)
+    return {
+        field: _jsonable(values[field])
+        for field in DERIVED_FIELDS
+        if values.get(field) is not None and values.get(field) != original[field]
+    }
+
+
+def apply_derived(order: Any) -> None:
+    """Berekent de afgeleide velden en slaat ze op in order.derived met de huidige versie."""
+    try:
+        order.derived = compute_derived(order)
+        order.derived_version = DERIVER_VERSION
+    except Exception as e:
+        # Nooit het opslaan van een order blokkeren; OrderRead leidt dan live af
+        logger.warning(f"Afleiden van velden mislukt voor order {getattr(order, 'order_id', None)}: {str(e)}")
+        order.derived = None
+        order.derived_version = None
+
+
+def stored_derived(order: Any) -> Optional[Dict[str, Any]]:
+    """
+    Geeft de opgeslagen afgeleide velden terug als ze bij de huidige DERIVER_VERSION horen.
+    
+    Returns:
+        dict of None: None als de order (nog) niet of met oude regels is afgeleid
+    """
+    derived = getattr(order, "derived", None)
+    if getattr(order, "derived_version", None) != DERIVER_VERSION or not isinstance(derived, dict):
+        return None
+    return derived
+
+
+def backfill_derived_fields(db, batch_size: int = 500, force: bool = False) -> int:
+    """
+    Leidt de velden opnieuw af voor orders met een verouderde (of ontbrekende) derived_version.
+    
+    Verwerkt de orders in batches op volgorde van id en commit per batch, zodat
+    het commando veilig opnieuw gestart kan worden.
+    
+    Args:
+        db: SQLAlchemy database sessie
+        batch_size: Aantal orders per batch
+        force: Alle orders opnieuw afleiden, ook als de versie al klopt
+        
+    Returns:
+        int: Aantal bijgewerkte orders
+    """
+    from app.models.order import Order
+
+    updated = 0
+    last_id = 0
+    while True:
+        query = db.query(Order).filter(Order.id > last_id)
+        if not force:
+            query = query.filter(Order.derived_version.is_distinct_from(DERIVER_VERSION))
+        batch = query.order_by(Order.id).limit(batch_size).all()
+        if not batch:
+            break
+        
+        for order in batch:
+            apply_derived(order)
+        # Vóór de commit uitlezen; daarna is het object verlopen en kost het een extra query
+        last_id = batch[-1].id
+        db.commit()
+        
+        updated += len(batch)
+        logger.info(f"Afgeleide velden bijgewerkt voor {updated} orders (t/m id {last_id})")
+    
+    return updated
@@ -0,0 +1,255 @@
+"""
+Order Extraction Service
+
+Deze module bevat de gedeelde extractie van orderwaarden (klantnaam, voornaam,
+thema, toon, ...) uit een Plug&Pay payload. Eerder stond dezelfde logica in vier
+licht verschillende kopieën (Order.build_from_plugpay_data, OrderRead, het
+/orders/update-names endpoint en read_order); nu gebruiken ze allemaal deze module.
+
+De labeltabellen en regexes worden één keer bij het importeren opgebouwd. Per
+order worden de custom fields in één doorloop via één label -> veld tabel
+toegewezen, in plaats van per veld opnieuw door lijsten met labels te zoeken.
+
+Deze module heeft bewust geen database-imports, zodat modellen en schemas hem kunnen gebruiken.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Custom field labels per veld, in volgorde van prioriteit (eerste gevonden label wint)
+FIELD_LABELS: Dict[str, Tuple[str, ...]] = {
+    # Naam van de ontvanger; gebruikt voor voornaam en als basis voor klant_naam
+    "voornaam": (
+        "Voornaam", "Voor wie is dit lied?", "Voor wie", "Naam",
+        "Voor wie is het lied?", "Wie is de ontvanger?", "Naam ontvanger",
+    ),
+    "klant_naam": ("Klant naam",),
+    "achternaam": ("Achternaam", "Van", "Familienaam", "Laatste naam"),
+    "relatie": ("Relatie", "Wat is je relatie tot deze persoon?", "Hoe ken je deze persoon?"),
+    "datum": ("Datum", "Wanneer", "Wanneer is de gelegenheid?", "Wanneer moet het lied klaar zijn?"),
+    "thema": (
+        "Vertel over de gelegenheid", "Thema", "Gelegenheid", "Voor welke gelegenheid",
+        "Voor welke gelegenheid?", "Waarvoor is dit lied?", "Gewenste stijl",
+    ),
+    "toon": ("Toon", "Sfeer", "Gewenste toon", "Stijl"),
+    "structuur": ("Structuur", "Song structuur", "Opbouw"),
+    "rijm": ("Rijm", "Rijmschema"),
+    "beschrijving": (
+        "Beschrijf", "Persoonlijk verhaal", "Vertel iets over deze persoon", "Toelichting",
+        "Vertel over de persoon", "Vertel over deze persoon", "Vertel over je wensen",
+        "Vertel over je ideeën", "Vertel je verhaal", "Vertel meer", "Vertel",
+    ),
+    "type_order": ("Type order",),
+}
+
+# Omgekeerde tabel: label -> (veld, prioriteit); één dict-lookup per custom field
+LABEL_TABLE: Dict[str, Tuple[str, int]] = {
+    label: (field, priority)
+    for field, labels in FIELD_LABELS.items()
+    for priority, label in enumerate(labels)
+}
+
+# Alle velden die extract_order_fields teruggeeft
+EXTRACTED_FIELDS = tuple(FIELD_LABELS)
+
+# Patronen om een naam uit de beschrijving te halen ("voor Anna", "Piet heet", ...)
+_DESCRIPTION_NAME_PATTERNS = tuple(
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r'\bvoor\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)?)\b',
+        r'\baan\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)?)\b',
+        r'\b([A-Z][a-zA-Z]+)\s+heet\b',
+        r'\bheet\s+([A-Z][a-zA-Z]+)\b',
+    )
+)
+_NAME_STOPWORDS = frozenset(("het", "de", "een", "mijn", "zijn", "haar"))
+
+# Hoofdproducten (Standaard 72u en Spoed 24u); alleen deze orders kunnen een UpSell-origineel zijn
+MAIN_PRODUCT_IDS = (274588, 289456)
+
+# Placeholder e-mail voor orders zonder klant-e-mail; telt niet als klantsleutel
+UNKNOWN_EMAIL = "onbekend@example.com"
+
+
+def _text(value: Any) -> Optional[str]:
+    """Geeft een gestripte, niet-lege string terug of None."""
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return None
+
+
+def collect_custom_fields(raw: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Verzamelt de custom fields van een order als label -> waarde.
+
+    Plug&Pay levert ze op root-niveau (name/value, legacy) en per product
+    (label/input); productwaarden gaan voor bij een dubbel label.
+
+    Args:
+        raw: De raw_data van de order
+
+    Returns:
+        dict: label -> waarde
+    """
+    custom: Dict[str, str] = {}
+    for field in raw.get("custom_field_inputs") or []:
+        if isinstance(field, dict):
+            name = field.get("name") or field.get("label")
+            value = field.get("value") or field.get("input")
+            if name and value:
+                custom[name] = value
+    for product in raw.get("products") or []:
+        if not isinstance(product, dict):
+            continue
+        for field in product.get("custom_field_inputs") or []:
+            if isinstance(field, dict):
+                name = field.get("label") or field.get("name")
+                value = field.get("input") or field.get("value")
+                if name and value:
+                    custom[name] = value
+    return custom
+
+
+def _map_custom_fields(custom: Dict[str, str]) -> Dict[str, Optional[str]]:
+    """Wijst custom fields in één doorloop toe aan velden volgens LABEL_TABLE."""
+    best: Dict[str, Tuple[int, str]] = {}
+    for label, value in custom.items():
+        entry = LABEL_TABLE.get(label)
+        if entry is None:
+            continue
+        text = _text(value)
+        if text is None:
+            continue
+        field, priority = entry
+        if field not in best or priority < best[field][0]:
+            best[field] = (priority, text)
+    return {field: best[field][1] if field in best else None for field in FIELD_LABELS}
+
+
+def _name_from_description(beschrijving: Optional[str]) -> Optional[str]:
+    """Zoekt een naam in de beschrijving ("voor Anna", "aan Piet", ...)."""
+    if not beschrijving or len(beschrijving) <= 10:
+        return None
+    for pattern in _DESCRIPTION_NAME_PATTERNS:
+        match = pattern.search(beschrijving)
+        if match:
+            name = match.group(1).strip()
+            if len(name) > 1 and name.lower() not in _NAME_STOPWORDS:
+                return name
+    return None
+
+
+def _name_from_product_title(products: List[Any]) -> Optional[str]:
+    """Haalt een naam uit een producttitel als "... voor Anna" (laatste redmiddel)."""
+    if not products or not isinstance(products[0], dict):
+        return None
+    product_title = products[0].get("title") or ""
+    if "voor" not in product_title.lower():
+        return None
+    parts = product_title.lower().split("voor")
+    if len(parts) > 1 and len(parts[1].strip()) > 2:
+        potential_name = parts[1].strip().title()
+        if len(potential_name) < 30:  # Redelijke naam lengte
+            return potential_name
+    return None
+
+
+def extract_order_fields(raw: Optional[Dict[str, Any]]) -> Dict[str, Optional[str]]:
+    """
+    Haalt alle afleidbare orderwaarden uit een Plug&Pay payload.
+
+    klant_naam volgt het 6-staps systeem (address.full_name, address first+last name,
+    customer.name, custom fields, beschrijving, producttitel) en voornaam het 4-staps
+    systeem (address.firstname, custom fields, customer.name, address.full_name).
+
+    Args:
+        raw: De raw_data van de order (mag None zijn)
+
+    Returns:
+        dict: Waarde (of None) voor elk veld in EXTRACTED_FIELDS
+    """
+    raw = raw if isinstance(raw, dict) else {}
+    fields = _map_custom_fields(collect_custom_fields(raw))
+
+    address = raw.get("address") or {}
+    customer = raw.get("customer") or {}
+    firstname = _text(address.get("firstname"))
+    lastname = _text(address.get("lastname"))
+    full_name = _text(address.get("full_name"))
+    customer_name = _text(customer.get("name"))
+    recipient = fields["voornaam"]
+
+    # Voornaam: 4-staps systeem, steeds alleen het eerste woord
+    voornaam = firstname
+    if not voornaam:
+        source = recipient or customer_name or full_name
+        voornaam = source.split()[0] if source else None
+
+    # Klantnaam: 6-staps systeem
+    if full_name:
+        klant_naam = full_name
+    elif firstname:
+        klant_naam = f"{firstname} {lastname}" if lastname else firstname
+    elif customer_name:
+        klant_naam = customer_name
+    elif recipient or fields["klant_naam"]:
+        name = recipient or fields["klant_naam"]
+        klant_naam = f"{name} {fields['achternaam']}" if fields["achternaam"] else name
+    else:
+        klant_naam = (
+            _name_from_description(fields["beschrijving"])
+            or _name_from_product_title(raw.get("products") or [])
+        )
+
+    fields["voornaam"] = voornaam
+    fields["klant_naam"] = klant_naam
+    fields["achternaam"] = lastname or fields["achternaam"]
+    return fields
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Geeft het e-mailadres in kleine letters zonder witruimte terug (None voor leeg of de placeholder)."""
+    email = _text(email)
+    if not email:
+        return None
+    email = email.lower()
+    return None if email == UNKNOWN_EMAIL else email
+
+
+def _is_upsell_product(product: Dict[str, Any]) -> bool:
+    return (product.get("pivot") or {}).get("type") == "upsell"
+
+
+def is_upsell_order(raw: Optional[Dict[str, Any]]) -> bool:
+    """Geeft aan of de order een product met pivot type "upsell" bevat."""
+    raw = raw if isinstance(raw, dict) else {}
+    return any(
+        isinstance(product, dict) and _is_upsell_product(product)
+        for product in raw.get("products") or []
+    )
+
+
+def primary_product_id(raw: Optional[Dict[str, Any]]) -> Optional[int]:
+    """
+    Bepaalt het primaire product van een order.
+
+    Upsell-producten tellen niet mee. Voorkeur heeft een hoofdproduct (MAIN_PRODUCT_IDS),
+    anders het eerste overige product; een order met alleen upsells heeft geen primair
+    product. Een order is dus een mogelijk UpSell-origineel precies als
+    primary_product_id in MAIN_PRODUCT_IDS ligt.
+    """
+    raw = raw if isinstance(raw, dict) else {}
+    first_id = None
+    for product in raw.get("products") or []:
+        if not isinstance(product, dict) or _is_upsell_product(product):
+            continue
+        try:
+            product_id = int(product.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if product_id in MAIN_PRODUCT_IDS:
+            return product_id
+        if first_id is None:
+            first_id = product_id
+    return first_id
@@ -0,0 +1,325 @@
+"""
+Order Ingest Service
+
+Deze module bevat de durable ingest-queue voor Plug&Pay bestellingen. De webhook
+zet alleen het order_id in de queue en antwoordt direct; een achtergrond-worker
+haalt daarna de details op en slaat ze op via de bulk upsert.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.crud.order import bulk_upsert_orders
+from app.models.order_ingest import OrderIngestJob
+
+# Configureer logging
+logger = logging.getLogger(__name__)
+
+# Configuratie van de worker
+ORDER_INGEST_WORKER_ENABLED = os.getenv("ORDER_INGEST_WORKER_ENABLED", "true").lower() == "true"
+ORDER_INGEST_POLL_INTERVAL = float(os.getenv("ORDER_INGEST_POLL_INTERVAL", "30"))
+ORDER_INGEST_BATCH_SIZE = int(os.getenv("ORDER_INGEST_BATCH_SIZE", "50"))
+ORDER_INGEST_MAX_ATTEMPTS = int(os.getenv("ORDER_INGEST_MAX_ATTEMPTS", "5"))
+ORDER_INGEST_RETRY_DELAY = int(os.getenv("ORDER_INGEST_RETRY_DELAY", "30"))  # Seconden, verdubbelt per poging
+
+# Jobs die langer dan dit op "processing" staan (bijv. na een crash) worden opnieuw opgepakt
+ORDER_INGEST_STALE_AFTER = timedelta(minutes=int(os.getenv("ORDER_INGEST_STALE_MINUTES", "10")))
+
+
+def enqueue_order(
+    db: Session, order_id: int, source: str = "webhook", payload: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Zet een bestelling in de ingest-queue.
+
+    Een order die al op "pending" staat wordt niet dubbel toegevoegd. Een eerder
+    verwerkte of mislukte order wordt opnieuw ingepland, zodat wijzigingen die
+    Plug&Pay opnieuw meldt ook worden opgehaald. Wordt de order op dit moment
+    verwerkt, dan heeft de worker mogelijk de oude details al opgehaald; de job
+    krijgt dan de requeue-markering en wordt na afloop opnieuw ingepland.
+
+    Args:
+        db: SQLAlchemy database sessie
+        order_id: Het Plug&Pay order_id
+        source: Bron van de job (bijv. "webhook")
+        payload: Optionele ontvangen payload (ter diagnose)
+
+    Returns:
+        bool: True als de order (opnieuw) is ingepland, False als hij al in de queue stond
+    """
+    now = datetime.utcnow()
+    table = OrderIngestJob.__table__
+    processing = table.c.status == OrderIngestJob.STATUS_PROCESSING
+    stmt = pg_insert(table).values(
+        order_id=order_id,
+        status=OrderIngestJob.STATUS_PENDING,
+        source=source,
+        payload=payload,
+        attempts=0,
+        available_at=now,
+        created_at=now,
+        updated_at=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.order_id],
+        set_={
+            # Een job in verwerking houdt zijn status en pogingen; de worker plant hem
+            # na afloop opnieuw in (zie process_pending_jobs)
+            "status": case((processing, table.c.status), else_=OrderIngestJob.STATUS_PENDING),
+            "requeue": processing,
+            "source": stmt.excluded.source,
+            "payload": stmt.excluded.payload,
+            "attempts": case((processing, table.c.attempts), else_=0),
+            "last_error": case((processing, table.c.last_error), else_=None),
+            "available_at": now,
+            "updated_at": case((processing, table.c.updated_at), else_=now)
+        },
+        where=table.c.status.in_([
+            OrderIngestJob.STATUS_PROCESSING, OrderIngestJob.STATUS_DONE, OrderIngestJob.STATUS_FAILED
+        ])
+    ).returning(table.c.id)
+
+    queued = db.execute(stmt).first() is not None
+    db.commit()
+
+    if queued:
+        logger.info(f"Bestelling {order_id} in de ingest-queue gezet (bron: {source})")
+    else:
+        logger.info(f"Bestelling {order_id} stond al in de ingest-queue")
+    return queued
+
+
+def claim_jobs(db: Session, limit: int = ORDER_INGEST_BATCH_SIZE) -> List[OrderIngestJob]:
+    """
+    Pakt openstaande jobs op met FOR UPDATE SKIP LOCKED, zodat meerdere workers
+    (bijv. meerdere app-instanties) nooit dezelfde job verwerken.
+
+    Args:
+        db: SQLAlchemy database sessie
+        limit: Maximaal aantal jobs
+
+    Returns:
+        list: De geclaimde jobs (status "processing")
+    """
+    now = datetime.utcnow()
+    jobs = (
+        db.query(OrderIngestJob)
+        .filter(
+            or_(
+                (OrderIngestJob.status == OrderIngestJob.STATUS_PENDING) & (OrderIngestJob.available_at <= now),
+                (OrderIngestJob.status == OrderIngestJob.STATUS_PROCESSING)
+                & (OrderIngestJob.updated_at < now - ORDER_INGEST_STALE_AFTER)
+            )
+        )
+        .order_by(OrderIngestJob.id)
+        .with_for_update(skip_locked=True)
+        .limit(limit)
+        .all()
+    )
+
+    for job in jobs:
+        job.status = OrderIngestJob.STATUS_PROCESSING
+        job.attempts = (job.attempts or 0) + 1
+        job.requeue = False
+        job.updated_at = now
+    db.commit()
+    return jobs
+
+
+def _mark_failed(job: OrderIngestJob, error: str) -> None:
+    """Plant een mislukte job opnieuw in met exponentiële backoff, of markeert hem definitief als mislukt."""
+    job.last_error = error[:2000]
+    job.updated_at = datetime.utcnow()
+    if job.attempts >= ORDER_INGEST_MAX_ATTEMPTS:
+        job.status = OrderIngestJob.STATUS_FAILED
+        logger.error(f"Bestelling {job.order_id} definitief mislukt na {job.attempts} pogingen: {error}")
+    else:
+        job.status = OrderIngestJob.STATUS_PENDING
+        job.available_at = datetime.utcnow() + timedelta(seconds=ORDER_INGEST_RETRY_DELAY * 2 ** (job.attempts - 1))
+        logger.warning(f"Bestelling {job.order_id} mislukt (poging {job.attempts}), opnieuw ingepland: {error}")
+
+
+def _requeue(job: OrderIngestJob) -> None:
+    """Plant een job direct opnieuw in omdat er tijdens de verwerking een nieuwe webhook binnenkwam."""
+    job.status = OrderIngestJob.STATUS_PENDING
+    job.requeue = False
+    job.attempts = 0
+    job.available_at = datetime.utcnow()
+    job.updated_at = job.available_at
+    logger.info(f"Bestelling {job.order_id} gewijzigd tijdens verwerking, opnieuw ingepland")
+
+
+def process_pending_jobs(db: Session, limit: int = ORDER_INGEST_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Verwerkt één batch openstaande jobs: details parallel ophalen en in één bulk upsert opslaan.
+
+    Args:
+        db: SQLAlchemy database sessie
+        limit: Maximaal aantal jobs in deze batch
+
+    Returns:
+        dict: Aantallen per uitkomst (claimed, done, retry, failed, requeued)
+    """
+    # Lazy import om een circulaire import met plugpay_client te voorkomen
+    from app.services.plugpay_client import fetch_order_details_concurrently, _normalize_order_payload
+
+    jobs = claim_jobs(db, limit)
+    result = {"claimed": len(jobs), "done": 0, "retry": 0, "failed": 0, "requeued": 0}
+    if not jobs:
+        return result
+
+    jobs_by_order = {job.order_id: job for job in jobs}
+    payloads = []
+    errors: Dict[int, str] = {}
+
+    for order_id, order_details, error in fetch_order_details_concurrently(list(jobs_by_order)):
+        if error is not None:
+            errors[order_id] = f"Detail-fetch mislukt: {error}"
+            continue
+        try:
+            payload = _normalize_order_payload(order_id, order_details)
+            payload["id"] = order_id
+            payloads.append(payload)
+        except Exception as e:
+            errors[order_id] = f"Ongeldige order details: {e}"
+
+    statuses = bulk_upsert_orders(db, payloads) if payloads else {}
+
+    # Vergrendel de jobs en lees de requeue-markering opnieuw: een webhook die tijdens
+    # de verwerking binnenkwam wacht nu op deze transactie of heeft de markering al gezet
+    requeued = {
+        job.order_id for job in db.query(OrderIngestJob)
+        .filter(OrderIngestJob.order_id.in_(list(jobs_by_order)))
+        .with_for_update()
+        .populate_existing()
+        .all()
+        if job.requeue
+    }
+
+    now = datetime.utcnow()
+    for order_id, job in jobs_by_order.items():
+        status = statuses.get(order_id)
+        if order_id in requeued:
+            _requeue(job)
+            result["requeued"] += 1
+        elif order_id in errors or status in (None, "error"):
+            _mark_failed(job, errors.get(order_id, "Opslaan in de database mislukt"))
+            if job.status == OrderIngestJob.STATUS_FAILED:
+                result["failed"] += 1
+            else:
+                result["retry"] += 1
+        else:
+            job.status = OrderIngestJob.STATUS_DONE
+            job.last_error = None
+            job.processed_at = now
+            job.updated_at = now
+            result["done"] += 1
+    db.commit()
+
+    logger.info(f"Ingest-batch verwerkt: {result}")
+    return result
+
+
+def get_queue_stats(db: Session) -> Dict[str, int]:
+    """
+    Geeft het aantal jobs per status terug.
+
+    Returns:
+        dict: status -> aantal
+    """
+    rows = db.query(OrderIngestJob.status, func.count(OrderIngestJob.id)).group_by(OrderIngestJob.status).all()
+    stats = {status: 0 for status in (
+        OrderIngestJob.STATUS_PENDING, OrderIngestJob.STATUS_PROCESSING,
+        OrderIngestJob.STATUS_DONE, OrderIngestJob.STATUS_FAILED
+    )}
+    stats.update({status: count for status, count in rows})
+    return stats
+
+
+class OrderIngestWorker:
+    """
+    Achtergrond-worker die de ingest-queue leegt.
+
+    De worker draait als asyncio-task binnen de applicatie. Hij wordt direct gewekt
+    via kick() als de webhook een order in de queue zet, en pollt daarnaast elke
+    ORDER_INGEST_POLL_INTERVAL seconden voor retries en jobs van andere instanties.
+    Het eigenlijke werk (HTTP en database) draait in een thread zodat de event loop
+    niet blokkeert.
+    """
+
+    def __init__(self, poll_interval: float = ORDER_INGEST_POLL_INTERVAL, batch_size: int = ORDER_INGEST_BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start de worker op de huidige event loop."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Order ingest worker gestart")
+
+    async def stop(self) -> None:
+        """Stopt de worker en wacht tot de lopende batch klaar is."""
+        if not self.running:
+            return
+        self._stopping = True
+        self.kick()
+        try:
+            await asyncio.wait_for(self._task, timeout=30)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        logger.info("Order ingest worker gestopt")
+
+    def kick(self) -> None:
+        """Wekt de worker direct (thread-safe)."""
+        if self._wakeup is None or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _process_batch(self) -> Dict[str, int]:
+        """Verwerkt één batch met een eigen database sessie (draait in een thread)."""
+        from app.db.session import SessionLocal
+
+        db = SessionLocal()
+        try:
+            return process_pending_jobs(db, self.batch_size)
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                result = await asyncio.to_thread(self._process_batch)
+                # Volle batch: direct door met de volgende
+                if result["claimed"] >= self.batch_size:
+                    continue
+            except Exception as e:
+                logger.error(f"Fout in order ingest worker: {str(e)}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+# Globale worker instantie
+order_ingest_worker = OrderIngestWorker()
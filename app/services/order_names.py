@@ -0,0 +1,147 @@
+"""
+Order Names Service
+
+Deze module bevat de batch-job die klantnamen van bestaande orders opnieuw afleidt
+met de gedeelde extractie. De job loopt in vaste batches op volgorde van primary key
+door de orders, schrijft wijzigingen per batch terug met één
+UPDATE ... FROM (VALUES ...) en bewaart na elke batch zijn positie in sync_state,
+zodat hij na een onderbreking verder kan waar hij gebleven was.
+"""
+
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, String, column, select, update, values
+from sqlalchemy.orm import Session
+
+from app.models.order import Order
+from app.models.sync_state import SyncState
+from app.models.upsell_link_candidate import UpsellLinkCandidate
+from app.services.order_extraction import extract_order_fields
+from app.services.upsell_linking import invalidate_candidates_for_new_orders
+
+# Configureer logging
+logger = logging.getLogger(__name__)
+
+# Aantal orders per batch
+ORDER_NAMES_BATCH_SIZE = int(os.getenv("ORDER_NAMES_BATCH_SIZE", "500"))
+
+# Sleutel in sync_state voor de voortgang van de job
+ORDER_NAMES_STATE_KEY = "order_names_update"
+
+
+def _bulk_update_names(db: Session, changes: List[Tuple[int, str]]) -> int:
+    """
+    Schrijft gewijzigde klantnamen terug met één UPDATE ... FROM (VALUES ...).
+
+    De Core UPDATE slaat de mapper events over; derived_version wordt daarom op NULL
+    gezet zodat de afgeleide velden van deze orders als verouderd gelden, en de
+    opgeslagen UpSell kandidaten van deze orders worden verwijderd (klant_naam telt
+    mee in de score).
+    """
+    if not changes:
+        return 0
+    table = Order.__table__
+    new_names = values(
+        column("id", Integer), column("klant_naam", String), name="new_names"
+    ).data(changes)
+    stmt = (
+        update(table)
+        .values(klant_naam=new_names.c.klant_naam, derived_version=None)
+        .where(table.c.id == new_names.c.id)
+    )
+    updated = db.execute(stmt).rowcount
+    
+    changed_order_ids = select(table.c.order_id).where(table.c.id.in_([row_id for row_id, _ in changes]))
+    connection = db.connection()
+    UpsellLinkCandidate.invalidate(connection, changed_order_ids)
+    invalidate_candidates_for_new_orders(connection, changed_order_ids)
+    return updated
+
+
+def get_order_names_progress(db: Session) -> Optional[Dict[str, Any]]:
+    """
+    Geeft de opgeslagen voortgang van de job terug.
+
+    Returns:
+        dict: last_id, processed, updated, started_at en finished_at, of None als de job nooit heeft gedraaid
+    """
+    return SyncState.get_value(db, ORDER_NAMES_STATE_KEY)
+
+
+def run_order_names_job(
+    db: Session,
+    batch_size: Optional[int] = None,
+    restart: bool = False,
+    max_batches: Optional[int] = None,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Leidt de klantnamen van alle orders opnieuw af, batch voor batch.
+
+    Per batch worden alleen id, klant_naam en raw_data opgehaald (geen ORM-objecten
+    in de identity map), de namen in één doorloop geëxtraheerd en de wijzigingen
+    samen met de nieuwe positie in één transactie gecommit. Het geheugengebruik is
+    daardoor onafhankelijk van de grootte van de tabel.
+
+    Args:
+        db: SQLAlchemy database sessie
+        batch_size: Aantal orders per batch (default: ORDER_NAMES_BATCH_SIZE)
+        restart: Opnieuw bij het begin beginnen in plaats van verder te gaan
+        max_batches: Stop na dit aantal batches (de job kan later worden hervat)
+        progress_callback: Optionele functie die na elke batch de voortgang krijgt
+
+    Returns:
+        dict: De voortgang (last_id, processed, updated, started_at, finished_at)
+    """
+    batch_size = batch_size or ORDER_NAMES_BATCH_SIZE
+    progress = None if restart else get_order_names_progress(db)
+    if not progress or progress.get("finished_at"):
+        progress = {
+            "last_id": 0,
+            "processed": 0,
+            "updated": 0,
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+        }
+    else:
+        logger.info(f"Order names job hervat vanaf id {progress['last_id']}")
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = (
+            db.query(Order.id, Order.klant_naam, Order.raw_data)
+            .filter(Order.id > progress["last_id"])
+            .order_by(Order.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            progress["finished_at"] = datetime.utcnow().isoformat()
+            SyncState.set_value(db, ORDER_NAMES_STATE_KEY, progress)
+            break
+
+        changes = []
+        for row in rows:
+            new_klant_naam = extract_order_fields(row.raw_data)["klant_naam"]
+            if row.raw_data and new_klant_naam and new_klant_naam != row.klant_naam:
+                changes.append((row.id, new_klant_naam))
+
+        updated = _bulk_update_names(db, changes)
+        progress["last_id"] = rows[-1].id
+        progress["processed"] += len(rows)
+        progress["updated"] += updated
+        SyncState.set_value(db, ORDER_NAMES_STATE_KEY, progress, commit=False)
+        db.commit()
+        batches += 1
+
+        logger.info(
+            f"Order names job: {progress['processed']} orders verwerkt, "
+            f"{progress['updated']} bijgewerkt (t/m id {progress['last_id']})"
+        )
+        if progress_callback:
+            progress_callback(dict(progress))
+
+    return progress
@@ -8,12 +8,19 @@ om ordergegevens op te halen en te verwerken.
 import os
 import logging
 import json
+import threading
+import time
+from datetime import datetime, timezone
 import requests
-from typing import Any, Dict, List, Set, Tuple, Union
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 
+from app.crud.order import ORDER_UPSERT_BATCH_SIZE, bulk_upsert_orders
 from app.models.order import Order
+from app.models.sync_state import SyncState
 
 # Laad environment variables
 load_dotenv()
@@ -21,6 +28,17 @@ load_dotenv()
 # Configureer logging
 logger = logging.getLogger(__name__)
 
+# Maximaal aantal bestellingen waarvan tegelijk details worden opgehaald
+PLUGPAY_FETCH_CONCURRENCY = int(os.getenv("PLUGPAY_FETCH_CONCURRENCY", "8"))
+
+# Maximaal aantal pagina's dat een incrementele sync doorloopt
+PLUGPAY_SYNC_MAX_PAGES = int(os.getenv("PLUGPAY_SYNC_MAX_PAGES", "50"))
+
+PLUGPAY_ORDERS_URL = "https://api.plugandpay.nl/v1/orders"
+
+# Sleutel in de sync_state tabel voor de high-water mark van de order-sync
+ORDER_SYNC_STATE_KEY = "plugpay_orders"
+
 
 def to_safe_json(data: Any) -> Any:
     """
@@ -124,6 +142,146 @@ class PlugPayAPIError(Exception):
     """Exception voor fouten bij het aanroepen van de Plug&Pay API."""
     pass
 
+
+class PlugPaySession:
+    """
+    Gedeelde HTTP-sessie voor alle calls naar de Plug&Pay API.
+    
+    Houdt verbindingen open (keep-alive) zodat niet elke request een nieuwe TCP+TLS
+    handshake kost, begrenst het aantal verbindingen per host, past standaard timeouts
+    toe en probeert requests opnieuw met exponentiële backoff bij 429/5xx-responses
+    en verbindingsfouten.
+    """
+    
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    MAX_RETRY_AFTER = 30.0
+    
+    def __init__(
+        self,
+        pool_maxsize: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_factor: Optional[float] = None,
+        timeout: Optional[Tuple[float, float]] = None
+    ):
+        self.pool_maxsize = pool_maxsize or int(os.getenv("PLUGPAY_POOL_MAXSIZE", str(max(PLUGPAY_FETCH_CONCURRENCY * 2, 10))))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("PLUGPAY_MAX_RETRIES", "3"))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("PLUGPAY_RETRY_BACKOFF", "0.5"))
+        self.timeout = timeout or (
+            float(os.getenv("PLUGPAY_CONNECT_TIMEOUT", "5")),
+            float(os.getenv("PLUGPAY_READ_TIMEOUT", "30"))
+        )
+        self._session: Optional[requests.Session] = None
+        self._adapter: Optional[HTTPAdapter] = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failed_requests": 0}
+    
+    def _get_session(self) -> requests.Session:
+        """Maakt de onderliggende requests.Session lazy aan."""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    # pool_block zorgt ervoor dat er nooit meer dan pool_maxsize
+                    # verbindingen per host openstaan; retries doen we zelf
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize,
+                                          pool_block=True, max_retries=0)
+                    session = requests.Session()
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._adapter = adapter
+                    self._session = session
+        return self._session
+    
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+    
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Bepaalt de wachttijd voor een retry; respecteert Retry-After bij een 429."""
+        if response is not None and response.headers.get("Retry-After"):
+            try:
+                return min(float(response.headers["Retry-After"]), self.MAX_RETRY_AFTER)
+            except ValueError:
+                pass
+        return self.backoff_factor * (2 ** attempt)
+    
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, **kwargs) -> requests.Response:
+        """
+        Voert een GET-request uit via de gedeelde sessie.
+        
+        Args:
+            url: De volledige URL
+            headers: Request headers (inclusief Authorization)
+            **kwargs: Extra argumenten voor requests (bijv. params of timeout)
+            
+        Returns:
+            requests.Response: De laatste response (ook als die na alle retries nog een fout is)
+            
+        Raises:
+            requests.exceptions.RequestException: Als de verbinding na alle retries blijft falen
+        """
+        session = self._get_session()
+        kwargs.setdefault("timeout", self.timeout)
+        
+        for attempt in range(self.max_retries + 1):
+            self._count("requests")
+            try:
+                response = session.get(url, headers=headers, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self._count("failed_requests")
+                    raise
+                delay = self._retry_delay(attempt, None)
+                logger.warning(f"Plug&Pay verbindingsfout ({e}), nieuwe poging over {delay:.1f}s")
+            else:
+                if response.status_code not in self.RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if response.status_code >= 400:
+                        self._count("failed_requests")
+                    return response
+                delay = self._retry_delay(attempt, response)
+                logger.warning(f"Plug&Pay API gaf status {response.status_code}, nieuwe poging over {delay:.1f}s")
+                response.close()
+            
+            self._count("retries")
+            time.sleep(delay)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Geeft tellers terug over het gebruik van de sessie.
+        
+        Returns:
+            dict: requests, retries, failed_requests, connections_opened en handshakes_saved
+                  (requests die een bestaande keep-alive verbinding hergebruikten)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        
+        connections_opened = 0
+        pool_requests = 0
+        if self._adapter is not None:
+            pools = self._adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections_opened += pool.num_connections
+                    pool_requests += pool.num_requests
+        
+        stats["connections_opened"] = connections_opened
+        stats["handshakes_saved"] = max(pool_requests - connections_opened, 0)
+        stats["pool_maxsize"] = self.pool_maxsize
+        return stats
+    
+    def close(self) -> None:
+        """Sluit alle open verbindingen."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._adapter = None
+
+
+# Gedeelde sessie voor alle Plug&Pay calls in deze module
+plugpay_session = PlugPaySession()
+
 def get_api_key():
     """
     Haalt de Plug&Pay API-key op uit de environment variables.
@@ -140,10 +298,14 @@ def get_api_key():
         raise PlugPayAPIError("Plug&Pay API-key is niet geconfigureerd")
     return api_key
 
-def get_recent_orders():
+def get_recent_orders(page: Optional[int] = None, url: Optional[str] = None):
     """
     Haalt recente bestellingen op van de Plug&Pay API.
     
+    Args:
+        page: Optioneel paginanummer (default: eerste pagina)
+        url: Optionele volledige URL, bijvoorbeeld de "next" link uit een vorige response
+    
     Returns:
         dict: JSON-response van de API als Python-object
         
@@ -155,7 +317,10 @@ def get_recent_orders():
         api_key = get_api_key()
         
         # Definieer de API-endpoint
-        url = "https://api.plugandpay.nl/v1/orders"
+        if not url:
+            url = PLUGPAY_ORDERS_URL
+            if page and page > 1:
+                url = f"{url}?page={page}"
         
         # Stel de headers in met de Bearer token
         headers = {
@@ -164,8 +329,8 @@ def get_recent_orders():
         }
         
         # Doe het GET-verzoek
-        logger.info("Ophalen van recente bestellingen van Plug&Pay API")
-        response = requests.get(url, headers=headers)
+        logger.info(f"Ophalen van recente bestellingen van Plug&Pay API ({url})")
+        response = plugpay_session.get(url, headers=headers)
         
         # Controleer of het verzoek succesvol was
         response.raise_for_status()
@@ -187,6 +352,56 @@ def get_recent_orders():
         logger.error(f"Onverwachte fout bij het ophalen van bestellingen: {str(e)}")
         raise PlugPayAPIError(f"Onverwachte fout bij het ophalen van bestellingen: {str(e)}")
 
+def _next_page_url(orders_response: Dict[str, Any], current_page: int) -> Optional[str]:
+    """
+    Bepaalt de URL van de volgende pagina uit een (Laravel-achtige) paginated response.
+    
+    Returns:
+        str of None: De URL van de volgende pagina, of None als dit de laatste pagina is
+    """
+    links = orders_response.get("links") or {}
+    if isinstance(links, dict) and links.get("next"):
+        return links["next"]
+    
+    meta = orders_response.get("meta") or {}
+    if isinstance(meta, dict):
+        last_page = meta.get("last_page")
+        page = meta.get("current_page", current_page)
+        if last_page and page and int(page) < int(last_page):
+            return f"{PLUGPAY_ORDERS_URL}?page={int(page) + 1}"
+    
+    return None
+
+def iter_order_pages(max_pages: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Loopt door alle pagina's van de Plug&Pay orders-endpoint (nieuwste eerst).
+    
+    De aanroeper kan de generator op elk moment stoppen, bijvoorbeeld zodra een
+    pagina alleen nog bestellingen bevat die al gesynchroniseerd zijn.
+    
+    Args:
+        max_pages: Maximaal aantal pagina's (default: PLUGPAY_SYNC_MAX_PAGES)
+        
+    Yields:
+        list: De order-samenvattingen van één pagina
+    """
+    max_pages = max_pages or PLUGPAY_SYNC_MAX_PAGES
+    url = None
+    
+    for page in range(1, max_pages + 1):
+        orders_response = get_recent_orders(url=url)
+        orders = orders_response.get("data", [])
+        if not orders:
+            return
+        
+        yield orders
+        
+        url = _next_page_url(orders_response, page)
+        if not url:
+            return
+    
+    logger.warning(f"Maximum van {max_pages} pagina's bereikt tijdens het doorlopen van Plug&Pay bestellingen")
+
 def get_custom_fields(order_data, api_headers=None):
     """
     Haalt custom fields op uit order data met een robuuste fallback-strategie.
@@ -336,7 +551,7 @@ def get_custom_fields(order_data, api_headers=None):
         try:
             # Doe een GET-call naar de checkout endpoint
             checkout_url = f"https://api.plugandpay.nl/v1/checkouts/{checkout_id}?include=custom_field_inputs,custom_fields"
-            checkout_response = requests.get(checkout_url, headers=api_headers)
+            checkout_response = plugpay_session.get(checkout_url, headers=api_headers)
             checkout_response.raise_for_status()
             checkout_data = checkout_response.json()
             
@@ -452,19 +667,22 @@ def get_order_details(order_id):
         
         logger.info(f"Ophalen van details voor bestelling {order_id} via v1 en v2 API")
         
-        # Stap 1: Haal v1 data op (bevat address en basis order info)
         v1_url = f"https://api.plugandpay.nl/v1/orders/{order_id}?include=custom_field_inputs,products,address"
-        v1_response = requests.get(v1_url, headers=headers_v1)
-        v1_response.raise_for_status()
-        v1_data = v1_response.json()
+        v2_url = f"https://api.plugandpay.nl/v2/orders/{order_id}?include=custom_fields,items,products"
         
-        logger.info(f"Order {order_id}: v1 API data opgehaald - address: {'address' in v1_data}")
+        def fetch_json(url, headers):
+            response = plugpay_session.get(url, headers=headers)
+            response.raise_for_status()
+            return response.json()
         
-        # Stap 2: Haal v2 data op (bevat uitgebreide custom fields in items)
-        v2_url = f"https://api.plugandpay.nl/v2/orders/{order_id}?include=custom_fields,items,products"
-        v2_response = requests.get(v2_url, headers=headers_v2)
-        v2_response.raise_for_status()
-        v2_api_response = v2_response.json()
+        # Stap 1 + 2: Haal v1 data (address en basis order info) en v2 data (uitgebreide
+        # custom fields in items) parallel op; de v2-call loopt in een aparte thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            v2_future = executor.submit(fetch_json, v2_url, headers_v2)
+            v1_data = fetch_json(v1_url, headers_v1)
+            v2_api_response = v2_future.result()
+        
+        logger.info(f"Order {order_id}: v1 API data opgehaald - address: {'address' in v1_data}")
         
         if "data" not in v2_api_response:
             logger.error(f"Order {order_id}: Onverwachte v2 API response structuur")
@@ -549,14 +767,215 @@ def get_order_details(order_id):
         raise PlugPayAPIError(f"Onverwachte fout bij het ophalen van bestelling {order_id}: {str(e)}")
 
 
-def fetch_and_store_recent_orders(db_session: Session):
+def fetch_order_details_concurrently(
+    order_ids: Iterable[Any], max_workers: Optional[int] = None
+) -> Iterator[Tuple[Any, Optional[Dict[str, Any]], Optional[Exception]]]:
+    """
+    Haalt de details van meerdere bestellingen parallel op via een begrensde thread-pool.
+    
+    De resultaten worden doorgegeven zodra ze binnenkomen (niet in de oorspronkelijke
+    volgorde), zodat de aanroeper ze direct kan verwerken terwijl de overige requests
+    nog lopen.
+    
+    Args:
+        order_ids: De Plug&Pay order IDs waarvan details opgehaald moeten worden
+        max_workers: Maximaal aantal gelijktijdige bestellingen (default: PLUGPAY_FETCH_CONCURRENCY)
+        
+    Yields:
+        tuple: (order_id, order_details, fout) - order_details is None als er een fout optrad
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    
+    workers = max(1, min(max_workers or PLUGPAY_FETCH_CONCURRENCY, len(order_ids)))
+    logger.info(f"Details ophalen voor {len(order_ids)} bestellingen met {workers} parallelle workers")
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(get_order_details, order_id): order_id for order_id in order_ids}
+        for future in as_completed(futures):
+            order_id = futures[future]
+            try:
+                yield order_id, future.result(), None
+            except Exception as e:
+                yield order_id, None, e
+
+
+def _normalize_order_payload(order_id: Any, order_details: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Controleert de opgehaalde details van één bestelling en maakt ze JSON-safe
+    voor opslag in raw_data.
+    
+    Returns:
+        dict: De genormaliseerde payload (of een minimale payload bij serialisatiefouten)
+    """
+    # Debug logging om te zien welke keys beschikbaar zijn in order_details
+    logger.debug(f"Order {order_id} detail keys: {list(order_details.keys())}")
+
+    # Gebruik de nieuwe get_custom_fields functie om alle custom fields te verzamelen
+    custom_fields_dict = get_custom_fields(order_details)
+    has_custom_fields = len(custom_fields_dict) > 0
+    
+    # Log de gevonden custom fields voor debugging
+    logger.debug(f"Order {order_id} custom fields: {custom_fields_dict}")
+
+    has_products = "products" in order_details and len(order_details.get("products", [])) > 0
+    
+    if not has_custom_fields:
+        logger.warning(f"Geen custom fields gevonden voor bestelling {order_id} via alle beschikbare paden")
+        
+    if not has_products:
+        logger.warning(f"Geen products gevonden voor bestelling {order_id}")
+        
+    if not has_custom_fields or not has_products:
+        logger.warning(f"Onvolledige data voor bestelling {order_id}: custom_fields={has_custom_fields}, products={has_products}")
+    
+    try:
+        # Gebruik dump_safe_json om de order_details veilig te serialiseren
+        payload = json.loads(dump_safe_json(order_details))
+    except Exception as e:
+        logger.warning(f"Fout bij serialiseren van order {order_id} voor raw_data: {e}")
+        # Behoud de essentiële velden
+        payload = json.loads(dump_safe_json({
+            "id": order_details.get("id"),
+            "customer": order_details.get("customer", {}),
+            "products": order_details.get("products", []),
+            "created_at": order_details.get("created_at")
+        }))
+    
+    if not payload.get("id"):
+        payload["id"] = order_id
+    return payload
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """Zet een ISO-8601 timestamp uit de Plug&Pay API om naar een naive UTC datetime."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _normalize_order_id(order_id: Any) -> Any:
+    """Zet numerieke order IDs om naar int zodat ze vergelijkbaar zijn met Order.order_id."""
+    try:
+        return int(order_id)
+    except (TypeError, ValueError):
+        return order_id
+
+
+def _collect_incremental_order_ids(
+    db_session: Session, cursor: Optional[Dict[str, Any]]
+) -> Tuple[List[Any], int, int, Dict[str, Any]]:
+    """
+    Loopt de orderpagina's door sinds de opgeslagen cursor en bepaalt van welke
+    bestellingen de details (opnieuw) opgehaald moeten worden.
+    
+    Een bestelling wordt overgeslagen als hij al in de database staat en de
+    updated_at uit de samenvatting gelijk is aan die in de opgeslagen raw_data.
+    Omdat de API de nieuwste bestellingen eerst teruggeeft, stopt het doorlopen
+    na de eerste pagina met een bestelling die ouder is dan de cursor.
+    
+    Args:
+        db_session: SQLAlchemy database sessie
+        cursor: De opgeslagen high-water mark ({"updated_at": ..., "order_id": ...}) of None
+        
+    Returns:
+        tuple: (order_ids, aantal_ongewijzigd, aantal_zonder_id, nieuwe_cursor)
+    """
+    cursor = cursor or {}
+    since = _parse_timestamp(cursor.get("updated_at"))
+    newest_marker = cursor.get("updated_at")
+    newest_dt = since
+    max_order_id = cursor.get("order_id")
+    
+    order_ids: List[Any] = []
+    seen: Set[Any] = set()
+    unchanged_count = 0
+    missing_id_count = 0
+    pages = 0
+    
+    for orders in iter_order_pages():
+        pages += 1
+        page_ids = [_normalize_order_id(order.get("id")) for order in orders if order.get("id")]
+        
+        # Eén query per pagina om de opgeslagen updated_at van bekende bestellingen op te halen
+        stored_markers = dict(
+            db_session.query(Order.order_id, Order.raw_data["updated_at"].astext)
+            .filter(Order.order_id.in_(page_ids))
+            .all()
+        ) if page_ids else {}
+        
+        reached_cursor = False
+        for order in orders:
+            if not order.get("id"):
+                missing_id_count += 1
+                continue
+            order_id = _normalize_order_id(order["id"])
+            if order_id in seen:
+                continue
+            seen.add(order_id)
+            
+            summary_updated_at = order.get("updated_at")
+            marker = summary_updated_at or order.get("created_at")
+            marker_dt = _parse_timestamp(marker)
+            
+            if since is not None and marker_dt is not None and marker_dt < since:
+                reached_cursor = True
+            if marker_dt is not None and (newest_dt is None or marker_dt > newest_dt):
+                newest_dt, newest_marker = marker_dt, marker
+            if isinstance(order_id, int) and (max_order_id is None or order_id > max_order_id):
+                max_order_id = order_id
+            
+            if order_id in stored_markers and (
+                summary_updated_at is None or stored_markers[order_id] == summary_updated_at
+            ):
+                unchanged_count += 1
+                continue
+            
+            order_ids.append(order["id"])
+        
+        if reached_cursor:
+            break
+    
+    logger.info(f"Incrementele sync: {pages} pagina('s) doorlopen, {len(order_ids)} nieuwe of gewijzigde "
+                f"bestellingen, {unchanged_count} ongewijzigd")
+    
+    new_cursor = {
+        "updated_at": newest_marker,
+        "order_id": max_order_id,
+        "synced_at": datetime.utcnow().isoformat()
+    }
+    return order_ids, unchanged_count, missing_id_count, new_cursor
+
+
+def fetch_and_store_recent_orders(
+    db_session: Session, max_workers: Optional[int] = None, incremental: bool = False
+):
     """
     Haalt recente bestellingen op van de Plug&Pay API en slaat ze op in de database.
     Voor elke bestelling wordt een extra call gedaan naar de detail-endpoint om de volledige
     payload met custom fields, productdetails en adresgegevens op te halen.
     
+    De details worden parallel opgehaald (zie fetch_order_details_concurrently) en
+    per batch opgeslagen met één INSERT ... ON CONFLICT en één commit (zie
+    bulk_upsert_orders). Alle database-schrijfacties gebeuren in de aanroepende
+    thread, omdat een SQLAlchemy sessie niet thread-safe is.
+    
+    In incrementele modus worden alle pagina's sinds de opgeslagen high-water mark
+    (tabel sync_state) doorlopen en worden alleen details opgehaald van nieuwe of
+    gewijzigde bestellingen. De cursor wordt alleen verschoven als alle bestellingen
+    foutloos verwerkt zijn, zodat mislukte bestellingen bij de volgende run terugkomen.
+    
     Args:
         db_session: SQLAlchemy database sessie
+        max_workers: Maximaal aantal gelijktijdige detail-fetches (default: PLUGPAY_FETCH_CONCURRENCY)
+        incremental: Alle pagina's sinds de vorige sync doorlopen i.p.v. alleen de eerste pagina
         
     Returns:
         tuple: (aantal_nieuwe_bestellingen, aantal_overgeslagen_bestellingen)
@@ -565,100 +984,81 @@ def fetch_and_store_recent_orders(db_session: Session):
         PlugPayAPIError: Bij fouten in de API-aanroep of authenticatie
     """
     try:
-        # Haal recente bestellingen op (summary list)
-        orders_response = get_recent_orders()
-        orders = orders_response.get("data", [])
-        
-        if not orders:
-            logger.info("Geen bestellingen gevonden om te verwerken")
-            return 0, 0
-        
-        logger.info(f"Verwerken van {len(orders)} bestellingen uit Plug&Pay API")
-        
         # Houd bij hoeveel bestellingen zijn toegevoegd of overgeslagen
         added_count = 0
         skipped_count = 0
         updated_count = 0
+        error_count = 0
+        new_cursor = None
         
-        # Verwerk elke bestelling
-        for order in orders:
-            order_id = order.get("id")
-            if not order_id:
-                logger.warning("Bestelling zonder ID overgeslagen")
+        order_ids = []
+        if incremental:
+            cursor = SyncState.get_value(db_session, ORDER_SYNC_STATE_KEY)
+            order_ids, unchanged_count, missing_id_count, new_cursor = _collect_incremental_order_ids(
+                db_session, cursor
+            )
+            skipped_count += unchanged_count + missing_id_count
+        else:
+            # Haal recente bestellingen op (summary list)
+            orders_response = get_recent_orders()
+            orders = orders_response.get("data", [])
+            
+            if not orders:
+                logger.info("Geen bestellingen gevonden om te verwerken")
+                return 0, 0
+            
+            logger.info(f"Verwerken van {len(orders)} bestellingen uit Plug&Pay API")
+            
+            for order in orders:
+                order_id = order.get("id")
+                if not order_id:
+                    logger.warning("Bestelling zonder ID overgeslagen")
+                    skipped_count += 1
+                    continue
+                order_ids.append(order_id)
+        
+        statuses: Dict[Any, str] = {}
+        batch: List[Dict[str, Any]] = []
+        
+        # Verzamel de details zodra ze binnen zijn en sla ze per batch op
+        for order_id, order_details, error in fetch_order_details_concurrently(order_ids, max_workers):
+            if error is not None:
+                logger.error(f"Fout bij verwerken van bestelling {order_id}: {str(error)}")
                 skipped_count += 1
+                error_count += 1
                 continue
-                
+            
             try:
-                # Haal altijd eerst de volledige gedetailleerde informatie op over de bestelling
-                # Dit zorgt ervoor dat we alle custom fields, products en address informatie hebben
-                order_details = get_order_details(order_id)
-                
-                # Debug logging om te zien welke keys beschikbaar zijn in order_details
-                logger.debug(f"Order {order_id} detail keys: {list(order_details.keys())}")
-
-                # Gebruik de nieuwe get_custom_fields functie om alle custom fields te verzamelen
-                custom_fields_dict = get_custom_fields(order_details)
-                has_custom_fields = len(custom_fields_dict) > 0
-                
-                # Log de gevonden custom fields voor debugging
-                logger.debug(f"Order {order_id} custom fields: {custom_fields_dict}")
-
-                has_products = "products" in order_details and len(order_details.get("products", [])) > 0
-                
-                if not has_custom_fields:
-                    logger.warning(f"Geen custom fields gevonden voor bestelling {order_id} via alle beschikbare paden")
-                    
-                if not has_products:
-                    logger.warning(f"Geen products gevonden voor bestelling {order_id}")
-                    
-                if not has_custom_fields or not has_products:
-                    logger.warning(f"Onvolledige data voor bestelling {order_id}: custom_fields={has_custom_fields}, products={has_products}")
-                
-                # Controleer of de bestelling al in de database staat
-                existing_order = db_session.query(Order).filter_by(order_id=order_id).first()
-                
-                if existing_order:
-                    # Update de bestaande bestelling met de volledige raw_data
-                    try:
-                        # Gebruik dump_safe_json om de order_details veilig te serialiseren
-                        existing_order.raw_data = json.loads(dump_safe_json(order_details))
-                        db_session.commit()
-                        
-                        logger.info(f"Bestelling {order_id} bestaat al en is bijgewerkt met volledige raw_data")
-                        updated_count += 1
-                    except Exception as e:
-                        logger.warning(f"Fout bij serialiseren van order {order_id} voor raw_data: {e}")
-                        existing_order.raw_data = {}
-                        db_session.commit()
-                        logger.info(f"Bestelling {order_id} bijgewerkt met lege raw_data vanwege serialisatiefout")
-                        updated_count += 1
-                    continue
-                
-                # Maak een nieuw Order object aan en sla het op met de volledige order_details
-                # Maak de order_details eerst JSON-safe
-                try:
-                    # Gebruik dump_safe_json om de order_details veilig te serialiseren
-                    safe_order_details = json.loads(dump_safe_json(order_details))
-                    _, created = Order.create_from_plugpay_data(db_session, safe_order_details)
-                except Exception as e:
-                    logger.warning(f"Fout bij serialiseren van order {order_id} voor raw_data: {e}")
-                    # Behoud de essentiële velden maar zet raw_data op een lege dict
-                    minimal_order = {
-                        "id": order_details.get("id"),
-                        "customer": order_details.get("customer", {}),
-                        "products": order_details.get("products", []),
-                        "created_at": order_details.get("created_at")
-                    }
-                    _, created = Order.create_from_plugpay_data(db_session, minimal_order)
-                
-                if created:
-                    added_count += 1
-                else:
-                    skipped_count += 1
-                    
+                batch.append(_normalize_order_payload(order_id, order_details))
             except Exception as e:
                 logger.error(f"Fout bij verwerken van bestelling {order_id}: {str(e)}")
                 skipped_count += 1
+                error_count += 1
+                continue
+            
+            if len(batch) >= ORDER_UPSERT_BATCH_SIZE:
+                statuses.update(bulk_upsert_orders(db_session, batch))
+                batch = []
+        
+        if batch:
+            statuses.update(bulk_upsert_orders(db_session, batch))
+        
+        for status in statuses.values():
+            if status == "created":
+                added_count += 1
+            elif status == "updated":
+                updated_count += 1
+            else:
+                skipped_count += 1
+                if status == "error":
+                    error_count += 1
+        
+        if incremental:
+            if error_count == 0:
+                SyncState.set_value(db_session, ORDER_SYNC_STATE_KEY, new_cursor)
+                logger.info(f"Sync-cursor bijgewerkt naar {new_cursor}")
+            else:
+                logger.warning(f"{error_count} bestellingen mislukt, sync-cursor niet verschoven")
         
         # Log een samenvatting
         logger.info(f"Verwerking voltooid: {added_count} nieuwe bestellingen toegevoegd, "
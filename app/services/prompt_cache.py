@@ -0,0 +1,204 @@
+"""
+Prompt Cache Service
+
+Deze module bevat de cache voor AI-resultaten (FeatureFlag.PROMPT_CACHING). Een
+resultaat wordt geadresseerd op inhoud: een sha256 over provider, model, de
+genormaliseerde prompt, temperature en max_tokens. Dezelfde prompt met dezelfde
+instellingen (bijv. het opnieuw genereren voor een order of een demo-prompt)
+geeft zo direct het eerdere resultaat, zonder tokens te verbruiken.
+
+De cache heeft twee lagen: een begrensde LRU in het geheugen per proces en,
+met PROMPT_CACHE_DB=true, de prompt_cache-tabel die tussen processen en
+herstarts gedeeld wordt. Beide lagen hanteren dezelfde TTL.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.models.prompt_cache import PromptCacheEntry
+
+# Configureer logging
+logger = logging.getLogger(__name__)
+
+# Maximaal aantal resultaten in het geheugen en hoe lang (seconden) een resultaat geldig blijft
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "512"))
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "86400"))
+# Resultaten ook in de database bewaren (gedeeld tussen workers en herstarts)
+PROMPT_CACHE_DB = os.getenv("PROMPT_CACHE_DB", "false").lower() == "true"
+# Verlopen rijen in de database opruimen na elk zoveelste opgeslagen resultaat
+PROMPT_CACHE_PURGE_EVERY = 100
+
+_trailing_whitespace = re.compile(r"[ \t]+$", re.MULTILINE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normaliseert regeleinden en witruimte aan het eind van regels en van de prompt."""
+    return _trailing_whitespace.sub("", prompt.replace("\r\n", "\n").replace("\r", "\n")).strip()
+
+
+def prompt_cache_key(
+    provider: str, model: Optional[str], prompt: str, temperature: float, max_tokens: int
+) -> str:
+    """Berekent de inhoudssleutel (sha256, hex) van een AI-call."""
+    payload = json.dumps(
+        [provider, model, normalize_prompt(prompt), round(float(temperature), 4), int(max_tokens)],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PromptResultCache:
+    """
+    Twee-laags cache voor AI-resultaten: LRU in het geheugen en optioneel de database.
+
+    De geheugenlaag is thread-safe; de databaselaag draait via asyncio.to_thread met
+    een eigen sessie, zodat de event loop niet blokkeert.
+    """
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_MAX_ENTRIES, ttl: int = PROMPT_CACHE_TTL,
+                 use_db: bool = PROMPT_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_db = use_db
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0,
+                       "db_errors": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def _set_memory(self, key: str, result: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _get_db(self, key: str) -> Optional[Tuple[Dict[str, Any], datetime]]:
+        from app.db.session import SessionLocal
+
+        db = SessionLocal()
+        try:
+            row = db.query(PromptCacheEntry.result, PromptCacheEntry.expires_at).filter(
+                PromptCacheEntry.key == key,
+                PromptCacheEntry.expires_at > datetime.utcnow()
+            ).first()
+            return (row.result, row.expires_at) if row else None
+        finally:
+            db.close()
+
+    def _set_db(self, key: str, provider: str, model: Optional[str], result: Dict[str, Any], purge: bool) -> None:
+        from app.db.session import SessionLocal
+
+        table = PromptCacheEntry.__table__
+        now = datetime.utcnow()
+        stmt = pg_insert(table).values(
+            key=key, provider=provider, model=model, result=result,
+            created_at=now, expires_at=now + timedelta(seconds=self.ttl)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={"result": stmt.excluded.result, "created_at": stmt.excluded.created_at,
+                  "expires_at": stmt.excluded.expires_at}
+        )
+        db = SessionLocal()
+        try:
+            db.execute(stmt)
+            if purge:
+                db.execute(delete(table).where(table.c.expires_at <= now))
+            db.commit()
+        finally:
+            db.close()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Zoekt een resultaat, eerst in het geheugen en daarna (optioneel) in de database."""
+        result = self._get_memory(key)
+        if result is not None:
+            self._count("hits")
+            return result
+
+        if self.use_db:
+            try:
+                found = await asyncio.to_thread(self._get_db, key)
+            except Exception as e:
+                self._count("db_errors")
+                logger.warning(f"Prompt cache database niet beschikbaar: {str(e)}")
+                found = None
+            if found is not None:
+                result, expires_at = found
+                # Terug in het geheugen, maar niet langer dan de rij in de database geldig is
+                self._set_memory(key, result, (expires_at - datetime.utcnow()).total_seconds())
+                self._count("db_hits")
+                return result
+
+        self._count("misses")
+        return None
+
+    async def set(self, key: str, result: Dict[str, Any], provider: str, model: Optional[str] = None) -> None:
+        """Slaat een resultaat op in het geheugen en (optioneel) in de database."""
+        self._set_memory(key, result, self.ttl)
+        with self._lock:
+            self._stats["stores"] += 1
+            purge = self._stats["stores"] % PROMPT_CACHE_PURGE_EVERY == 0
+
+        if self.use_db:
+            try:
+                await asyncio.to_thread(self._set_db, key, provider, model, result, purge)
+            except Exception as e:
+                self._count("db_errors")
+                logger.warning(f"Prompt cache resultaat niet in de database opgeslagen: {str(e)}")
+
+    def clear(self) -> None:
+        """Leegt de geheugenlaag (de database-rijen verlopen vanzelf)."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Geeft tellers terug over het gebruik van de cache.
+
+        Returns:
+            dict: hits (geheugen), db_hits, misses, hit_rate, stores, evictions, expired,
+                  db_errors, entries en de instellingen
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["db_hits"]) / lookups, 3) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl"] = self.ttl
+        stats["use_db"] = self.use_db
+        return stats
+
+
+# Gedeelde cache voor alle AI-calls in dit proces
+prompt_cache = PromptResultCache()
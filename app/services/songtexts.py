@@ -0,0 +1,141 @@
+"""
+Songtexts Service
+
+Deze module bevat het opslaan en opvragen van songteksten in de songtexts-tabel.
+Elke save is een kleine INSERT van een nieuwe versie; raw_data van de order wordt
+niet meer aangeraakt. De geschiedenis en diffs tussen versies worden via de unieke
+index op (order_id, version) opgehaald.
+"""
+
+import difflib
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import exc as sa_exc, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models.songtext import Songtext
+
+# Configureer logging
+logger = logging.getLogger(__name__)
+
+# Aantal pogingen bij gelijktijdige saves voor dezelfde order (zelfde versienummer)
+SONGTEXT_SAVE_ATTEMPTS = 3
+
+
+def save_songtext(db: Session, order_id: int, songtekst: str, author: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Slaat een nieuwe versie van de songtekst van een order op.
+
+    Het versienummer wordt in dezelfde INSERT bepaald (hoogste versie + 1). Bij een
+    gelijktijdige save voor dezelfde order botst de unieke index; de INSERT wordt dan
+    in een savepoint opnieuw geprobeerd.
+
+    Args:
+        db: SQLAlchemy database sessie
+        order_id: Plug&Pay order_id
+        songtekst: De nieuwe songtekst
+        author: Optionele auteur van de wijziging
+
+    Returns:
+        dict: version, author en created_at van de nieuwe versie
+    """
+    table = Songtext.__table__
+    next_version = (
+        select(func.coalesce(func.max(table.c.version), 0) + 1)
+        .where(table.c.order_id == order_id)
+        .scalar_subquery()
+    )
+    stmt = pg_insert(table).values(
+        order_id=order_id,
+        version=next_version,
+        songtekst=songtekst,
+        author=author,
+        created_at=datetime.utcnow()
+    ).returning(table.c.version, table.c.author, table.c.created_at)
+
+    for attempt in range(1, SONGTEXT_SAVE_ATTEMPTS + 1):
+        try:
+            with db.begin_nested():
+                row = db.execute(stmt).one()
+            break
+        except sa_exc.IntegrityError:
+            if attempt == SONGTEXT_SAVE_ATTEMPTS:
+                raise
+            logger.info(f"Gelijktijdige songtekst-save voor order {order_id}, opnieuw proberen")
+    db.commit()
+
+    logger.info(f"Songtekst versie {row.version} opgeslagen voor order {order_id}")
+    return {"version": row.version, "author": row.author, "created_at": row.created_at}
+
+
+def get_songtext_history(
+    db: Session, order_id: int, limit: int = 50, before_version: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Haalt de versies van een songtekst op, nieuwste eerst, zonder de teksten zelf.
+
+    Args:
+        db: SQLAlchemy database sessie
+        order_id: Plug&Pay order_id
+        limit: Maximaal aantal versies
+        before_version: Alleen versies ouder dan deze (voor de volgende pagina)
+
+    Returns:
+        list: version, author, created_at en length (aantal tekens) per versie
+    """
+    query = db.query(
+        Songtext.version, Songtext.author, Songtext.created_at, func.length(Songtext.songtekst).label("length")
+    ).filter(Songtext.order_id == order_id)
+    if before_version is not None:
+        query = query.filter(Songtext.version < before_version)
+    rows = query.order_by(Songtext.version.desc()).limit(limit).all()
+    return [
+        {"version": row.version, "author": row.author, "created_at": row.created_at, "length": row.length}
+        for row in rows
+    ]
+
+
+def get_songtext_version(db: Session, order_id: int, version: Optional[int] = None) -> Optional[Songtext]:
+    """
+    Haalt één versie van de songtekst op (zonder version: de huidige).
+
+    Returns:
+        Songtext of None als de versie niet bestaat
+    """
+    query = db.query(Songtext).filter(Songtext.order_id == order_id)
+    if version is not None:
+        return query.filter(Songtext.version == version).first()
+    return query.order_by(Songtext.version.desc()).first()
+
+
+def diff_songtext_versions(
+    db: Session, order_id: int, from_version: int, to_version: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Berekent een unified diff tussen twee versies van de songtekst.
+
+    Haalt precies de twee versies op via de unieke index op (order_id, version).
+
+    Returns:
+        dict: from_version, to_version en diff (regels), of None als een van de versies niet bestaat
+    """
+    rows = {
+        row.version: row.songtekst
+        for row in db.query(Songtext.version, Songtext.songtekst).filter(
+            Songtext.order_id == order_id,
+            Songtext.version.in_([from_version, to_version])
+        )
+    }
+    if from_version not in rows or to_version not in rows:
+        return None
+    diff = difflib.unified_diff(
+        rows[from_version].splitlines(),
+        rows[to_version].splitlines(),
+        fromfile=f"versie {from_version}",
+        tofile=f"versie {to_version}",
+        lineterm=""
+    )
+    return {"from_version": from_version, "to_version": to_version, "diff": list(diff)}
@@ -10,8 +10,12 @@ import asyncio
 import time
 from typing import Dict, Any, Optional
 from datetime import datetime
+from urllib.parse import quote
 from dotenv import load_dotenv
 
+from app.auth.token import SUNO_CALLBACK_TOKEN
+from app.services.async_http import SharedClientSession
+
 # Load environment variables
 load_dotenv()
 
@@ -34,6 +38,28 @@ except ImportError:
     HAS_REQUESTS = False
     logger.error("requests not available - sync operations will fail")
 
+# Timeout (seconden) voor het indienen van een taak; Suno geeft direct een taskId terug
+SUNO_SUBMIT_TIMEOUT = float(os.getenv("SUNO_SUBMIT_TIMEOUT", "30"))
+# Vangnet voor gemiste callbacks: poll-interval en maximale looptijd (seconden) van het volgen
+SUNO_POLL_INTERVAL = float(os.getenv("SUNO_POLL_INTERVAL", "60"))
+SUNO_TASK_TIMEOUT = float(os.getenv("SUNO_TASK_TIMEOUT", "900"))
+
+# Ons callback endpoint; Suno krijgt het met het callback token in de query string
+SUNO_CALLBACK_URL = os.getenv("SUNO_CALLBACK_URL", "https://jouwsong-api.onrender.com/api/ai/suno-callback")
+
+# Eindstatussen van een Suno taak (naast SUCCESS zijn dit fouten)
+SUNO_FAILED_STATUSES = {
+    "CREATE_TASK_FAILED", "GENERATE_AUDIO_FAILED", "CALLBACK_EXCEPTION", "SENSITIVE_WORD_ERROR"
+}
+
+# Gedeelde keep-alive sessie voor alle Suno calls vanaf de event loop
+suno_http = SharedClientSession("Suno API")
+
+
+def suno_callback_url() -> str:
+    """Geeft de callBackUrl voor Suno, met het token dat /suno-callback controleert."""
+    return f"{SUNO_CALLBACK_URL}?token={quote(SUNO_CALLBACK_TOKEN, safe='')}"
+
 class SunoClient:
     """
     Client voor het aanroepen van de Suno API voor muziekgeneratie
@@ -91,8 +117,10 @@ class SunoClient:
             }
         
         if not HAS_AIOHTTP:
-            # Fall back to sync version
-            return self.generate_music_sync(songtext, title, style, instrumental, custom_mode, model, negative_tags, callback_url)
+            # Fall back to sync version, in een thread zodat de event loop niet blokkeert
+            return await asyncio.to_thread(
+                self.generate_music_sync, songtext, title, style, instrumental, custom_mode, model, negative_tags, callback_url
+            )
         
         try:
             # Prepare request data according to new Suno API documentation
@@ -100,7 +128,7 @@ class SunoClient:
                 "customMode": custom_mode,
                 "instrumental": instrumental,
                 "model": model,
-                "callBackUrl": callback_url or "https://jouwsong-api.onrender.com/api/ai/suno-callback"  # Required field
+                "callBackUrl": callback_url or suno_callback_url()  # Required field
             }
             
             # Add required parameters for Custom Mode
@@ -137,67 +165,67 @@ class SunoClient:
             
             logger.info(f"Sending request to Suno API: {json.dumps(data, indent=2)}")
             
-            # Make async request
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/generate",
-                    json=data,
-                    headers=self._get_headers(),
-                    timeout=aiohttp.ClientTimeout(total=180)  # 3 minuten timeout
-                ) as response:
-                    
-                    response_text = await response.text()
-                    logger.info(f"Suno API response: {response.status} - {response_text}")
+            # Make async request; de taak wordt alleen ingediend, de muziek volgt later
+            session = suno_http.get()
+            async with session.post(
+                f"{self.base_url}/generate",
+                json=data,
+                headers=self._get_headers(),
+                timeout=aiohttp.ClientTimeout(total=SUNO_SUBMIT_TIMEOUT)
+            ) as response:
+                
+                response_text = await response.text()
+                logger.info(f"Suno API response: {response.status} - {response_text}")
+                
+                if response.status == 200:
+                    result = json.loads(response_text)
                     
-                    if response.status == 200:
-                        result = json.loads(response_text)
+                    # New API returns task ID for status tracking
+                    if result.get("code") == 200 and result.get("data", {}).get("taskId"):
+                        task_id = result["data"]["taskId"]
                         
-                        # New API returns task ID for status tracking
-                        if result.get("code") == 200 and result.get("data", {}).get("taskId"):
-                            task_id = result["data"]["taskId"]
-                            
-                            return {
-                                "success": True,
-                                "task_id": task_id,
-                                "message": "Music generation started",
-                                "status": "PENDING",
-                                "generated_at": datetime.utcnow().isoformat()
-                            }
-                        else:
-                            return {
-                                "success": False,
-                                "error": f"Suno API returned unexpected response: {result}"
-                            }
-                    
-                    elif response.status == 401:
                         return {
-                            "success": False,
-                            "error": "Ongeldige Suno API key"
-                        }
-                    
-                    elif response.status == 429:
-                        return {
-                            "success": False,
-                            "error": "Rate limit bereikt - probeer over 1 minuut opnieuw"
-                        }
-                    
-                    elif response.status == 413:
-                        return {
-                            "success": False,
-                            "error": "Songtekst te lang voor muziekgeneratie"
-                        }
-                    
-                    elif response.status == 503:
-                        return {
-                            "success": False,
-                            "error": "SUNO service tijdelijk niet beschikbaar - probeer over 5-10 minuten opnieuw"
+                            "success": True,
+                            "task_id": task_id,
+                            "message": "Music generation started",
+                            "status": "PENDING",
+                            "generated_at": datetime.utcnow().isoformat()
                         }
-                    
                     else:
                         return {
                             "success": False,
-                            "error": f"Suno API error {response.status}: {response_text}"
+                            "error": f"Suno API returned unexpected response: {result}"
                         }
+                
+                elif response.status == 401:
+                    return {
+                        "success": False,
+                        "error": "Ongeldige Suno API key"
+                    }
+                
+                elif response.status == 429:
+                    return {
+                        "success": False,
+                        "error": "Rate limit bereikt - probeer over 1 minuut opnieuw"
+                    }
+                
+                elif response.status == 413:
+                    return {
+                        "success": False,
+                        "error": "Songtekst te lang voor muziekgeneratie"
+                    }
+                
+                elif response.status == 503:
+                    return {
+                        "success": False,
+                        "error": "SUNO service tijdelijk niet beschikbaar - probeer over 5-10 minuten opnieuw"
+                    }
+                
+                else:
+                    return {
+                        "success": False,
+                        "error": f"Suno API error {response.status}: {response_text}"
+                    }
         
         except asyncio.TimeoutError:
             return {
@@ -229,68 +257,68 @@ class SunoClient:
             }
         
         if not HAS_AIOHTTP:
-            return self.get_task_status_sync(task_id)
+            return await asyncio.to_thread(self.get_task_status_sync, task_id)
         
         try:
             endpoint = f"{self.base_url}/generate/record-info?taskId={task_id}"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    endpoint,
-                    headers=self._get_headers(),
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    response_text = await response.text()
+            session = suno_http.get()
+            async with session.get(
+                endpoint,
+                headers=self._get_headers(),
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                
+                response_text = await response.text()
+                
+                if response.status == 200:
+                    result = json.loads(response_text)
                     
-                    if response.status == 200:
-                        result = json.loads(response_text)
+                    if result.get("code") == 200:
+                        data = result.get("data", {})
+                        status = data.get("status")
                         
-                        if result.get("code") == 200:
-                            data = result.get("data", {})
-                            status = data.get("status")
+                        # Check if we have results
+                        if status == "SUCCESS" and data.get("response", {}).get("sunoData"):
+                            suno_data = data["response"]["sunoData"]
+                            tracks = []
+                            
+                            for track in suno_data:
+                                tracks.append({
+                                    "id": track.get("id"),
+                                    "title": track.get("title"),
+                                    "audio_url": track.get("audioUrl"),
+                                    "stream_url": track.get("streamAudioUrl"),
+                                    "image_url": track.get("imageUrl"),
+                                    "duration": track.get("duration"),
+                                    "model_name": track.get("modelName"),
+                                    "tags": track.get("tags"),
+                                    "create_time": track.get("createTime")
+                                })
                             
-                            # Check if we have results
-                            if status == "SUCCESS" and data.get("response", {}).get("sunoData"):
-                                suno_data = data["response"]["sunoData"]
-                                tracks = []
-                                
-                                for track in suno_data:
-                                    tracks.append({
-                                        "id": track.get("id"),
-                                        "title": track.get("title"),
-                                        "audio_url": track.get("audioUrl"),
-                                        "stream_url": track.get("streamAudioUrl"),
-                                        "image_url": track.get("imageUrl"),
-                                        "duration": track.get("duration"),
-                                        "model_name": track.get("modelName"),
-                                        "tags": track.get("tags"),
-                                        "create_time": track.get("createTime")
-                                    })
-                                
-                                return {
-                                    "success": True,
-                                    "status": status,
-                                    "tracks": tracks,
-                                    "task_id": task_id
-                                }
-                            else:
-                                return {
-                                    "success": True,
-                                    "status": status,
-                                    "task_id": task_id,
-                                    "message": f"Task status: {status}"
-                                }
+                            return {
+                                "success": True,
+                                "status": status,
+                                "tracks": tracks,
+                                "task_id": task_id
+                            }
                         else:
                             return {
-                                "success": False,
-                                "error": f"Suno API error: {result.get('msg', 'Unknown error')}"
+                                "success": True,
+                                "status": status,
+                                "task_id": task_id,
+                                "message": f"Task status: {status}"
                             }
                     else:
                         return {
                             "success": False,
-                            "error": f"Status check failed: {response.status} - {response_text}"
+                            "error": f"Suno API error: {result.get('msg', 'Unknown error')}"
                         }
+                else:
+                    return {
+                        "success": False,
+                        "error": f"Status check failed: {response.status} - {response_text}"
+                    }
         
         except Exception as e:
             logger.error(f"Status check error: {str(e)}")
@@ -331,7 +359,7 @@ class SunoClient:
                 "customMode": custom_mode,
                 "instrumental": instrumental,
                 "model": model,
-                "callBackUrl": callback_url or "https://jouwsong-api.onrender.com/api/ai/suno-callback"  # Required field
+                "callBackUrl": callback_url or suno_callback_url()  # Required field
             }
             
             # Add required parameters for Custom Mode
@@ -516,6 +544,124 @@ class SunoClient:
                 "error": f"Status check mislukt: {str(e)}"
             }
 
+class SunoTaskTracker:
+    """
+    Achtergrond-job die ingediende Suno taken volgt tot ze klaar zijn.
+    
+    Draait als asyncio-task binnen de applicatie (zoals de order ingest worker).
+    Normaal meldt Suno de voortgang via /suno-callback, dat de taak hier afmeldt
+    (resolve). Als vangnet voor gemiste callbacks pollt de job de overige taken
+    samen elke SUNO_POLL_INTERVAL seconden via de gedeelde sessie en slaat de
+    statussen op in music_tasks. Een taak die na SUNO_TASK_TIMEOUT seconden nog
+    niet klaar is, wordt niet meer gevolgd.
+    """
+    
+    def __init__(self, poll_interval: float = SUNO_POLL_INTERVAL, task_timeout: float = SUNO_TASK_TIMEOUT):
+        self.poll_interval = poll_interval
+        self.task_timeout = task_timeout
+        self._pending: Dict[str, float] = {}  # task_id -> tijdstip van indienen (monotonic)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def track(self, task_id: str) -> None:
+        """Volgt een ingediende taak; start de job als die nog niet draait."""
+        self._pending.setdefault(task_id, time.monotonic())
+        self.start()
+    
+    def resolve(self, task_id: str) -> None:
+        """Stopt met volgen van een taak (bijv. omdat de callback al is binnengekomen)."""
+        self._pending.pop(task_id, None)
+    
+    def is_pending(self, task_id: str) -> bool:
+        return task_id in self._pending
+    
+    def start(self) -> None:
+        """Start de job op de huidige event loop."""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Suno task tracker gestart")
+    
+    async def stop(self) -> None:
+        """Stopt de job en sluit de gedeelde Suno sessie."""
+        if self.running:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=30)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+            logger.info("Suno task tracker gestopt")
+        await suno_http.close()
+    
+    @staticmethod
+    def _save_statuses(results: Dict[str, Dict[str, Any]]) -> None:
+        """Slaat de gepollde statussen op met een eigen database sessie (draait in een thread)."""
+        from app.db.session import SessionLocal
+        from app.services.music_tasks import record_polled_status
+        
+        db = SessionLocal()
+        try:
+            for task_id, result in results.items():
+                record_polled_status(db, task_id, result)
+        finally:
+            db.close()
+    
+    async def poll_once(self, client: Optional[SunoClient] = None) -> int:
+        """
+        Vraagt de status van alle openstaande taken tegelijk op en slaat die op.
+        
+        Returns:
+            int: Aantal taken dat in deze ronde is afgerond
+        """
+        if not self._pending:
+            return 0
+        client = client or SunoClient()
+        task_ids = list(self._pending)
+        results = await asyncio.gather(*(client.get_task_status(task_id) for task_id in task_ids))
+        polled = {task_id: result for task_id, result in zip(task_ids, results) if result.get("success")}
+        if polled:
+            await asyncio.to_thread(self._save_statuses, polled)
+        
+        finished = 0
+        now = time.monotonic()
+        for task_id, result in zip(task_ids, results):
+            status = result.get("status")
+            if result.get("success") and (status == "SUCCESS" or status in SUNO_FAILED_STATUSES):
+                self.resolve(task_id)
+                finished += 1
+                logger.info(f"Suno taak {task_id} afgerond met status {status}")
+            elif now - self._pending.get(task_id, now) > self.task_timeout:
+                self.resolve(task_id)
+                finished += 1
+                logger.warning(f"Suno taak {task_id} niet meer gevolgd na {self.task_timeout:.0f}s")
+        return finished
+    
+    async def _run(self) -> None:
+        while not self._stopping and self._pending:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"Fout in Suno task tracker: {str(e)}")
+
+
+# Globale tracker instantie
+suno_task_tracker = SunoTaskTracker()
+
 # Convenience functions
 async def generate_music_from_songtext(
     songtext: str,
@@ -527,10 +673,19 @@ async def generate_music_from_songtext(
     negative_tags: str = None,
     callback_url: str = None
 ) -> Dict[str, Any]:
-    """Convenience function voor async muziek generatie"""
+    """
+    Convenience function voor async muziek generatie.
+    
+    Dient de taak in zonder de event loop te blokkeren en geeft direct het task_id
+    terug; de voortgang wordt op de achtergrond gevolgd door suno_task_tracker.
+    """
     client = SunoClient()
-    # Use sync version for now to avoid async issues
-    return client.generate_music_sync(songtext, title, style, instrumental, custom_mode, model, negative_tags, callback_url)
+    result = await client.generate_music_async(
+        songtext, title, style, instrumental, custom_mode, model, negative_tags, callback_url
+    )
+    if result.get("success"):
+        suno_task_tracker.track(result["task_id"])
+    return result
 
 def generate_music_from_songtext_sync(
     songtext: str,
@@ -3,14 +3,222 @@ Thema Database Service
 Handles all database operations for thema elements
 """
 
+import heapq
+import math
+import os
 import random
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
+import threading
+import time
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_, func
 
 from app.models.thema import Thema, ThemaElement, ThemaRhymeSet
 from app.db.session import get_db
 
+# Maximale leeftijd van de thema-index in seconden; vangnet voor wijzigingen via
+# andere processen of scripts (ThemaCRUD invalideert de index direct)
+THEMA_INDEX_TTL = float(os.getenv("THEMA_INDEX_TTL", "300"))
+
+# Maximaal aantal onthouden lookups per index (orders gebruiken een beperkt aantal thema strings)
+THEMA_LOOKUP_CACHE_SIZE = 10000
+
+
+class ThemaIndex:
+    """
+    In-memory index van de actieve thema's voor find_thema_id_for_string.
+    
+    Exacte matches zijn dict-lookups op name en lower(display_name); partial matches
+    (substring, zoals ILIKE '%...%') lopen door de kleine lijst met thema's in id-volgorde.
+    Elke uitkomst (ook "geen match") wordt per genormaliseerde string onthouden, zodat
+    herhaalde lookups één dict-lookup zijn.
+    """
+    
+    def __init__(self, rows: List[Tuple[int, str, str]]):
+        # rows: (id, name, display_name) van de actieve thema's, op id gesorteerd
+        self.by_name: Dict[str, int] = {}
+        self.by_display_name: Dict[str, int] = {}
+        self.entries: List[Tuple[int, str, str]] = []
+        for thema_id, name, display_name in rows:
+            name = name or ""
+            display_lower = (display_name or "").lower()
+            self.by_name.setdefault(name, thema_id)
+            self.by_display_name.setdefault(display_lower, thema_id)
+            self.entries.append((thema_id, name.lower(), display_lower))
+        self.loaded_at = time.monotonic()
+        self._lookups: Dict[str, Optional[int]] = {}
+    
+    def lookup(self, thema_string: str) -> Optional[int]:
+        """Zoekt het thema_id volgens dezelfde volgorde als de oude database-queries."""
+        thema_lower = thema_string.lower().strip()
+        try:
+            return self._lookups[thema_lower]
+        except KeyError:
+            pass
+        
+        # 1. Exacte match op name, 2. exacte match op display_name
+        thema_id = self.by_name.get(thema_lower)
+        if thema_id is None:
+            thema_id = self.by_display_name.get(thema_lower)
+        # 3. Partial match op name, 4. partial match op display_name
+        if thema_id is None:
+            thema_id = next((entry[0] for entry in self.entries if thema_lower in entry[1]), None)
+        if thema_id is None:
+            thema_id = next((entry[0] for entry in self.entries if thema_lower in entry[2]), None)
+        
+        if len(self._lookups) < THEMA_LOOKUP_CACHE_SIZE:
+            self._lookups[thema_lower] = thema_id
+        return thema_id
+
+
+_thema_index: Optional[ThemaIndex] = None
+_thema_index_lock = threading.Lock()
+
+
+def get_thema_index(db: Session) -> ThemaIndex:
+    """
+    Geeft de thema-index terug en laadt hem (met één query) als hij ontbreekt of verlopen is.
+    
+    Args:
+        db: SQLAlchemy database sessie (alleen gebruikt bij het laden)
+    """
+    global _thema_index
+    index = _thema_index
+    if index is not None and time.monotonic() - index.loaded_at < THEMA_INDEX_TTL:
+        return index
+    with _thema_index_lock:
+        index = _thema_index
+        if index is None or time.monotonic() - index.loaded_at >= THEMA_INDEX_TTL:
+            rows = db.query(Thema.id, Thema.name, Thema.display_name).filter(
+                Thema.is_active == True
+            ).order_by(Thema.id).all()
+            index = ThemaIndex([tuple(row) for row in rows])
+            _thema_index = index
+        return index
+
+
+def invalidate_thema_index() -> None:
+    """Gooit de thema-index weg; de volgende lookup laadt hem opnieuw. Aanroepen na elke wijziging van thema's."""
+    global _thema_index
+    _thema_index = None
+
+
+class WeightedElement(NamedTuple):
+    """Los (sessie-onafhankelijk) kopie van een ThemaElement voor de element-pools."""
+    id: int
+    content: str
+    suno_format: Optional[str]
+    usage_context: Optional[str]
+    weight: int
+
+
+class ElementPool:
+    """
+    De elementen van één (thema, element_type, context) met positief gewicht.
+    
+    sample() trekt zonder teruglegging met Efraimidis-Spirakis: elk element krijgt
+    de sleutel log(u) / weight (u uniform in (0, 1]) en de k grootste sleutels
+    winnen. Een element met gewicht 3 wordt zo echt drie keer zo vaak als eerste
+    gekozen als een element met gewicht 1, zonder de lijst per gewicht te herhalen.
+    """
+    
+    def __init__(self, elements: List[WeightedElement]):
+        self.elements: Tuple[WeightedElement, ...] = tuple(e for e in elements if e.weight and e.weight > 0)
+        self.loaded_at = time.monotonic()
+    
+    def sample(self, count: int, rng: random.Random = random) -> List[WeightedElement]:
+        """Kiest maximaal count verschillende elementen, gewogen op weight (O(n log k))."""
+        if count <= 0 or not self.elements:
+            return []
+        return heapq.nlargest(
+            min(count, len(self.elements)),
+            self.elements,
+            key=lambda element: math.log(1.0 - rng.random()) / element.weight
+        )
+
+
+class RhymeSetData(NamedTuple):
+    """Los (sessie-onafhankelijk) kopie van een ThemaRhymeSet."""
+    id: int
+    rhyme_pattern: str
+    rhyme_pairs: Any
+    difficulty_level: str
+    
+    @property
+    def words(self):
+        """Backward compatibility: flatten pairs to words list"""
+        return [word for pair in self.rhyme_pairs for word in pair]
+
+
+class ThemaBundle:
+    """
+    Een thema met al zijn elementen en rijmsets, in het geheugen.
+    
+    Wordt met één query geladen (zie ThemaService.get_thema_bundle); daarna worden
+    alle element types en rijmsets zonder database getrokken. De element-pools per
+    (element_type, context) worden bij het eerste gebruik opgebouwd.
+    """
+    
+    def __init__(self, thema: Thema):
+        self.id = thema.id
+        self.name = thema.name
+        self.display_name = thema.display_name
+        self.professional_prompt = thema.professional_prompt
+        self.is_active = thema.is_active
+        elements = sorted(thema.elements, key=lambda element: element.id)
+        self.elements: Tuple[Tuple[str, WeightedElement], ...] = tuple(
+            (element.element_type, WeightedElement(
+                element.id, element.content, element.suno_format, element.usage_context, element.weight
+            ))
+            for element in elements
+        )
+        self.rhyme_sets: Tuple[RhymeSetData, ...] = tuple(
+            RhymeSetData(rhyme_set.id, rhyme_set.rhyme_pattern, rhyme_set.rhyme_pairs, rhyme_set.difficulty_level)
+            for rhyme_set in sorted(thema.rhyme_sets, key=lambda rhyme_set: rhyme_set.id)
+        )
+        self.loaded_at = time.monotonic()
+        self._pools: Dict[Tuple[str, Optional[str]], ElementPool] = {}
+    
+    def pool(self, element_type: str, context: str = None) -> ElementPool:
+        """
+        Geeft de element-pool voor een type en optionele context.
+        
+        Met context tellen alleen elementen met die context of 'any' mee (zoals de
+        oude query: usage_context IN (context, 'any', NULL) matcht nooit op NULL).
+        """
+        key = (element_type, context or None)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = ElementPool([
+                element for element_type_, element in self.elements
+                if element_type_ == element_type
+                and (not context or element.usage_context in (context, 'any'))
+            ])
+            self._pools[key] = pool
+        return pool
+    
+    def random_rhyme_set(self, pattern: str = None, rng: random.Random = random) -> Optional[RhymeSetData]:
+        """Kiest een willekeurige rijmset, optioneel met een bepaald rijmschema."""
+        rhyme_sets = [r for r in self.rhyme_sets if not pattern or r.rhyme_pattern == pattern]
+        return rng.choice(rhyme_sets) if rhyme_sets else None
+
+
+_thema_bundles: Dict[int, ThemaBundle] = {}
+
+
+def invalidate_thema_bundles(thema_id: Optional[int] = None) -> None:
+    """
+    Gooit de in-memory bundel van één thema (of van alle thema's) weg.
+    
+    Aanroepen na elke wijziging van een thema, zijn elementen of zijn rijmsets;
+    de volgende prompt-generatie laadt de bundel opnieuw.
+    """
+    if thema_id is None:
+        _thema_bundles.clear()
+    else:
+        _thema_bundles.pop(thema_id, None)
+
+
 class ThemaService:
     """Service voor het beheren van thema database operaties"""
     
@@ -27,7 +235,8 @@ class ThemaService:
         """
         Zoek thema_id voor een legacy thema string
         
-        Gebruikt fuzzy matching om de beste thema match te vinden:
+        Gebruikt fuzzy matching om de beste thema match te vinden (via de in-memory
+        ThemaIndex, zie get_thema_index):
         1. Exacte match op name
         2. Exacte match op display_name  
         3. Partial match op name
@@ -41,38 +250,9 @@ class ThemaService:
         """
         if not thema_string:
             return None
-            
-        thema_lower = thema_string.lower().strip()
         
-        # 1. Exacte match op name
-        thema = self.db.query(Thema).filter(
-            and_(Thema.name == thema_lower, Thema.is_active == True)
-        ).first()
-        if thema:
-            return thema.id
-            
-        # 2. Exacte match op display_name (case insensitive)
-        thema = self.db.query(Thema).filter(
-            and_(func.lower(Thema.display_name) == thema_lower, Thema.is_active == True)
-        ).first()
-        if thema:
-            return thema.id
-            
-        # 3. Partial match op name
-        thema = self.db.query(Thema).filter(
-            and_(Thema.name.ilike(f'%{thema_lower}%'), Thema.is_active == True)
-        ).first()
-        if thema:
-            return thema.id
-            
-        # 4. Partial match op display_name
-        thema = self.db.query(Thema).filter(
-            and_(Thema.display_name.ilike(f'%{thema_lower}%'), Thema.is_active == True)
-        ).first()
-        if thema:
-            return thema.id
-            
-        return None
+        # Eén dict-lookup in de in-memory index in plaats van tot vier queries
+        return get_thema_index(self.db).lookup(thema_string)
     
     def get_thema_elements(self, thema_id: int, element_type: str = None) -> List[ThemaElement]:
         """Haal thema elementen op, optioneel gefilterd op type"""
@@ -83,33 +263,33 @@ class ThemaService:
         
         return query.all()
     
-    def get_random_elements(self, thema_id: int, element_type: str, 
-                          count: int = 3, context: str = None) -> List[ThemaElement]:
-        """Haal random elementen op, rekening houdend met weight"""
-        query = self.db.query(ThemaElement).filter(
-            and_(
-                ThemaElement.thema_id == thema_id,
-                ThemaElement.element_type == element_type
-            )
-        )
-        
-        if context:
-            query = query.filter(
-                ThemaElement.usage_context.in_([context, 'any', None])
-            )
-        
-        elements = query.all()
+    def get_thema_bundle(self, thema_id: int) -> Optional[ThemaBundle]:
+        """
+        Geeft de bundel (thema + elementen + rijmsets) van een thema, of None als het niet bestaat.
         
-        # Weighted random selection
-        weighted_elements = []
-        for element in elements:
-            weighted_elements.extend([element] * element.weight)
+        Bij een cache-miss wordt alles met één query (joinedload) geladen; de bundel wordt
+        THEMA_INDEX_TTL seconden bewaard, of tot ThemaCRUD het thema wijzigt.
+        """
+        bundle = _thema_bundles.get(thema_id)
+        if bundle is not None and time.monotonic() - bundle.loaded_at < THEMA_INDEX_TTL:
+            return bundle
         
-        if not weighted_elements:
+        thema = self.db.query(Thema).options(
+            joinedload(Thema.elements), joinedload(Thema.rhyme_sets)
+        ).filter(Thema.id == thema_id).first()
+        if thema is None:
+            return None
+        bundle = ThemaBundle(thema)
+        _thema_bundles[thema_id] = bundle
+        return bundle
+    
+    def get_random_elements(self, thema_id: int, element_type: str, 
+                          count: int = 3, context: str = None) -> List[WeightedElement]:
+        """Haal random elementen op, gewogen op weight (zonder teruglegging)"""
+        bundle = self.get_thema_bundle(thema_id)
+        if bundle is None:
             return []
-            
-        selected_count = min(count, len(set(weighted_elements)))
-        return random.sample(list(set(weighted_elements)), selected_count)
+        return bundle.pool(element_type, context).sample(count)
     
     def get_rhyme_sets(self, thema_id: int, pattern: str = None) -> List[ThemaRhymeSet]:
         """Haal rijmwoorden sets op"""
@@ -120,19 +300,20 @@ class ThemaService:
         
         return query.all()
     
-    def get_random_rhyme_set(self, thema_id: int, pattern: str = None) -> Optional[ThemaRhymeSet]:
+    def get_random_rhyme_set(self, thema_id: int, pattern: str = None) -> Optional[RhymeSetData]:
         """Haal een random rijmwoorden set op"""
-        rhyme_sets = self.get_rhyme_sets(thema_id, pattern)
-        
-        if not rhyme_sets:
+        bundle = self.get_thema_bundle(thema_id)
+        if bundle is None:
             return None
-            
-        return random.choice(rhyme_sets)
+        return bundle.random_rhyme_set(pattern)
     
     def generate_thema_data(self, thema_name: str = None, thema_id: int = None) -> Dict[str, Any]:
         """
         Genereer een complete dataset voor een thema
         
+        Gebruikt de gecachte ThemaBundle: nul queries als de bundel al geladen is,
+        anders één.
+        
         Args:
             thema_name: Legacy thema naam (string)
             thema_id: Nieuwe thema ID (integer) - heeft prioriteit
@@ -142,28 +323,29 @@ class ThemaService:
         """
         thema = None
         
-        # Prioriteit: eerst thema_id, dan thema_name
+        # Prioriteit: eerst thema_id, dan thema_name (actief thema, via de in-memory index)
         if thema_id:
-            thema = self.db.query(Thema).filter(Thema.id == thema_id).first()
+            thema = self.get_thema_bundle(thema_id)
         elif thema_name:
-            thema = self.get_thema_by_name(thema_name)
+            named_id = get_thema_index(self.db).by_name.get(thema_name.lower())
+            thema = self.get_thema_bundle(named_id) if named_id is not None else None
         
         if not thema:
             fallback_name = thema_name or f"thema_{thema_id}"
             return self._get_fallback_data(fallback_name)
         
-        # Haal verschillende element types op
-        keywords = self.get_random_elements(thema.id, 'keyword', count=4)
-        power_phrases = self.get_random_elements(thema.id, 'power_phrase', count=2, context='chorus')
-        genres = self.get_random_elements(thema.id, 'genre', count=1)
-        bpm_elements = self.get_random_elements(thema.id, 'bpm', count=1)
-        key_elements = self.get_random_elements(thema.id, 'key', count=1)
-        instruments = self.get_random_elements(thema.id, 'instrument', count=3)
-        effects = self.get_random_elements(thema.id, 'effect', count=2)
-        verse_starters = self.get_random_elements(thema.id, 'verse_starter', count=1)
+        # Alle element types en de rijmset uit de bundel in het geheugen
+        keywords = thema.pool('keyword').sample(4)
+        power_phrases = thema.pool('power_phrase', 'chorus').sample(2)
+        genres = thema.pool('genre').sample(1)
+        bpm_elements = thema.pool('bpm').sample(1)
+        key_elements = thema.pool('key').sample(1)
+        instruments = thema.pool('instrument').sample(3)
+        effects = thema.pool('effect').sample(2)
+        verse_starters = thema.pool('verse_starter').sample(1)
         
         # Haal een rijmset op
-        rhyme_set = self.get_random_rhyme_set(thema.id, 'AABB')
+        rhyme_set = thema.random_rhyme_set('AABB')
         
         return {
             'thema_name': thema.name,
@@ -3,19 +3,112 @@ Service voor het linken van UpSell orders aan hun originele orders.
 """
 
 import logging
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Iterable, List, Tuple, Union
+from sqlalchemy import Select, Text, and_, case, column, delete, func, insert, literal, or_, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
+from app.services.order_extraction import MAIN_PRODUCT_IDS, normalize_email
+
 logger = logging.getLogger(__name__)
 
+# Venster waarin de originele order vóór de UpSell moet liggen
+LINK_WINDOW = timedelta(days=7)
+
+# Minimale confidence (exclusief) om een UpSell automatisch te koppelen
+MIN_LINK_CONFIDENCE = 70
+
+# Aantal rijen per statement bij het wegschrijven van kandidaten
+CANDIDATE_WRITE_BATCH_SIZE = 1000
+
+# Auteur van songtekst-versies die vanuit de originele order naar een UpSell zijn gekopieerd
+SONGTEXT_SYNC_AUTHOR = "upsell-sync"
+
+# Thema's van een UpSell die als "geen thema" gelden bij het overnemen van de originele order
+EMPTY_THEMES = (None, "", "-", "Onbekend")
+
+def parse_upsell(upsell_order_data: Dict[str, Any]) -> Optional[Tuple[datetime, Optional[str], Optional[str]]]:
+    """
+    Haalt het tijdstip en de klantgegevens uit een UpSell payload.
+    
+    Returns:
+        tuple: (upsell_datetime als naive UTC, customer_email, customer_name), of None als
+        het tijdstip of alle klantinformatie ontbreekt
+    """
+    upsell_order_id = upsell_order_data.get("id")
+    upsell_created_at = upsell_order_data.get("created_at")
+    
+    if not upsell_created_at:
+        logger.warning(f"UpSell order {upsell_order_id} heeft geen created_at timestamp")
+        return None
+    
+    # Parse de timestamp; bestel_datum wordt als naive UTC opgeslagen, dus vergelijk ook zo
+    try:
+        upsell_datetime = datetime.fromisoformat(upsell_created_at.replace("Z", "+00:00"))
+    except ValueError:
+        logger.warning(f"Kan timestamp niet parsen voor UpSell order {upsell_order_id}: {upsell_created_at}")
+        return None
+    if upsell_datetime.tzinfo is not None:
+        upsell_datetime = upsell_datetime.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    # Zoek naar klant informatie
+    customer_email = None
+    customer_name = None
+    
+    # Probeer email uit verschillende velden
+    if upsell_order_data.get("customer", {}).get("email"):
+        customer_email = upsell_order_data["customer"]["email"]
+    elif upsell_order_data.get("address", {}).get("email"):
+        customer_email = upsell_order_data["address"]["email"]
+    
+    # Probeer naam uit verschillende velden
+    if upsell_order_data.get("address", {}).get("full_name"):
+        customer_name = upsell_order_data["address"]["full_name"]
+    elif upsell_order_data.get("customer", {}).get("name"):
+        customer_name = upsell_order_data["customer"]["name"]
+    elif upsell_order_data.get("address", {}).get("firstname"):
+        firstname = upsell_order_data["address"]["firstname"]
+        lastname = upsell_order_data["address"].get("lastname", "")
+        customer_name = f"{firstname} {lastname}".strip()
+    
+    if not customer_email and not customer_name:
+        logger.warning(f"Geen klant informatie gevonden voor UpSell order {upsell_order_id}")
+        return None
+    
+    return upsell_datetime, customer_email, customer_name
+
+
+def _select_best_match(upsell_order_id: Any, original_orders_with_scores: List[Tuple[Any, float]]):
+    """Kiest de kandidaat met de hoogste confidence (of None) en logt dubbelzinnige matches."""
+    if not original_orders_with_scores:
+        logger.info(f"Geen originele order gevonden voor UpSell {upsell_order_id} (geen matches met hoge confidence)")
+        return None
+    
+    # Selecteer de order met de hoogste confidence score
+    original_orders_with_scores.sort(key=lambda x: x[1], reverse=True)
+    best_match, best_confidence = original_orders_with_scores[0]
+    
+    # Als er meerdere matches zijn met vergelijkbare confidence, log een waarschuwing
+    if len(original_orders_with_scores) > 1:
+        second_best_confidence = original_orders_with_scores[1][1]
+        if best_confidence - second_best_confidence < 10:  # Minder dan 10% verschil
+            logger.warning(f"AMBIGUOUS MATCH voor UpSell {upsell_order_id}: "
+                         f"Best match {best_match.order_id} ({best_confidence}%) vs "
+                         f"Second best {original_orders_with_scores[1][0].order_id} ({second_best_confidence}%)")
+    
+    logger.info(f"Originele order {best_match.order_id} geselecteerd voor UpSell {upsell_order_id} (confidence: {best_confidence}%)")
+    return best_match
+
+
 def find_original_order_for_upsell(db_session: Session, upsell_order_data: Dict[str, Any]) -> Optional[int]:
     """
     Vindt de originele order die hoort bij een UpSell order met confidence scoring.
     
     Strategie:
-    1. Zoek naar orders met dezelfde klant (email/naam) binnen 7 dagen voor de UpSell
-    2. Filter op standaard orders (product_id 274588 of 289456)
+    1. Zoek naar orders met hetzelfde (genormaliseerde) e-mailadres binnen 7 dagen voor de UpSell
+    2. Filter op standaard orders (primary_product_id 274588 of 289456)
     3. Bereken confidence score voor elke match
     4. Selecteer alleen matches met hoge confidence (>70%)
     5. Selecteer de beste match
@@ -29,157 +122,140 @@ def find_original_order_for_upsell(db_session: Session, upsell_order_data: Dict[
     """
     from app.models.order import Order
     
+    upsell_order_id = upsell_order_data.get("id")
     try:
-        # Haal basis informatie op uit de UpSell order
-        upsell_order_id = upsell_order_data.get("id")
-        upsell_created_at = upsell_order_data.get("created_at")
-        
-        if not upsell_created_at:
-            logger.warning(f"UpSell order {upsell_order_id} heeft geen created_at timestamp")
-            return None
-        
-        # Parse de timestamp
-        try:
-            upsell_datetime = datetime.fromisoformat(upsell_created_at.replace("Z", "+00:00"))
-        except ValueError:
-            logger.warning(f"Kan timestamp niet parsen voor UpSell order {upsell_order_id}: {upsell_created_at}")
+        parsed = parse_upsell(upsell_order_data)
+        if parsed is None:
             return None
+        upsell_datetime, customer_email, customer_name = parsed
         
-        # Zoek naar klant informatie
-        customer_email = None
-        customer_name = None
-        
-        # Probeer email uit verschillende velden
-        if upsell_order_data.get("customer", {}).get("email"):
-            customer_email = upsell_order_data["customer"]["email"]
-        elif upsell_order_data.get("address", {}).get("email"):
-            customer_email = upsell_order_data["address"]["email"]
-        
-        # Probeer naam uit verschillende velden
-        if upsell_order_data.get("address", {}).get("full_name"):
-            customer_name = upsell_order_data["address"]["full_name"]
-        elif upsell_order_data.get("customer", {}).get("name"):
-            customer_name = upsell_order_data["customer"]["name"]
-        elif upsell_order_data.get("address", {}).get("firstname"):
-            firstname = upsell_order_data["address"]["firstname"]
-            lastname = upsell_order_data["address"].get("lastname", "")
-            customer_name = f"{firstname} {lastname}".strip()
-        
-        if not customer_email and not customer_name:
-            logger.warning(f"Geen klant informatie gevonden voor UpSell order {upsell_order_id}")
+        # Zonder e-mail match haalt een kandidaat nooit de drempel van 70%
+        # (naam 30 + tijd 20 + product 5), dus zoeken op e-mail verliest geen matches
+        email_norm = normalize_email(customer_email)
+        if not email_norm:
+            logger.info(f"Geen bruikbaar e-mailadres voor UpSell order {upsell_order_id}, geen koppeling mogelijk")
             return None
         
         # Zoek naar mogelijke originele orders
         # Zoek 7 dagen terug vanaf de UpSell order
-        search_start = upsell_datetime - timedelta(days=7)
+        search_start = upsell_datetime - LINK_WINDOW
         
-        # Query voor potentiële originele orders
-        query = db_session.query(Order).filter(
+        # Index range scan op (klant_email_norm, bestel_datum), alleen standaard orders
+        # (product_id 274588 = Standaard 72u, 289456 = Spoed 24u)
+        potential_orders = db_session.query(Order).filter(
+            Order.klant_email_norm == email_norm,
             Order.bestel_datum >= search_start,
             Order.bestel_datum < upsell_datetime,
-            Order.order_id != upsell_order_id  # Niet de UpSell order zelf
-        )
+            Order.order_id != upsell_order_id,  # Niet de UpSell order zelf
+            Order.primary_product_id.in_(MAIN_PRODUCT_IDS)
+        ).all()
         
-        # Filter op standaard orders (product_id 274588 = Standaard 72u, 289456 = Spoed 24u)
-        potential_orders = query.all()
+        # Aantal orders per klant in hetzelfde venster, in één query voor alle kandidaten
+        customer_order_counts = count_orders_per_customer(
+            db_session, (order.klant_naam for order in potential_orders), search_start, upsell_datetime
+        )
         
         original_orders_with_scores = []
         
         for order in potential_orders:
-            if order.raw_data and order.raw_data.get("products"):
-                for product in order.raw_data["products"]:
-                    product_id = product.get("id")
-                    pivot_type = product.get("pivot", {}).get("type")
-                    
-                    # Standaard orders hebben product_id 274588 of 289456 en geen upsell type
-                    if product_id in [274588, 289456] and pivot_type != "upsell":
-                        # Bereken confidence score
-                        confidence = calculate_linking_confidence(
-                            upsell_order_data, order, customer_email, customer_name, upsell_datetime, db_session
-                        )
-                        
-                        if confidence > 70:  # Alleen hoge confidence matches
-                            original_orders_with_scores.append((order, confidence))
-                            logger.info(f"Originele order {order.order_id} gevonden met confidence {confidence}%")
-                        else:
-                            logger.info(f"Originele order {order.order_id} afgewezen (confidence {confidence}% < 70%)")
-                        break
-        
-        if not original_orders_with_scores:
-            logger.info(f"Geen originele order gevonden voor UpSell {upsell_order_id} (geen matches met hoge confidence)")
-            return None
-        
-        # Selecteer de order met de hoogste confidence score
-        original_orders_with_scores.sort(key=lambda x: x[1], reverse=True)
-        best_match, best_confidence = original_orders_with_scores[0]
-        
-        # Als er meerdere matches zijn met vergelijkbare confidence, log een waarschuwing
-        if len(original_orders_with_scores) > 1:
-            second_best_confidence = original_orders_with_scores[1][1]
-            if best_confidence - second_best_confidence < 10:  # Minder dan 10% verschil
-                logger.warning(f"AMBIGUOUS MATCH voor UpSell {upsell_order_id}: "
-                             f"Best match {best_match.order_id} ({best_confidence}%) vs "
-                             f"Second best {original_orders_with_scores[1][0].order_id} ({second_best_confidence}%)")
+            # Bereken confidence score
+            confidence = calculate_linking_confidence(
+                upsell_order_data, order, customer_email, customer_name, upsell_datetime,
+                customer_order_counts
+            )
+            
+            if confidence > MIN_LINK_CONFIDENCE:  # Alleen hoge confidence matches
+                original_orders_with_scores.append((order, confidence))
+                logger.info(f"Originele order {order.order_id} gevonden met confidence {confidence}%")
+            else:
+                logger.info(f"Originele order {order.order_id} afgewezen (confidence {confidence}% < 70%)")
         
-        logger.info(f"Originele order {best_match.order_id} geselecteerd voor UpSell {upsell_order_id} (confidence: {best_confidence}%)")
-        return best_match.order_id
+        best_match = _select_best_match(upsell_order_id, original_orders_with_scores)
+        return best_match.order_id if best_match is not None else None
         
     except Exception as e:
         logger.error(f"Fout bij zoeken naar originele order voor UpSell {upsell_order_id}: {str(e)}")
         return None
 
 
-def calculate_linking_confidence(upsell_data: Dict[str, Any], original_order, customer_email: str, customer_name: str, upsell_datetime: datetime, db_session: Session) -> float:
+def count_orders_per_customer(
+    db_session: Session, klant_namen: Iterable[Optional[str]], window_start: datetime, window_end: datetime
+) -> Dict[str, int]:
     """
-    Bereken confidence score voor een potentiële match tussen UpSell en originele order.
+    Telt in één gegroepeerde query het aantal orders per klantnaam binnen een tijdvenster.
     
     Args:
-        upsell_data: UpSell order data
-        original_order: Originele order object
-        customer_email: Customer email (kan None zijn)
-        customer_name: Customer name
-        upsell_datetime: UpSell order timestamp
+        db_session: SQLAlchemy database sessie
+        klant_namen: De klantnamen van de kandidaat-orders (None wordt genegeerd)
+        window_start: Begin van het venster (inclusief)
+        window_end: Einde van het venster (exclusief)
         
     Returns:
-        float: Confidence score (0-100)
+        dict: klant_naam -> aantal orders in het venster
     """
-    confidence = 0.0
+    from app.models.order import Order
+    
+    names = {name for name in klant_namen if name}
+    if not names:
+        return {}
+    rows = db_session.query(Order.klant_naam, func.count(Order.id)).filter(
+        Order.klant_naam.in_(names),
+        Order.bestel_datum >= window_start,
+        Order.bestel_datum < window_end
+    ).group_by(Order.klant_naam).all()
+    return {name: count for name, count in rows}
+
+
+def linking_score_components(upsell_data: Dict[str, Any], original_order, customer_email: str, customer_name: str, upsell_datetime: datetime, customer_order_counts: Dict[str, int]) -> Dict[str, float]:
+    """
+    Berekent de losse onderdelen van de confidence score (email, naam, tijd, product, herhaalklant).
+    
+    Voert zelf geen queries uit; het aantal orders per klant komt uit
+    count_orders_per_customer voor hetzelfde 7-dagen venster. De onderdelen worden
+    bewaard in upsell_link_candidates zodat reviewers kunnen zien waar een score vandaan komt.
+    
+    Args: zie calculate_linking_confidence
+        
+    Returns:
+        dict: onderdeel -> bijdrage in procentpunten (alleen onderdelen die meetellen)
+    """
+    components: Dict[str, float] = {}
     
     # Email matching (hoogste prioriteit)
     if customer_email and original_order.klant_email:
         if customer_email.lower() == original_order.klant_email.lower():
-            confidence += 50.0  # Email match is zeer betrouwbaar
+            components["email"] = 50.0  # Email match is zeer betrouwbaar
             logger.debug(f"Email match: +50% confidence")
     
     # Naam matching
     if customer_name:
         # Exacte naam match
         if original_order.klant_naam and customer_name.lower() == original_order.klant_naam.lower():
-            confidence += 30.0
+            components["naam"] = 30.0
             logger.debug(f"Exacte naam match: +30% confidence")
         # Voornaam match
         elif original_order.voornaam and customer_name.split()[0].lower() == original_order.voornaam.lower():
-            confidence += 15.0
+            components["naam"] = 15.0
             logger.debug(f"Voornaam match: +15% confidence")
         # Gedeeltelijke naam match
         elif original_order.klant_naam and customer_name.split()[0].lower() in original_order.klant_naam.lower():
-            confidence += 10.0
+            components["naam"] = 10.0
             logger.debug(f"Gedeeltelijke naam match: +10% confidence")
     
     # Tijdsperiode matching
     time_diff = (upsell_datetime - original_order.bestel_datum).total_seconds() / 3600  # uren
     
     if time_diff <= 1:  # Binnen 1 uur
-        confidence += 20.0
+        components["tijd"] = 20.0
         logger.debug(f"Binnen 1 uur: +20% confidence")
     elif time_diff <= 24:  # Binnen 24 uur
-        confidence += 15.0
+        components["tijd"] = 15.0
         logger.debug(f"Binnen 24 uur: +15% confidence")
     elif time_diff <= 168:  # Binnen 7 dagen
-        confidence += 10.0
+        components["tijd"] = 10.0
         logger.debug(f"Binnen 7 dagen: +10% confidence")
     else:
-        confidence -= 10.0  # Penalty voor te oude orders
+        components["tijd"] = -10.0  # Penalty voor te oude orders
         logger.debug(f"Te oude order: -10% confidence")
     
     # Product type validatie
@@ -189,29 +265,48 @@ def calculate_linking_confidence(upsell_data: Dict[str, Any], original_order, cu
             pivot_type = product.get("pivot", {}).get("type")
             
             if product_id in [274588, 289456] and pivot_type != "upsell":
-                confidence += 5.0  # Bonus voor correcte product type
+                components["product"] = 5.0  # Bonus voor correcte product type
                 logger.debug(f"Correcte product type: +5% confidence")
                 break
     
     # Check voor dubbele orders van dezelfde klant
     if original_order.klant_naam:
-        # Tel hoeveel orders deze klant heeft in de afgelopen 7 dagen
-        from datetime import timedelta
-        recent_orders = db_session.query(Order).filter(
-            Order.klant_naam == original_order.klant_naam,
-            Order.bestel_datum >= upsell_datetime - timedelta(days=7),
-            Order.bestel_datum < upsell_datetime,
-            Order.order_id != original_order.order_id
-        ).count()
+        # Aantal andere orders van deze klant in de afgelopen 7 dagen (de order zelf telt niet mee)
+        recent_orders = max(customer_order_counts.get(original_order.klant_naam, 0) - 1, 0)
         
         if recent_orders > 0:
-            confidence -= (recent_orders * 5.0)  # Penalty voor meerdere orders
+            components["herhaalklant"] = -(recent_orders * 5.0)  # Penalty voor meerdere orders
             logger.debug(f"Meerdere orders van klant: -{recent_orders * 5}% confidence")
     
-    # Cap confidence op 100%
-    confidence = min(confidence, 100.0)
+    return components
+
+
+def confidence_from_components(components: Dict[str, float]) -> float:
+    """Telt de onderdelen op tot de confidence score (max 100%)."""
+    return min(sum(components.values(), 0.0), 100.0)
+
+
+def calculate_linking_confidence(upsell_data: Dict[str, Any], original_order, customer_email: str, customer_name: str, upsell_datetime: datetime, customer_order_counts: Dict[str, int]) -> float:
+    """
+    Bereken confidence score voor een potentiële match tussen UpSell en originele order.
+    
+    Voert zelf geen queries uit; het aantal orders per klant komt uit
+    count_orders_per_customer voor hetzelfde 7-dagen venster.
     
-    return confidence
+    Args:
+        upsell_data: UpSell order data
+        original_order: Originele order object
+        customer_email: Customer email (kan None zijn)
+        customer_name: Customer name
+        upsell_datetime: UpSell order timestamp
+        customer_order_counts: klant_naam -> aantal orders in de 7 dagen voor de UpSell
+        
+    Returns:
+        float: Confidence score (0-100)
+    """
+    return confidence_from_components(linking_score_components(
+        upsell_data, original_order, customer_email, customer_name, upsell_datetime, customer_order_counts
+    ))
 
 
 def inherit_theme_from_original(db_session: Session, upsell_order, original_order_id: int) -> bool:
@@ -247,4 +342,430 @@ def inherit_theme_from_original(db_session: Session, upsell_order, original_orde
             
     except Exception as e:
         logger.error(f"Fout bij overnemen thema van order {original_order_id}: {str(e)}")
-        return False 
\ No newline at end of file
+        return False 
+
+def _score_upsells(db_session: Session, upsells: List[Any]) -> List[Tuple[Any, List[Tuple[Any, Dict[str, float], float]]]]:
+    """
+    Berekent voor een reeks UpSells alle kandidaten met hun score, met een vast aantal queries.
+    
+    Kandidaten zijn standaard orders in het 7-dagen venster met hetzelfde e-mailadres of
+    exact dezelfde naam. Andere orders halen hooguit 40% (voornaam 15 + tijd 20
+    + product 5) en vallen dus buiten zowel de koppeldrempel als de dubieuze band.
+    
+    Queries (ongeacht het aantal UpSells):
+    1. Alle standaard orders van die klanten in het gecombineerde venster
+    2. (klant_naam, bestel_datum) van alle orders met die klantnamen in dat venster,
+       voor de straf op herhaalde bestellingen
+    Daarna wordt per klant in het geheugen gematcht (gesorteerd op bestel_datum, met
+    bisect per UpSell).
+    
+    Args:
+        db_session: SQLAlchemy database sessie
+        upsells: Rijen met id, order_id, raw_data en thema
+        
+    Returns:
+        list: (upsell, [(kandidaat, onderdelen, confidence), ...]) per UpSell met een geldige payload
+    """
+    from app.models.order import Order
+    
+    parsed_upsells = []
+    for upsell in upsells:
+        parsed = parse_upsell(upsell.raw_data or {"id": upsell.order_id})
+        if parsed is None:
+            continue
+        upsell_datetime, customer_email, customer_name = parsed
+        parsed_upsells.append((
+            upsell, upsell_datetime, customer_email, customer_name,
+            normalize_email(customer_email), customer_name.lower() if customer_name else None
+        ))
+    if not parsed_upsells:
+        return []
+    
+    emails = {item[4] for item in parsed_upsells if item[4]}
+    lower_names = {item[5] for item in parsed_upsells if item[5]}
+    window_start = min(item[1] for item in parsed_upsells) - LINK_WINDOW
+    window_end = max(item[1] for item in parsed_upsells)
+    
+    customer_filters = []
+    if emails:
+        customer_filters.append(Order.klant_email_norm.in_(emails))
+    if lower_names:
+        customer_filters.append(func.lower(Order.klant_naam).in_(lower_names))
+    if not customer_filters:
+        return [(item[0], []) for item in parsed_upsells]
+    originals = db_session.query(
+        Order.order_id, Order.klant_naam, Order.klant_email, Order.voornaam,
+        Order.bestel_datum, Order.raw_data, Order.thema, Order.klant_email_norm
+    ).filter(
+        or_(*customer_filters),
+        Order.bestel_datum >= window_start,
+        Order.bestel_datum < window_end,
+        Order.primary_product_id.in_(MAIN_PRODUCT_IDS)
+    ).order_by(Order.bestel_datum).all()
+    
+    # Per klantsleutel gesorteerd op bestel_datum (de query levert ze al op volgorde)
+    originals_by_key: Dict[Tuple[str, str], List[Any]] = {}
+    for original in originals:
+        if original.klant_email_norm:
+            originals_by_key.setdefault(("email", original.klant_email_norm), []).append(original)
+        if original.klant_naam:
+            originals_by_key.setdefault(("naam", original.klant_naam.lower()), []).append(original)
+    dates_by_key = {
+        key: [original.bestel_datum for original in rows] for key, rows in originals_by_key.items()
+    }
+    
+    # Bestel_data per klantnaam (alle producten, alle e-mailadressen) voor count_orders_per_customer-semantiek
+    names = {original.klant_naam for original in originals if original.klant_naam}
+    dates_by_name: Dict[str, List[datetime]] = {}
+    if names:
+        for klant_naam, bestel_datum in db_session.query(Order.klant_naam, Order.bestel_datum).filter(
+            Order.klant_naam.in_(names),
+            Order.bestel_datum >= window_start,
+            Order.bestel_datum < window_end
+        ).order_by(Order.bestel_datum):
+            dates_by_name.setdefault(klant_naam, []).append(bestel_datum)
+    
+    results = []
+    for upsell, upsell_datetime, customer_email, customer_name, email_norm, lower_name in parsed_upsells:
+        search_start = upsell_datetime - LINK_WINDOW
+        candidates: Dict[int, Any] = {}
+        for key in (("email", email_norm), ("naam", lower_name)):
+            rows = originals_by_key.get(key, [])
+            dates = dates_by_key.get(key, [])
+            for original in rows[bisect_left(dates, search_start):bisect_left(dates, upsell_datetime)]:
+                if original.order_id != upsell.order_id:
+                    candidates.setdefault(original.order_id, original)
+        
+        customer_order_counts = {}
+        for original in candidates.values():
+            name_dates = dates_by_name.get(original.klant_naam, [])
+            customer_order_counts[original.klant_naam] = (
+                bisect_left(name_dates, upsell_datetime) - bisect_left(name_dates, search_start)
+            )
+        
+        scored = []
+        for original in candidates.values():
+            components = linking_score_components(
+                upsell.raw_data, original, customer_email, customer_name, upsell_datetime, customer_order_counts
+            )
+            scored.append((original, components, confidence_from_components(components)))
+        results.append((upsell, scored))
+    return results
+
+
+def _store_candidates(db_session: Session, scored_upsells: List[Tuple[Any, List[Tuple[Any, Dict[str, float], float]]]]) -> int:
+    """
+    Vervangt de opgeslagen kandidaten van de gegeven UpSells door de nieuw berekende scores
+    en markeert de UpSells als gescoord (ook als er geen kandidaten zijn).
+    """
+    from app.models.upsell_link_candidate import UpsellLinkCandidate, UpsellLinkScore
+    
+    table = UpsellLinkCandidate.__table__
+    scores = UpsellLinkScore.__table__
+    upsell_ids = [upsell.order_id for upsell, _ in scored_upsells]
+    now = datetime.utcnow()
+    rows = [
+        {
+            "upsell_order_id": upsell.order_id,
+            "candidate_order_id": original.order_id,
+            "score": confidence,
+            "components": components,
+            "computed_at": now
+        }
+        for upsell, scored in scored_upsells
+        for original, components, confidence in scored
+    ]
+    for start in range(0, len(upsell_ids), CANDIDATE_WRITE_BATCH_SIZE):
+        db_session.execute(
+            delete(table).where(table.c.upsell_order_id.in_(upsell_ids[start:start + CANDIDATE_WRITE_BATCH_SIZE]))
+        )
+    for start in range(0, len(rows), CANDIDATE_WRITE_BATCH_SIZE):
+        db_session.execute(pg_insert(table).values(rows[start:start + CANDIDATE_WRITE_BATCH_SIZE]))
+    
+    score_rows = [
+        {"upsell_order_id": upsell.order_id, "candidate_count": len(scored), "scored_at": now}
+        for upsell, scored in scored_upsells
+    ]
+    for start in range(0, len(score_rows), CANDIDATE_WRITE_BATCH_SIZE):
+        stmt = pg_insert(scores).values(score_rows[start:start + CANDIDATE_WRITE_BATCH_SIZE])
+        db_session.execute(stmt.on_conflict_do_update(
+            index_elements=[scores.c.upsell_order_id],
+            set_={"candidate_count": stmt.excluded.candidate_count, "scored_at": stmt.excluded.scored_at}
+        ))
+    return len(rows)
+
+
+def refresh_upsell_candidates(db_session: Session, upsell_order_ids: Iterable[int]) -> int:
+    """
+    Berekent en bewaart de kandidaten voor specifieke UpSells (bijv. na invalidatie).
+    
+    Args:
+        db_session: SQLAlchemy database sessie
+        upsell_order_ids: Plug&Pay order_ids van de UpSells
+        
+    Returns:
+        int: Aantal opgeslagen kandidaten
+    """
+    from app.models.order import Order
+    
+    upsell_order_ids = list(upsell_order_ids)
+    if not upsell_order_ids:
+        return 0
+    upsells = db_session.query(
+        Order.id, Order.order_id, Order.raw_data, Order.thema
+    ).filter(Order.order_id.in_(upsell_order_ids)).all()
+    scored_upsells = _score_upsells(db_session, upsells)
+    # UpSells zonder geldige payload gelden ook als gescoord (zonder kandidaten)
+    scored_ids = {upsell.order_id for upsell, _ in scored_upsells}
+    scored_upsells += [(upsell, []) for upsell in upsells if upsell.order_id not in scored_ids]
+    stored = _store_candidates(db_session, scored_upsells)
+    db_session.commit()
+    return stored
+
+
+def invalidate_candidates_for_new_orders(connection, order_ids: Union[Iterable[int], Select]) -> None:
+    """
+    Verwijdert de opgeslagen kandidaten van UpSells waarvoor nieuwe orders een extra kandidaat kunnen zijn.
+    
+    Dat zijn UpSells van dezelfde klant (e-mail of naam) binnen 7 dagen na de nieuwe order.
+    
+    Args:
+        connection: SQLAlchemy Connection of Session
+        order_ids: Plug&Pay order_ids van de nieuwe orders (of een SELECT die ze oplevert)
+    """
+    from app.models.order import Order
+    from app.models.upsell_link_candidate import UpsellLinkCandidate, UpsellLinkScore
+    
+    if not isinstance(order_ids, Select):
+        order_ids = list(order_ids)
+        if not order_ids:
+            return
+    new_order = Order.__table__.alias("new_order")
+    upsell = Order.__table__.alias("upsell")
+    affected_upsells = select(upsell.c.order_id).select_from(upsell.join(new_order, and_(
+        new_order.c.order_id.in_(order_ids),
+        upsell.c.is_upsell.is_(True),
+        upsell.c.bestel_datum > new_order.c.bestel_datum,
+        upsell.c.bestel_datum <= new_order.c.bestel_datum + LINK_WINDOW,
+        or_(
+            upsell.c.klant_email_norm == new_order.c.klant_email_norm,
+            func.lower(upsell.c.klant_naam) == func.lower(new_order.c.klant_naam)
+        )
+    )))
+    candidates = UpsellLinkCandidate.__table__
+    scores = UpsellLinkScore.__table__
+    connection.execute(delete(scores).where(scores.c.upsell_order_id.in_(affected_upsells)))
+    connection.execute(delete(candidates).where(candidates.c.upsell_order_id.in_(affected_upsells)))
+
+
+def _candidate_query(db_session: Session):
+    """Basisquery voor opgeslagen kandidaten met de weergavevelden van de kandidaat-order (zonder raw_data)."""
+    from app.models.order import Order
+    from app.models.upsell_link_candidate import UpsellLinkCandidate
+    
+    return db_session.query(
+        UpsellLinkCandidate.id,
+        UpsellLinkCandidate.upsell_order_id,
+        UpsellLinkCandidate.score,
+        UpsellLinkCandidate.components,
+        UpsellLinkCandidate.computed_at,
+        Order.order_id,
+        Order.klant_naam,
+        Order.klant_email,
+        Order.voornaam,
+        Order.bestel_datum,
+        Order.thema,
+        Order.product_naam
+    ).join(Order, Order.order_id == UpsellLinkCandidate.candidate_order_id)
+
+
+def is_upsell_scored(db_session: Session, upsell_order_id: int) -> bool:
+    """
+    Geeft aan of de linker deze UpSell heeft gescoord sinds de laatste invalidatie.
+    
+    Een gescoorde UpSell zonder kandidaten heeft geen rijen in upsell_link_candidates,
+    maar wel een markering in upsell_link_scores.
+    """
+    from app.models.upsell_link_candidate import UpsellLinkScore
+    
+    return db_session.query(
+        db_session.query(UpsellLinkScore).filter(UpsellLinkScore.upsell_order_id == upsell_order_id).exists()
+    ).scalar()
+
+
+def get_stored_candidates(db_session: Session, upsell_order_id: int) -> List[Any]:
+    """
+    Haalt de opgeslagen kandidaten van één UpSell op, beste eerst.
+    
+    Eén query via idx_upsell_link_candidates_upsell_score.
+    
+    Returns:
+        list: Rijen met score, components, computed_at en de velden van de kandidaat-order
+    """
+    from app.models.upsell_link_candidate import UpsellLinkCandidate
+    
+    return _candidate_query(db_session).filter(
+        UpsellLinkCandidate.upsell_order_id == upsell_order_id
+    ).order_by(UpsellLinkCandidate.score.desc(), UpsellLinkCandidate.id.desc()).all()
+
+
+def page_stored_candidates(
+    db_session: Session,
+    min_score: float,
+    max_score: float,
+    limit: int,
+    after: Optional[Tuple[float, int]] = None
+) -> List[Any]:
+    """
+    Haalt een pagina kandidaten over alle UpSells op met min_score < score <= max_score.
+    
+    Gesorteerd op (score, id) aflopend, met keyset-paginatie via idx_upsell_link_candidates_score_id.
+    
+    Args:
+        db_session: SQLAlchemy database sessie
+        min_score: Ondergrens (exclusief)
+        max_score: Bovengrens (inclusief)
+        limit: Maximaal aantal rijen
+        after: (score, id) van de laatste rij van de vorige pagina
+        
+    Returns:
+        list: Rijen zoals bij get_stored_candidates
+    """
+    from app.models.upsell_link_candidate import UpsellLinkCandidate
+    
+    query = _candidate_query(db_session).filter(
+        UpsellLinkCandidate.score > min_score,
+        UpsellLinkCandidate.score <= max_score
+    )
+    if after is not None:
+        query = query.filter(tuple_(UpsellLinkCandidate.score, UpsellLinkCandidate.id) < tuple_(*after))
+    return query.order_by(UpsellLinkCandidate.score.desc(), UpsellLinkCandidate.id.desc()).limit(limit).all()
+
+
+def link_upsells_in_bulk(db_session: Session) -> Dict[str, int]:
+    """
+    Koppelt alle nog niet gelinkte UpSell orders in één keer aan hun originele orders.
+    
+    Dezelfde regels als find_original_order_for_upsell, maar met een vast aantal
+    queries voor de hele backlog: één voor de ongelinkte UpSells (partiële index op
+    is_upsell) en twee voor de kandidaten (zie _score_upsells). Alle scores worden in
+    upsell_link_candidates bewaard voor GET /orders/upsell-matches, en alle koppelingen
+    worden met één UPDATE ... FROM (VALUES ...) teruggeschreven.
+    
+    Args:
+        db_session: SQLAlchemy database sessie
+        
+    Returns:
+        dict: processed (ongelinkte UpSells), linked, themes_inherited en candidates (opgeslagen scores)
+    """
+    from app.models.order import Order
+    
+    upsells = db_session.query(
+        Order.id, Order.order_id, Order.raw_data, Order.thema
+    ).filter(
+        Order.is_upsell.is_(True),
+        Order.origin_song_id.is_(None)
+    ).all()
+    result = {"processed": len(upsells), "linked": 0, "themes_inherited": 0, "candidates": 0}
+    
+    scored_upsells = _score_upsells(db_session, upsells)
+    result["candidates"] = _store_candidates(db_session, scored_upsells)
+    
+    links = []
+    for upsell, scored in scored_upsells:
+        # Zonder e-mail match haalt een kandidaat nooit de drempel (zie find_original_order_for_upsell)
+        high_confidence = [
+            (original, confidence) for original, _, confidence in scored if confidence > MIN_LINK_CONFIDENCE
+        ]
+        best_match = _select_best_match(upsell.order_id, high_confidence)
+        if best_match is None:
+            continue
+        
+        # Neem het thema over als de UpSell er zelf geen heeft
+        inherited_thema = best_match.thema if upsell.thema in EMPTY_THEMES and best_match.thema else None
+        links.append((upsell.id, best_match.order_id, inherited_thema))
+        result["linked"] += 1
+        if inherited_thema:
+            result["themes_inherited"] += 1
+    
+    if links:
+        table = Order.__table__
+        new_links = values(
+            column("id", table.c.id.type),
+            column("origin_song_id", table.c.origin_song_id.type),
+            column("thema", table.c.thema.type),
+            name="new_links"
+        ).data(links)
+        db_session.execute(
+            update(table)
+            .values(
+                origin_song_id=new_links.c.origin_song_id,
+                thema=func.coalesce(new_links.c.thema, table.c.thema),
+                # thema is een bron voor de afgeleide velden; markeer overgenomen thema's als verouderd
+                derived_version=case((new_links.c.thema.is_(None), table.c.derived_version), else_=None)
+            )
+            .where(table.c.id == new_links.c.id)
+        )
+    db_session.commit()
+    
+    logger.info(
+        f"Bulk UpSell linking: {result['linked']} van {result['processed']} UpSells gekoppeld, "
+        f"{result['themes_inherited']} thema's overgenomen, {result['candidates']} kandidaten opgeslagen"
+    )
+    return result
+
+
+def propagate_songtext_to_upsells(db_session: Session, original_order_id: int, songtext: str) -> int:
+    """
+    Zet de songtekst van een originele order in alle gekoppelde UpSells zonder eigen songtekst.
+    
+    Eén INSERT ... SELECT in songtexts: per UpSell zonder (niet-lege) huidige songtekst
+    wordt een nieuwe versie toegevoegd. Een oude songtekst in raw_data telt ook als
+    eigen songtekst. raw_data zelf wordt niet gewijzigd.
+    
+    Args:
+        db_session: SQLAlchemy database sessie
+        original_order_id: Plug&Pay order_id van de originele order
+        songtext: De nieuwe songtekst
+        
+    Returns:
+        int: Aantal bijgewerkte UpSells
+    """
+    from app.models.order import Order
+    from app.models.songtext import Songtext
+    
+    orders = Order.__table__
+    songtexts = Songtext.__table__
+    current_songtext = (
+        select(songtexts.c.songtekst)
+        .where(songtexts.c.order_id == orders.c.order_id)
+        .order_by(songtexts.c.version.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    next_version = (
+        select(func.coalesce(func.max(songtexts.c.version), 0) + 1)
+        .where(songtexts.c.order_id == orders.c.order_id)
+        .scalar_subquery()
+    )
+    new_versions = select(
+        orders.c.order_id,
+        next_version,
+        literal(songtext, Text),
+        literal(SONGTEXT_SYNC_AUTHOR, songtexts.c.author.type),
+        literal(datetime.utcnow(), songtexts.c.created_at.type)
+    ).where(
+        orders.c.origin_song_id == original_order_id,
+        func.btrim(func.coalesce(current_songtext, orders.c.raw_data.op("->>")("songtekst"), "")) == ""
+    )
+    stmt = insert(songtexts).from_select(
+        ["order_id", "version", "songtekst", "author", "created_at"], new_versions
+    )
+    updated = db_session.execute(stmt).rowcount
+    db_session.commit()
+    
+    if updated:
+        logger.info(f"Songtekst gesynchroniseerd naar {updated} UpSell orders voor originele order {original_order_id}")
+    else:
+        logger.info(f"Geen UpSell orders bijgewerkt voor originele order {original_order_id} (alleen orders zonder bestaande songtekst)")
+    return updated
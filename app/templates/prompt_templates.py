@@ -3,9 +3,15 @@ Module voor het beheren van prompt templates voor verschillende songstijlen.
 Nu geïntegreerd met de Thema Database voor dynamische elementen.
 """
 
+import logging
 import random
+from functools import lru_cache
 from sqlalchemy.orm import Session
 from app.services.thema_service import ThemaService, get_thema_service
+from app.templates.template_registry import PromptTemplate, TemplateRegistry, compile_template
+
+# Configureer logging
+logger = logging.getLogger(__name__)
 
 # Originele templates blijven beschikbaar als fallback
 FALLBACK_TEMPLATES = {
@@ -474,29 +480,8 @@ Take a deep breath and work on this problem step-by-step.
 
 """
 
-def get_template(style: str) -> str:
-    """
-    Haalt de template op voor een specifieke stijl.
-    Als de stijl niet bestaat, wordt een algemene template gebruikt.
-    
-    Args:
-        style: De gewenste stijl voor de songtekst
-        
-    Returns:
-        De template string voor de opgegeven stijl
-    """
-    style_lower = style.lower()
-    
-    if style_lower in FALLBACK_TEMPLATES:
-        return FALLBACK_TEMPLATES[style_lower]
-    
-    # Zoek naar gedeeltelijke matches
-    for key in FALLBACK_TEMPLATES:
-        if key in style_lower or style_lower in key:
-            return FALLBACK_TEMPLATES[key]
-    
-    # Fallback naar algemene template
-    return """🎵 Prompt voor ManusAI – lied voor {ontvanger}.
+# Algemene template voor stijlen zonder eigen template
+GENERIC_TEMPLATE = """🎵 Prompt voor ManusAI – lied voor {ontvanger}.
 
 Schrijf een origineel Nederlandstalig lied voor {ontvanger}, van {van}.
 Over {ontvanger}: {beschrijving}
@@ -511,6 +496,51 @@ Extra wensen: {extra_wens}
 
 Maak een complete songtekst met coupletten en refrein."""
 
+# Velden die de stijl-templates mogen gebruiken (de keys van song_data)
+SONG_DATA_FIELDS = frozenset({"ontvanger", "van", "beschrijving", "stijl", "extra_wens"})
+# Professionele prompts (ook die per thema in de database) krijgen alleen de beschrijving
+PROFESSIONAL_FIELDS = frozenset({"beschrijving"})
+
+# Alle vaste templates worden bij het laden van de module één keer gecompileerd en gevalideerd
+TEMPLATES = TemplateRegistry()
+for _style, _text in FALLBACK_TEMPLATES.items():
+    TEMPLATES.register(_style, _text, SONG_DATA_FIELDS)
+TEMPLATES.register("algemeen", GENERIC_TEMPLATE, SONG_DATA_FIELDS)
+TEMPLATES.register("professional", PROFESSIONAL_DUTCH_SONGWRITER_TEMPLATE, PROFESSIONAL_FIELDS)
+
+
+@lru_cache(maxsize=512)
+def _resolve_template_key(style_lower: str) -> str:
+    """Bepaalt (eenmalig per stijl) welke template bij een stijl hoort."""
+    if style_lower in FALLBACK_TEMPLATES:
+        return style_lower
+    
+    # Zoek naar gedeeltelijke matches
+    for key in FALLBACK_TEMPLATES:
+        if key in style_lower or style_lower in key:
+            return key
+    
+    # Fallback naar algemene template
+    return "algemeen"
+
+def get_compiled_template(style: str) -> PromptTemplate:
+    """Geeft de voorgecompileerde template voor een stijl (zie get_template)."""
+    return TEMPLATES.get(_resolve_template_key(style.lower()))
+
+def get_template(style: str) -> str:
+    """
+    Haalt de template op voor een specifieke stijl.
+    Als de stijl niet bestaat, wordt een algemene template gebruikt.
+    
+    Args:
+        style: De gewenste stijl voor de songtekst
+        
+    Returns:
+        De template string voor de opgegeven stijl
+    """
+    key = _resolve_template_key(style.lower())
+    return FALLBACK_TEMPLATES.get(key, GENERIC_TEMPLATE)
+
 def generate_professional_prompt(order_description: str) -> str:
     """
     Genereert een professionele Nederlandse songtekst prompt op basis van order beschrijving.
@@ -522,7 +552,7 @@ def generate_professional_prompt(order_description: str) -> str:
     Returns:
         Complete prompt string voor AI generatie
     """
-    return PROFESSIONAL_DUTCH_SONGWRITER_TEMPLATE.format(beschrijving=order_description)
+    return TEMPLATES.get("professional").render(beschrijving=order_description)
 
 def generate_enhanced_prompt(song_data: dict, db: Session = None, use_suno: bool = False, thema_id: int = None, use_professional: bool = True) -> str:
     """
@@ -548,10 +578,14 @@ def generate_enhanced_prompt(song_data: dict, db: Session = None, use_suno: bool
     
     # Gebruik altijd professionele prompt (basis prompt is weggehaald)
     if thema_data and thema_data.get('professional_prompt'):
-        return thema_data['professional_prompt'].format(beschrijving=song_data.get("beschrijving", ""))
-    else:
-        # Fallback naar algemene professionele prompt
-        return generate_professional_prompt(song_data.get("beschrijving", ""))
+        try:
+            template = compile_template(thema_data['professional_prompt'], PROFESSIONAL_FIELDS)
+            return template.render(beschrijving=song_data.get("beschrijving", ""))
+        except ValueError as e:
+            logger.warning(f"Professionele prompt van thema '{thema_data.get('thema_name')}' ongeldig, algemene prompt gebruikt: {e}")
+    
+    # Fallback naar algemene professionele prompt
+    return generate_professional_prompt(song_data.get("beschrijving", ""))
 
 def _generate_suno_prompt(song_data: dict, thema_data: dict) -> str:
     """Genereer Suno.ai geoptimaliseerde prompt"""
@@ -594,24 +628,22 @@ Genereer een professionele Nederlandse songtekst die deze parameters optimaal ge
 
 def _generate_standard_prompt(song_data: dict, thema_data: dict) -> str:
     """Genereer standaard enhanced prompt"""
-    base_template = get_template(song_data["stijl"])
+    prompt = get_compiled_template(song_data["stijl"]).render(**song_data)
     
     if thema_data and thema_data['keywords']:
-        # Verrijk de template met database elementen
+        # Verrijk de prompt met database elementen (als platte tekst, niet als template)
         keywords = ", ".join(thema_data['keywords'][:4])
         power_phrase = random.choice(thema_data['power_phrases']) if thema_data['power_phrases'] else ""
         
-        enhanced_template = base_template + f"""
+        return prompt + f"""
 
 THEMA-SPECIFIEKE ELEMENTEN:
 - Gebruik deze woorden: {keywords}
 - Probeer deze zin te integreren: "{power_phrase}"
 - Rijmwoorden suggestie: {" - ".join(thema_data['rhyme_words'][:3])}"""
-        
-        return enhanced_template.format(**song_data)
     else:
         # Fallback naar originele template
-        return base_template.format(**song_data)
+        return prompt
 
 def generate_prompt(song_data: dict, db: Session = None) -> str:
     """
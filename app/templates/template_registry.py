@@ -0,0 +1,126 @@
+"""
+Module met voorgecompileerde prompt templates.
+
+Een template wordt één keer opgesplitst in vaste tekst en placeholders; de
+placeholders worden daarbij gecontroleerd tegen de toegestane velden. Renderen
+vult alleen nog de placeholders in een kopie van de vooraf opgebouwde lijst met
+delen en plakt die met één join aan elkaar. Aangrenzende vaste tekst is al
+samengevoegd; een template met één placeholder (de professionele templates, alleen
+{beschrijving}) wordt gerenderd als prefix + waarde + suffix, zodat de lange vaste
+tekst één kant-en-klaar stuk is en per request alleen de staart varieert.
+"""
+
+import logging
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Configureer logging
+logger = logging.getLogger(__name__)
+
+# Aantal verschillende (thema-)templates dat gecompileerd wordt bewaard
+TEMPLATE_CACHE_SIZE = 256
+
+_formatter = Formatter()
+
+
+class PromptTemplate:
+    """
+    Een template die één keer is geparsed naar vaste tekst en placeholders.
+
+    Ondersteunt dezelfde syntax als str.format met alleen eenvoudige {veld}
+    placeholders ({{ en }} voor letterlijke accolades).
+    """
+
+    def __init__(self, text: str, allowed_fields: Optional[Iterable[str]] = None, name: str = "template"):
+        """
+        Parseert en valideert de template.
+
+        Args:
+            text: De template tekst
+            allowed_fields: Toegestane placeholders (None: alles toegestaan)
+            name: Naam voor foutmeldingen en logging
+
+        Raises:
+            ValueError: Bij ongeldige syntax, format specs/conversies of onbekende placeholders
+        """
+        self.name = name
+        parts: List[str] = []
+        slots: List[Tuple[int, str]] = []
+        literal: List[str] = []
+        try:
+            parsed = list(_formatter.parse(text))
+        except ValueError as e:
+            raise ValueError(f"Ongeldige template '{name}': {e}") from e
+
+        for literal_text, field, format_spec, conversion in parsed:
+            literal.append(literal_text)
+            if field is None:
+                continue
+            if not field.isidentifier() or format_spec or conversion:
+                raise ValueError(f"Ongeldige placeholder '{{{field}}}' in template '{name}'")
+            if literal:
+                parts.append("".join(literal))
+                literal = []
+            slots.append((len(parts), field))
+            parts.append("")
+        if literal:
+            parts.append("".join(literal))
+
+        self.fields: FrozenSet[str] = frozenset(field for _, field in slots)
+        if allowed_fields is not None:
+            unknown = self.fields - set(allowed_fields)
+            if unknown:
+                raise ValueError(f"Onbekende placeholders in template '{name}': {', '.join(sorted(unknown))}")
+
+        self._parts: Tuple[str, ...] = tuple(parts)
+        self._slots: Tuple[Tuple[int, str], ...] = tuple(slots)
+        # Vaste tekst voor en na de eerste placeholder (bij de professionele templates vrijwel alles)
+        first = slots[0][0] if slots else len(parts)
+        self.prefix = "".join(parts[:first])
+        self.suffix = "".join(parts[first + 1:])
+
+    def render(self, **values) -> str:
+        """
+        Vult de placeholders in.
+
+        Raises:
+            KeyError: Als een gebruikte placeholder geen waarde heeft (net als str.format)
+        """
+        if len(self._slots) == 1:
+            return self.prefix + format(values[self._slots[0][1]]) + self.suffix
+        parts = list(self._parts)
+        for index, field in self._slots:
+            parts[index] = format(values[field])
+        return "".join(parts)
+
+
+class TemplateRegistry:
+    """Register van voorgecompileerde templates op naam."""
+
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, text: str, allowed_fields: Optional[Iterable[str]] = None) -> PromptTemplate:
+        """Compileert en registreert een template; fouten komen direct bij het laden naar boven."""
+        template = PromptTemplate(text, allowed_fields, name)
+        self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        """Geeft een geregistreerde template (KeyError als de naam onbekend is)."""
+        return self._templates[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(text: str, allowed_fields: Optional[FrozenSet[str]] = None) -> PromptTemplate:
+    """
+    Compileert een template uit de database (bijv. Thema.professional_prompt), met cache op de tekst.
+
+    Een gewijzigde tekst is automatisch een nieuwe cache-sleutel; er hoeft niets
+    geïnvalideerd te worden.
+    """
+    return PromptTemplate(text, allowed_fields, name="thema")
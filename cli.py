@@ -29,21 +29,48 @@ def setup_db():
     init_db()
     logger.info("Database tabellen succesvol geïnitialiseerd")
 
-def fetch_orders():
-    """Haalt recente bestellingen op van Plug&Pay en slaat ze op in de database."""
+def fetch_orders(incremental=False):
+    """
+    Haalt recente bestellingen op van Plug&Pay en slaat ze op in de database.
+    
+    Args:
+        incremental: Alle pagina's sinds de vorige sync doorlopen (met opgeslagen cursor)
+    """
     from app.db.session import SessionLocal
     from app.services.plugpay_client import fetch_and_store_recent_orders
     
     logger.info("Bestellingen ophalen van Plug&Pay API...")
     db = SessionLocal()
     try:
-        added, skipped = fetch_and_store_recent_orders(db)
+        added, skipped = fetch_and_store_recent_orders(db, incremental=incremental)
         logger.info(f"Resultaat: {added} nieuwe bestellingen toegevoegd, {skipped} overgeslagen")
     except Exception as e:
         logger.error(f"Fout bij ophalen van bestellingen: {str(e)}")
     finally:
         db.close()
 
+def backfill_derived(batch_size=500, force=False):
+    """
+    Berekent de gematerialiseerde afgeleide velden voor bestaande bestellingen.
+    
+    Args:
+        batch_size: Aantal bestellingen per batch (commit per batch)
+        force: Alle bestellingen opnieuw afleiden, ook als ze al up-to-date zijn
+    """
+    from app.db.session import SessionLocal
+    from app.services.order_derivation import backfill_derived_fields
+    
+    logger.info("Afgeleide velden van bestellingen bijwerken...")
+    db = SessionLocal()
+    try:
+        updated = backfill_derived_fields(db, batch_size=batch_size, force=force)
+        logger.info(f"Resultaat: {updated} bestellingen bijgewerkt")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Fout bij bijwerken van afgeleide velden: {str(e)}")
+    finally:
+        db.close()
+
 def main():
     """Hoofdfunctie voor de CLI."""
     parser = argparse.ArgumentParser(description="Song Scribe API CLI")
@@ -53,14 +80,26 @@ def main():
     subparsers.add_parser("init-db", help="Initialiseert de database tabellen")
     
     # Commando voor het ophalen van bestellingen
-    subparsers.add_parser("fetch-orders", help="Haalt recente bestellingen op van Plug&Pay")
+    fetch_parser = subparsers.add_parser("fetch-orders", help="Haalt recente bestellingen op van Plug&Pay")
+    fetch_parser.add_argument("--incremental", action="store_true",
+                              help="Alle pagina's sinds de vorige sync doorlopen en ongewijzigde bestellingen overslaan")
+    
+    # Commando voor het (opnieuw) afleiden van de weergavevelden
+    backfill_parser = subparsers.add_parser("backfill-derived",
+                                            help="Berekent de afgeleide velden voor bestaande bestellingen")
+    backfill_parser.add_argument("--batch-size", type=int, default=500,
+                                 help="Aantal bestellingen per batch")
+    backfill_parser.add_argument("--force", action="store_true",
+                                 help="Alle bestellingen opnieuw afleiden, ook als ze al up-to-date zijn")
     
     args = parser.parse_args()
     
     if args.command == "init-db":
         setup_db()
     elif args.command == "fetch-orders":
-        fetch_orders()
+        fetch_orders(incremental=args.incremental)
+    elif args.command == "backfill-derived":
+        backfill_derived(batch_size=args.batch_size, force=args.force)
     else:
         parser.print_help()
 
@@ -426,6 +426,486 @@ def run_rhyme_pairs_fix_migration(conn_params):
         logger.error(f"Error running rhyme_pairs fix migration: {e}")
         return False
 
+def run_sync_state_migration(conn_params):
+    """Create the sync_state table used for incremental sync cursors."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if sync_state table already exists
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'sync_state'
+            );
+        """)
+        
+        if cursor.fetchone()[0]:
+            logger.info("sync_state table already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Creating sync_state table...")
+        cursor.execute("""
+            CREATE TABLE sync_state (
+                key VARCHAR PRIMARY KEY,
+                value JSONB,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+            )
+        """)
+        logger.info("✅ Created sync_state table")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error creating sync_state table: {e}")
+        return False
+
+def run_order_ingest_queue_migration(conn_params):
+    """Create the order_ingest_queue table used by the webhook ingest worker."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if order_ingest_queue table already exists
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'order_ingest_queue'
+            );
+        """)
+        
+        if cursor.fetchone()[0]:
+            logger.info("order_ingest_queue table already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Creating order_ingest_queue table...")
+        cursor.execute("""
+            CREATE TABLE order_ingest_queue (
+                id SERIAL PRIMARY KEY,
+                order_id INTEGER NOT NULL UNIQUE,
+                status VARCHAR DEFAULT 'pending' NOT NULL,
+                source VARCHAR,
+                payload JSONB,
+                attempts INTEGER DEFAULT 0 NOT NULL,
+                last_error TEXT,
+                available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                processed_at TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX idx_order_ingest_queue_status_available ON order_ingest_queue (status, available_at)")
+        logger.info("✅ Created order_ingest_queue table")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error creating order_ingest_queue table: {e}")
+        return False
+
+def run_orders_keyset_index_migration(conn_params):
+    """Create the (bestel_datum DESC, id DESC) index used for keyset pagination of the order list."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if the index already exists
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM pg_indexes 
+                WHERE tablename = 'orders' 
+                AND indexname = 'idx_orders_bestel_datum_id'
+            );
+        """)
+        
+        if cursor.fetchone()[0]:
+            logger.info("idx_orders_bestel_datum_id already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Creating idx_orders_bestel_datum_id index...")
+        cursor.execute("CREATE INDEX idx_orders_bestel_datum_id ON orders (bestel_datum DESC NULLS LAST, id DESC)")
+        logger.info("✅ Created keyset pagination index")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error creating orders keyset index: {e}")
+        return False
+
+def run_order_derived_fields_migration(conn_params):
+    """Add the derived (JSONB) and derived_version columns used to materialize derived order fields."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check which columns already exist
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns 
+            WHERE table_name = 'orders' 
+            AND column_name IN ('derived', 'derived_version');
+        """)
+        existing = {row[0] for row in cursor.fetchall()}
+        
+        if {'derived', 'derived_version'} <= existing:
+            logger.info("derived columns already exist, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        if 'derived' not in existing:
+            logger.info("Adding derived column to orders table...")
+            cursor.execute("ALTER TABLE orders ADD COLUMN derived JSONB")
+        if 'derived_version' not in existing:
+            logger.info("Adding derived_version column to orders table...")
+            cursor.execute("ALTER TABLE orders ADD COLUMN derived_version INTEGER")
+        logger.info("✅ Added derived order field columns")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error adding derived order field columns: {e}")
+        return False
+
+def run_order_lookup_columns_migration(conn_params):
+    """Add the normalized lookup columns (klant_email_norm, primary_product_id, is_upsell) and their indexes."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check which columns already exist
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns 
+            WHERE table_name = 'orders' 
+            AND column_name IN ('klant_email_norm', 'primary_product_id', 'is_upsell');
+        """)
+        existing = {row[0] for row in cursor.fetchall()}
+        
+        if {'klant_email_norm', 'primary_product_id', 'is_upsell'} <= existing:
+            logger.info("order lookup columns already exist, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Adding order lookup columns to orders table...")
+        cursor.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS klant_email_norm VARCHAR")
+        cursor.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS primary_product_id INTEGER")
+        cursor.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS is_upsell BOOLEAN NOT NULL DEFAULT false")
+        
+        logger.info("Backfilling order lookup columns...")
+        cursor.execute("""
+            UPDATE orders SET
+                klant_email_norm = NULLIF(lower(btrim(klant_email)), 'onbekend@example.com'),
+                is_upsell = COALESCE((
+                    SELECT bool_or(p->'pivot'->>'type' = 'upsell')
+                    FROM jsonb_array_elements(
+                        CASE WHEN jsonb_typeof(raw_data->'products') = 'array' THEN raw_data->'products' ELSE '[]'::jsonb END
+                    ) AS p
+                ), false),
+                primary_product_id = (
+                    SELECT (p->>'id')::integer
+                    FROM jsonb_array_elements(
+                        CASE WHEN jsonb_typeof(raw_data->'products') = 'array' THEN raw_data->'products' ELSE '[]'::jsonb END
+                    ) WITH ORDINALITY AS t(p, n)
+                    WHERE p->>'id' ~ '^[0-9]+$'
+                    AND COALESCE(p->'pivot'->>'type', '') <> 'upsell'
+                    ORDER BY (p->>'id' IN ('274588', '289456')) DESC, n
+                    LIMIT 1
+                )
+        """)
+        
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_klant_email_norm_bestel_datum ON orders (klant_email_norm, bestel_datum)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_upsell_bestel_datum ON orders (bestel_datum) WHERE is_upsell")
+        logger.info("✅ Added order lookup columns and indexes")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error adding order lookup columns: {e}")
+        return False
+
+def run_upsell_link_candidates_migration(conn_params):
+    """Create the upsell_link_candidates table used for reviewing UpSell matches."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if upsell_link_candidates table already exists
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'upsell_link_candidates'
+            );
+        """)
+        
+        if cursor.fetchone()[0]:
+            logger.info("upsell_link_candidates table already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Creating upsell_link_candidates table...")
+        cursor.execute("""
+            CREATE TABLE upsell_link_candidates (
+                id SERIAL PRIMARY KEY,
+                upsell_order_id INTEGER NOT NULL REFERENCES orders (order_id) ON DELETE CASCADE,
+                candidate_order_id INTEGER NOT NULL REFERENCES orders (order_id) ON DELETE CASCADE,
+                score DOUBLE PRECISION NOT NULL,
+                components JSONB NOT NULL,
+                computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                CONSTRAINT uix_upsell_link_candidate UNIQUE (upsell_order_id, candidate_order_id)
+            )
+        """)
+        cursor.execute("CREATE INDEX idx_upsell_link_candidates_upsell_score ON upsell_link_candidates (upsell_order_id, score DESC)")
+        cursor.execute("CREATE INDEX idx_upsell_link_candidates_score_id ON upsell_link_candidates (score DESC, id DESC)")
+        cursor.execute("CREATE INDEX idx_upsell_link_candidates_candidate ON upsell_link_candidates (candidate_order_id)")
+        logger.info("✅ Created upsell_link_candidates table")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error creating upsell_link_candidates table: {e}")
+        return False
+
+def run_songtexts_migration(conn_params):
+    """Create the songtexts table and copy existing songtexts out of raw_data."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if songtexts table already exists
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'songtexts'
+            );
+        """)
+        
+        if cursor.fetchone()[0]:
+            logger.info("songtexts table already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Creating songtexts table...")
+        cursor.execute("""
+            CREATE TABLE songtexts (
+                id SERIAL PRIMARY KEY,
+                order_id INTEGER NOT NULL REFERENCES orders (order_id) ON DELETE CASCADE,
+                version INTEGER NOT NULL,
+                songtekst TEXT NOT NULL,
+                author VARCHAR,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                CONSTRAINT uix_songtexts_order_version UNIQUE (order_id, version)
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO songtexts (order_id, version, songtekst, author, created_at)
+            SELECT order_id, 1, raw_data->>'songtekst', 'migratie', now()
+            FROM orders
+            WHERE btrim(COALESCE(raw_data->>'songtekst', '')) <> ''
+        """)
+        logger.info(f"✅ Created songtexts table ({cursor.rowcount} songtexts copied from raw_data)")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error creating songtexts table: {e}")
+        return False
+
+def run_music_tasks_migration(conn_params):
+    """Create the music_tasks table for Suno task tracking."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if music_tasks table already exists
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'music_tasks'
+            );
+        """)
+        
+        if cursor.fetchone()[0]:
+            logger.info("music_tasks table already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Creating music_tasks table...")
+        cursor.execute("""
+            CREATE TABLE music_tasks (
+                id SERIAL PRIMARY KEY,
+                task_id VARCHAR NOT NULL UNIQUE,
+                order_id INTEGER REFERENCES orders (order_id) ON DELETE SET NULL,
+                status VARCHAR DEFAULT 'PENDING' NOT NULL,
+                tracks JSONB,
+                status_history JSONB DEFAULT '[]'::jsonb NOT NULL,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                completed_at TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX idx_music_tasks_order_created
+            ON music_tasks (order_id, created_at DESC)
+        """)
+        logger.info("✅ Created music_tasks table")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error creating music_tasks table: {e}")
+        return False
+
+def run_prompt_cache_migration(conn_params):
+    """Create the prompt_cache table for cached AI results."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if prompt_cache table already exists
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'prompt_cache'
+            );
+        """)
+        
+        if cursor.fetchone()[0]:
+            logger.info("prompt_cache table already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Creating prompt_cache table...")
+        cursor.execute("""
+            CREATE TABLE prompt_cache (
+                key VARCHAR(64) PRIMARY KEY,
+                provider VARCHAR NOT NULL,
+                model VARCHAR,
+                result JSONB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                expires_at TIMESTAMP NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX idx_prompt_cache_expires_at
+            ON prompt_cache (expires_at)
+        """)
+        logger.info("✅ Created prompt_cache table")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error creating prompt_cache table: {e}")
+        return False
+
+def run_order_ingest_requeue_migration(conn_params):
+    """Add the requeue column to order_ingest_queue (webhook received while the job was processing)."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if requeue column already exists
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns 
+            WHERE table_name = 'order_ingest_queue' 
+            AND column_name = 'requeue';
+        """)
+        
+        if cursor.fetchone():
+            logger.info("requeue column already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Adding requeue column to order_ingest_queue table...")
+        cursor.execute("ALTER TABLE order_ingest_queue ADD COLUMN requeue BOOLEAN DEFAULT false NOT NULL")
+        logger.info("✅ Added requeue column")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error adding requeue column: {e}")
+        return False
+
+def run_upsell_link_scores_migration(conn_params):
+    """Create the upsell_link_scores table that marks UpSells the linker has scored."""
+    try:
+        conn = psycopg2.connect(**conn_params)
+        cursor = conn.cursor()
+        
+        # Check if upsell_link_scores table already exists
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'upsell_link_scores'
+            );
+        """)
+        
+        if cursor.fetchone()[0]:
+            logger.info("upsell_link_scores table already exists, skipping migration")
+            cursor.close()
+            conn.close()
+            return True
+        
+        logger.info("Creating upsell_link_scores table...")
+        cursor.execute("""
+            CREATE TABLE upsell_link_scores (
+                upsell_order_id INTEGER PRIMARY KEY REFERENCES orders (order_id) ON DELETE CASCADE,
+                candidate_count INTEGER DEFAULT 0 NOT NULL,
+                scored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+            )
+        """)
+        logger.info("✅ Created upsell_link_scores table")
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error creating upsell_link_scores table: {e}")
+        return False
+
 def run_direct_migrations():
     """Run migrations directly without alembic."""
     start_time = time.time()
@@ -488,6 +968,83 @@ def run_direct_migrations():
         else:
             return False
         
+        # Always run sync_state table creation (it checks if table exists)
+        logger.info("Running sync_state table creation...")
+        if run_sync_state_migration(conn_params):
+            migrations_run.append("sync_state_table")
+        else:
+            return False
+        
+        # Always run order_ingest_queue table creation (it checks if table exists)
+        logger.info("Running order_ingest_queue table creation...")
+        if run_order_ingest_queue_migration(conn_params):
+            migrations_run.append("order_ingest_queue_table")
+        else:
+            return False
+        
+        # Always run orders keyset index creation (it checks if index exists)
+        logger.info("Running orders keyset index creation...")
+        if run_orders_keyset_index_migration(conn_params):
+            migrations_run.append("orders_keyset_index")
+        else:
+            return False
+        
+        # Always run derived order fields migration (it checks if columns exist)
+        logger.info("Running derived order fields migration...")
+        if run_order_derived_fields_migration(conn_params):
+            migrations_run.append("order_derived_fields")
+        else:
+            return False
+        
+        # Always run order lookup columns migration (it checks if columns exist)
+        logger.info("Running order lookup columns migration...")
+        if run_order_lookup_columns_migration(conn_params):
+            migrations_run.append("order_lookup_columns")
+        else:
+            return False
+        
+        # Always run upsell_link_candidates table creation (it checks if table exists)
+        logger.info("Running upsell link candidates migration...")
+        if run_upsell_link_candidates_migration(conn_params):
+            migrations_run.append("upsell_link_candidates")
+        else:
+            return False
+        
+        # Always run songtexts table creation (it checks if table exists)
+        logger.info("Running songtexts migration...")
+        if run_songtexts_migration(conn_params):
+            migrations_run.append("songtexts")
+        else:
+            return False
+        
+        # Always run music_tasks table creation (it checks if table exists)
+        logger.info("Running music_tasks migration...")
+        if run_music_tasks_migration(conn_params):
+            migrations_run.append("music_tasks")
+        else:
+            return False
+        
+        # Always run prompt_cache table creation (it checks if table exists)
+        logger.info("Running prompt_cache migration...")
+        if run_prompt_cache_migration(conn_params):
+            migrations_run.append("prompt_cache")
+        else:
+            return False
+        
+        # Always run order_ingest_queue requeue column migration (it checks if column exists)
+        logger.info("Running order_ingest_queue requeue migration...")
+        if run_order_ingest_requeue_migration(conn_params):
+            migrations_run.append("order_ingest_requeue")
+        else:
+            return False
+        
+        # Always run upsell_link_scores table creation (it checks if table exists)
+        logger.info("Running upsell_link_scores migration...")
+        if run_upsell_link_scores_migration(conn_params):
+            migrations_run.append("upsell_link_scores")
+        else:
+            return False
+        
         # Update to final version
         final_version = "fix_rhyme_pairs_type"
         if migrations_run:
@@ -21,6 +21,9 @@ from app.routers.admin import router as admin_router
 # Importeer database en services
 from app.db.session import get_db, init_db
 from app.services.plugpay_client import fetch_and_store_recent_orders, PlugPayAPIError
+from app.services.order_ingest import order_ingest_worker, ORDER_INGEST_WORKER_ENABLED
+from app.services.suno_client import suno_task_tracker
+from app.services.ai_client import ai_client
 from app.auth.token import get_api_key
 
 app = FastAPI(
@@ -52,6 +55,7 @@ app.add_middleware(
     allow_credentials=True,  # cookies toestaan voor auth
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After"],  # keyset-cursor van de orderlijst
 )
 
 # Health check endpoint voor Render
@@ -71,6 +75,19 @@ async def startup_db_client():
         logging.info("Database succesvol geïnitialiseerd")
     except Exception as e:
         logging.error(f"Fout bij initialiseren van database: {str(e)}")
+    
+    # Start de worker die webhook-orders uit de ingest-queue verwerkt
+    if ORDER_INGEST_WORKER_ENABLED:
+        order_ingest_worker.start()
+    
+    # Gedeelde HTTP-sessie voor de AI providers, zodat de eerste call geen nieuwe pool hoeft op te bouwen
+    await ai_client.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await order_ingest_worker.stop()
+    await suno_task_tracker.stop()
+    await ai_client.close()
 
 # Voeg routers toe
 app.include_router(songs_router, prefix="/api/songs", tags=["songs"])
@@ -82,6 +99,7 @@ app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
 @app.post("/api/admin/fetch-orders", tags=["admin"])
 async def admin_fetch_orders(
     background_tasks: BackgroundTasks,
+    incremental: bool = False,
     db: Session = Depends(get_db),
     api_key: str = Depends(get_api_key)
 ):
@@ -93,7 +111,7 @@ async def admin_fetch_orders(
     """
     try:
         # Voer de taak uit op de achtergrond
-        background_tasks.add_task(fetch_and_store_recent_orders, db)
+        background_tasks.add_task(fetch_and_store_recent_orders, db, incremental=incremental)
         return {"status": "Bestellingen worden op de achtergrond opgehaald en verwerkt"}
     except PlugPayAPIError as e:
         raise HTTPException(status_code=500, detail=str(e))
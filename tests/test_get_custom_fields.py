@@ -92,7 +92,7 @@ class TestGetCustomFields(unittest.TestCase):
         self.assertEqual(result["relatie"], "Tantezegger")
         self.assertEqual(result["beschrijving"], "Voor mijn tantezegger Femm, ze wordt 1 jaar...")
 
-    @patch('requests.get')
+    @patch('app.services.plugpay_client.plugpay_session.get')
     def test_checkout_fallback_custom_fields(self, mock_get):
         """Test dat checkout fallback correct werkt als er geen root- of product-level fields zijn."""
         # Order data zonder custom fields maar met checkout_id
@@ -128,7 +128,7 @@ class TestGetCustomFields(unittest.TestCase):
         
         # Verifieer dat de checkout endpoint correct is aangeroepen
         mock_get.assert_called_once_with(
-            f"https://api.plugandpay.nl/v1/checkouts/c-67890?include=custom_field_inputs",
+            f"https://api.plugandpay.nl/v1/checkouts/c-67890?include=custom_field_inputs,custom_fields",
             headers=mock_headers
         )
         
@@ -139,7 +139,7 @@ class TestGetCustomFields(unittest.TestCase):
         self.assertEqual(result["structuur"], "Couplet-refrein")
         self.assertEqual(result["rijm"], "AA BB")
 
-    @patch('requests.get')
+    @patch('app.services.plugpay_client.plugpay_session.get')
     def test_checkout_fallback_422_error(self, mock_get):
         """Test dat de functie gracefully faalt bij een 422-fout van de checkout endpoint."""
         # Order data zonder custom fields maar met checkout_id
@@ -165,7 +165,7 @@ class TestGetCustomFields(unittest.TestCase):
         
         # Verifieer dat de checkout endpoint correct is aangeroepen
         mock_get.assert_called_once_with(
-            f"https://api.plugandpay.nl/v1/checkouts/c-67890?include=custom_field_inputs",
+            f"https://api.plugandpay.nl/v1/checkouts/c-67890?include=custom_field_inputs,custom_fields",
             headers=mock_headers
         )
         
@@ -69,27 +69,22 @@ class TestRawDataCompleteness(unittest.TestCase):
         }
         mock_get_order_details.return_value = mock_order_details
         
-        # Mock voor Order.create_from_plugpay_data
-        mock_order = MagicMock()
-        mock_order_class = MagicMock()
-        mock_order_class.create_from_plugpay_data.return_value = (mock_order, True)
-        
-        with patch('app.models.order.Order', mock_order_class):
-            # Mock voor de database sessie
+        with patch('app.services.plugpay_client.bulk_upsert_orders') as mock_bulk_upsert:
+            mock_bulk_upsert.return_value = {12345: "created"}
             mock_db = MagicMock()
-            mock_db.query.return_value.filter_by.return_value.first.return_value = None
             
             # Voer de functie uit die we testen
-            fetch_and_store_recent_orders(mock_db)
+            added, skipped = fetch_and_store_recent_orders(mock_db)
             
             # Verifieer dat get_order_details is aangeroepen
             mock_get_order_details.assert_called_once_with(12345)
             
-            # Verifieer dat Order.create_from_plugpay_data is aangeroepen met de volledige order details
-            mock_order_class.create_from_plugpay_data.assert_called_once()
-            args = mock_order_class.create_from_plugpay_data.call_args[0]
+            # Verifieer dat de bulk upsert is aangeroepen met de volledige order details
+            mock_bulk_upsert.assert_called_once()
+            args = mock_bulk_upsert.call_args[0]
             self.assertEqual(args[0], mock_db)  # Eerste argument is db_session
-            self.assertEqual(args[1], mock_order_details)  # Tweede argument is order_data
+            self.assertEqual(args[1], [mock_order_details])  # Tweede argument is de batch payloads
+            self.assertEqual((added, skipped), (1, 0))
             
             # Verifieer dat de order_data de volledige payload bevat
             self.assertIn("custom_field_inputs", mock_order_details)
@@ -127,22 +122,42 @@ class TestRawDataCompleteness(unittest.TestCase):
         }
         mock_get_order_details.return_value = mock_order_details
         
-        # Mock voor een bestaande order in de database
-        mock_existing_order = MagicMock()
-        mock_existing_order.order_id = 12345
-        mock_existing_order.raw_data = {}
-        
-        # Mock voor de database sessie die de bestaande order teruggeeft
-        mock_db = MagicMock()
-        mock_db.query.return_value.filter_by.return_value.first.return_value = mock_existing_order
+        with patch('app.services.plugpay_client.bulk_upsert_orders') as mock_bulk_upsert:
+            # De bestaande order wordt via ON CONFLICT bijgewerkt
+            mock_bulk_upsert.return_value = {12345: "updated"}
+            mock_db = MagicMock()
+            
+            # Voer de functie uit die we testen
+            added, skipped = fetch_and_store_recent_orders(mock_db)
+            
+            # Verifieer dat de volledige payload wordt aangeboden voor raw_data
+            self.assertEqual(mock_bulk_upsert.call_args[0][1], [mock_order_details])
+            self.assertEqual((added, skipped), (0, 0))
+
+    @patch('app.services.plugpay_client.get_recent_orders')
+    @patch('app.services.plugpay_client.get_order_details')
+    def test_fetch_and_store_fetches_all_details_concurrently(self, mock_get_order_details, mock_get_recent_orders):
+        """Test dat de details van alle bestellingen via de thread-pool worden opgehaald en opgeslagen."""
+        mock_get_recent_orders.return_value = {
+            "data": [{"id": order_id} for order_id in range(1, 11)] + [{"customer": {}}]
+        }
+        mock_get_order_details.side_effect = lambda order_id: {"id": order_id, "products": []}
         
-        # Voer de functie uit die we testen
-        fetch_and_store_recent_orders(mock_db)
+        with patch('app.services.plugpay_client.bulk_upsert_orders') as mock_bulk_upsert:
+            mock_bulk_upsert.side_effect = lambda db, batch: {payload["id"]: "updated" for payload in batch}
+            mock_db = MagicMock()
+            
+            added, skipped = fetch_and_store_recent_orders(mock_db, max_workers=4)
         
-        # Verifieer dat de bestaande order is bijgewerkt met de volledige raw_data
-        self.assertEqual(mock_existing_order.raw_data, mock_order_details)
-        mock_db.commit.assert_called_once()
-
+        # Elke bestelling met een ID is precies één keer opgehaald
+        fetched_ids = sorted(call.args[0] for call in mock_get_order_details.call_args_list)
+        self.assertEqual(fetched_ids, list(range(1, 11)))
+        # De bestelling zonder ID is overgeslagen, de rest is bijgewerkt
+        self.assertEqual((added, skipped), (0, 1))
+        # Alle bestellingen zijn in één batch opgeslagen (één statement en commit)
+        mock_bulk_upsert.assert_called_once()
+        stored_ids = sorted(payload["id"] for payload in mock_bulk_upsert.call_args[0][1])
+        self.assertEqual(stored_ids, list(range(1, 11)))
 
 if __name__ == '__main__':
     unittest.main()